@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends
 from typing import Dict, List
 from modules.databaseman import DatabaseManager
 from core.database import get_db_manager
+from core.llm_service import get_llm_governor
+from modules.llm_fetcher import LLMGovernor
 from api.v1.management_routes import router as management_router
 
 router = APIRouter(prefix="/api/v1", tags=["api-v1"])
@@ -20,6 +22,42 @@ async def api_status():
         "message": "API v1 is running"
     }
 
+@router.get("/metrics/llm")
+async def llm_metrics(governor: LLMGovernor = Depends(get_llm_governor)) -> Dict:
+    """
+    当前worker的LLM调用指标：排队深度、进行中的请求数、等待时间与重试次数
+    
+    Args:
+        governor (LLMGovernor): LLM并发与速率控制器
+        
+    Returns:
+        Dict: 指标快照
+    """
+    return {
+        "success": True,
+        "data": governor.snapshot()
+    }
+
+@router.get("/metrics/db")
+async def db_metrics(db: DatabaseManager = Depends(get_db_manager)) -> Dict:
+    """
+    当前worker的数据库连接池指标：借出与空闲连接数、获取连接的等待时间直方图、
+    各调用位置的持有时长、疑似泄漏的连接，以及命名查询的调用统计
+    
+    Args:
+        db (DatabaseManager): 数据库管理器实例
+        
+    Returns:
+        Dict: 指标快照
+    """
+    return {
+        "success": True,
+        "data": {
+            "pool": db.pool_snapshot(),
+            "queries": db.queries.stats()
+        }
+    }
+
 @router.get("/users")
 async def list_users(db: DatabaseManager = Depends(get_db_manager)) -> Dict:
     """
@@ -32,9 +70,11 @@ async def list_users(db: DatabaseManager = Depends(get_db_manager)) -> Dict:
         Dict: 用户列表
     """
     try:
-        print("Fetching...")
         conn = await db.get_connection(5.0)
-        rows = await conn.fetch("SELECT id, email, full_name FROM users")
+        try:
+            rows = await conn.fetch("SELECT id, email, full_name FROM users")
+        finally:
+            await db.release_connection(conn)
         users = [dict(row) for row in rows]
         return {
             "success": True,
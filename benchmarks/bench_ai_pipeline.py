@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AI任务分解流水线基准测试（录制/重放磁带）。
+- 流水线：`AITaskService._generate_decomposition`（流式拉取LLM输出并提取JSON）
+    -> `TaskService.create_task_by_json`（单条`unnest`写入整棵任务树）。
+- LLM由`LLMCassette`在本地重放，不访问网络：默认先从`scripts/mock_llm_server.py`录制一次；
+    也可以用`--cassette`指定线上录制的磁带（需与当前提示词一致），按原始延迟分布复现。
+- 数据库由内存中的假连接模拟，每次查询固定增加一次往返延迟。
+- 分阶段统计每条流水线的LLM时间、JSON解析时间与写入时间；`--speed 0`时不等待，测的是纯CPU开销。
+
+使用：
+```
+python benchmarks/bench_ai_pipeline.py --runs 50 --concurrency 10 --speed 0
+python benchmarks/bench_ai_pipeline.py --cassette cassettes/prod.jsonl --speed 1
+```
+"""
+
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from modules.databaseman import QueryRegistry
+from modules.llm_fetcher import LLMCassette, LLMFetcher
+from services.ai_task_service import AITaskService
+from services.task_service import TaskService
+from scripts.mock_llm_server import MockLLMConfig, create_app
+
+
+GOAL: str = "准备一次社团活动"
+
+
+class FakeTransaction:
+    async def __aenter__(self) -> "FakeTransaction":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+
+class FakeConnection:
+    """
+    模拟asyncpg连接，只支持任务树批量写入用到的查询。
+    """
+    def __init__(self, rtt: float):
+        self.rtt: float = rtt
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction()
+
+    async def fetch(self, query: str, *args: Any) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.rtt)
+        project_id, workspace_id, creator_id, ids, parents, titles, descriptions, priorities, minutes = args
+        now: datetime = datetime.now(timezone.utc)
+        return [
+            {
+                "id": uuid.UUID(ids[i]), "project_id": uuid.UUID(project_id),
+                "workspace_id": uuid.UUID(workspace_id), "creator_id": uuid.UUID(creator_id),
+                "assignee_id": None, "parent_task_id": uuid.UUID(parents[i]) if parents[i] else None,
+                "title": titles[i], "description": descriptions[i], "status": "backlog",
+                "priority": priorities[i], "estimated_minutes": minutes[i],
+                "due_at": None, "created_at": now, "updated_at": now,
+            }
+            for i in range(len(ids))
+        ]
+
+
+class FakeDatabaseManager:
+    def __init__(self, rtt: float):
+        self.rtt: float = rtt
+        self.queries: QueryRegistry = QueryRegistry()
+
+    async def get_connection(
+        self, timeout: float = 5.0, readonly: bool = False, pin_key: Optional[str] = None
+    ) -> FakeConnection:
+        return FakeConnection(self.rtt)
+
+    async def release_connection(self, connection: FakeConnection) -> None:
+        return None
+
+
+def build_service(cassette: LLMCassette, transport: Optional[httpx.AsyncBaseTransport], rtt: float) -> AITaskService:
+    fetcher = LLMFetcher(
+        "http://llm.bench/v1", "sk-bench", "mock-reasoner",
+        http_client=httpx.AsyncClient(transport=cassette.transport(transport), timeout=None)
+    )
+    return AITaskService(FakeDatabaseManager(rtt), fetcher)    # type: ignore[arg-type]
+
+
+async def record(path: str, tps: float, ttft: float, reasoning_tokens: int) -> None:
+    """从本地模拟平台录制一次分解请求。"""
+    upstream = httpx.ASGITransport(app=create_app(MockLLMConfig(
+        tps=tps, ttft=ttft, reasoning_tokens=reasoning_tokens, seed=7
+    )))
+    cassette = LLMCassette(path, mode="record")
+    await build_service(cassette, upstream, 0.0)._generate_decomposition(GOAL)
+    print(f"recorded {cassette.recorded} interaction(s) to {path}")
+
+
+async def one_pipeline(ai: AITaskService, tasks: TaskService) -> Dict[str, float]:
+    start: float = time.perf_counter()
+    full_text, json_text, _ = await ai._generate_decomposition(GOAL)
+    llm_done: float = time.perf_counter()
+    # 与create_task_by_json内部相同的解析步骤单独计时
+    json.loads(tasks._normalize_json_message(full_text) or "")
+    parsed: float = time.perf_counter()
+    await tasks.create_task_by_json(
+        str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4()), json_text
+    )
+    done: float = time.perf_counter()
+    return {
+        "llm_ms": (llm_done - start) * 1000,
+        "parse_ms": (parsed - llm_done) * 1000,
+        "insert_ms": (done - parsed) * 1000,
+        "total_ms": (done - start) * 1000,
+    }
+
+
+async def replay(path: str, runs: int, concurrency: int, speed: float, rtt: float) -> None:
+    cassette = LLMCassette(path, mode="replay", speed=speed)
+    ai: AITaskService = build_service(cassette, None, rtt)
+    tasks = TaskService(FakeDatabaseManager(rtt))    # type: ignore[arg-type]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def guarded() -> Dict[str, float]:
+        async with sem:
+            return await one_pipeline(ai, tasks)
+
+    cpu: float = time.process_time()
+    wall: float = time.perf_counter()
+    results = await asyncio.gather(*(guarded() for _ in range(runs)))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    print(f"runs={runs} concurrency={concurrency} speed={speed} db_rtt={rtt * 1000:.1f}ms cassette={path}")
+    print(f"{'stage':<10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for stage in ("llm_ms", "parse_ms", "insert_ms", "total_ms"):
+        values: List[float] = sorted(r[stage] for r in results)
+        p95: float = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{stage[:-3]:<10} {statistics.median(values):>10.2f} {p95:>10.2f} {values[-1]:>10.2f}")
+    print(f"throughput {runs / wall:.1f} pipelines/s, cpu {cpu * 1000 / runs:.2f} ms/pipeline, "
+          f"cassette hits {cassette.hits}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI任务分解流水线基准测试（录制/重放）")
+    parser.add_argument("--cassette", default=None, help="磁带路径；不指定时先从模拟平台录制到临时文件")
+    parser.add_argument("--runs", type=int, default=50, help="流水线执行次数")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--speed", type=float, default=0.0, help="重放加速倍数，0为不等待")
+    parser.add_argument("--rtt-ms", type=float, default=0.3, help="模拟的数据库往返延迟")
+    parser.add_argument("--tps", type=float, default=200.0, help="录制时模拟平台的token速率")
+    parser.add_argument("--ttft", type=float, default=0.5, help="录制时模拟平台的首token延迟")
+    parser.add_argument("--reasoning-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    async def run() -> None:
+        path: str = args.cassette or os.path.join(tempfile.mkdtemp(), "bench_ai_pipeline.jsonl")
+        if not os.path.exists(path):
+            await record(path, args.tps, args.ttft, args.reasoning_tokens)
+        await replay(path, args.runs, args.concurrency, args.speed, args.rtt_ms / 1000)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
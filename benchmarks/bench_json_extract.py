@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+JSON块提取器微基准测试。
+- 对比旧的"每个左大括号 × 每个右大括号 × json.loads"提取方式与新的单次扫描提取器。
+- 输入为若干种针对旧算法构造的LLM输出：大量成对大括号的推理文本、大量未闭合的左大括号等。
+
+使用：
+```
+python benchmarks/bench_json_extract.py
+```
+"""
+
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+from modules.json_extractor import JSONBlockExtractor, extract_json_block
+
+
+def legacy_extract(text: str) -> Optional[str]:
+    """旧版`AITaskService._extract_json_block`的实现，仅用于对比。"""
+    begin = "<<<JSON_BEGIN>>>"
+    end = "<<<JSON_END>>>"
+    b = text.find(begin)
+    if b != -1:
+        e = text.find(end, b + len(begin))
+        if e != -1:
+            candidate = text[b + len(begin): e].strip()
+            if candidate:
+                return candidate
+    content = text.strip()
+    if "{" not in content or "}" not in content:
+        return None
+    opens: List[int] = [i for i, ch in enumerate(content) if ch == "{"]
+    closes: List[int] = [i for i, ch in enumerate(content) if ch == "}"]
+    for start in opens:
+        for end_idx in reversed(closes):
+            if end_idx <= start:
+                continue
+            candidate = content[start:end_idx + 1].strip()
+            try:
+                json.loads(candidate)
+                return candidate
+            except Exception:
+                continue
+    return None
+
+
+def decomposition_json(subtasks: int) -> str:
+    return json.dumps({
+        "main_goal": "准备动漫社女仆祭",
+        "tasks": [{
+            "title": "主任务", "description": "说明 {含大括号} 与 \"引号\"", "estimated_time": 2,
+            "estimated_time_unit": "hour", "priority": "high",
+            "subtasks": [
+                {"title": f"子任务{i}", "description": "步骤 {x}", "estimated_time": 30,
+                 "estimated_time_unit": "minute", "priority": "medium", "subtasks": []}
+                for i in range(subtasks)
+            ],
+        }],
+        "summary": "总结",
+    }, ensure_ascii=False)
+
+
+def case_paired_braces(n: int) -> str:
+    """推理文本中有n对大括号（例如集合记号），最后才给出不带标记的JSON。"""
+    reasoning = " ".join(f"设集合 S{i} = {{a, b}}，" for i in range(n))
+    return reasoning + "\n最终结果：\n" + decomposition_json(20)
+
+
+def case_unclosed_opens(n: int) -> str:
+    """推理文本中有n个未闭合的左大括号。"""
+    reasoning = " ".join(f"模板占位 {{name{i} 未闭合" for i in range(n))
+    return reasoning + "\n" + decomposition_json(20) + "\n结束"
+
+
+def case_fenced_after_braces(n: int) -> str:
+    """大量大括号之后，用代码块包裹的JSON。"""
+    reasoning = "".join("{ x } " for _ in range(n))
+    return reasoning + "\n```json\n" + decomposition_json(20) + "\n```\n"
+
+
+def case_marked_stream(n: int) -> str:
+    """正常情况：带标记的大JSON。"""
+    return "好的。\n<<<JSON_BEGIN>>>\n" + decomposition_json(n) + "\n<<<JSON_END>>>"
+
+
+def timed(fn: Callable[[], Optional[str]], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(sizes: List[int], legacy_limit: int) -> None:
+    cases: Dict[str, Callable[[int], str]] = {
+        "paired braces": case_paired_braces,
+        "unclosed opens": case_unclosed_opens,
+        "fenced after {}": case_fenced_after_braces,
+        "marked json": case_marked_stream,
+    }
+    print(f"{'case':<16} | {'n':>6} | {'chars':>8} | {'legacy (ms)':>12} | {'new (ms)':>9} | {'chunked (ms)':>12}")
+    print("-" * 78)
+    for name, build in cases.items():
+        for n in sizes:
+            text = build(n)
+            expected = extract_json_block(text)
+            assert expected is not None and json.loads(expected)
+
+            if n <= legacy_limit:
+                legacy_ms = f"{timed(lambda: legacy_extract(text), 1):>12.2f}"
+            else:
+                legacy_ms = f"{'skipped':>12}"
+            new_ms = timed(lambda: extract_json_block(text), 5)
+
+            def chunked() -> Optional[str]:
+                # 模拟流式输入，每块4个字符
+                extractor = JSONBlockExtractor()
+                for i in range(0, len(text), 4):
+                    extractor.feed(text[i:i + 4])
+                return extractor.result()
+
+            chunked_ms = timed(chunked, 1)
+            print(f"{name:<16} | {n:>6} | {len(text):>8} | {legacy_ms} | {new_ms:>9.2f} | {chunked_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON block extractor benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--legacy-limit", type=int, default=100, help="旧算法只在n不超过该值时运行")
+    args = parser.parse_args()
+    run(args.sizes, args.legacy_limit)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流式块合并基准测试。
+- 子进程1：模拟的OpenAI兼容平台，按给定速率逐个输出1~3个字符的增量。
+- 子进程2：被测服务，`/stream/plain`把`LLMFetcher.fetch_stream`的每个增量直接交给`StreamingResponse`，
+    `/stream/coalesced`在两者之间加入`coalesce_chunks`。
+- 主进程：并发发起若干条流式请求，统计被测服务每条流消耗的CPU时间、首字节时间与每条流的写入次数
+    （以客户端读到的块数近似）。
+- 三个进程共用机器的CPU，核数较少时首字节时间会受模拟平台与客户端的影响。
+
+使用：
+```
+python benchmarks/bench_stream_coalesce.py --streams 100 --tokens 200 --tps 20
+```
+"""
+
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+
+DELTAS: List[str] = ["喵", "ab", "的", "cde", "。", "x", "好的", "\n"]
+
+
+def _serve_provider(port: int, tokens: int, tps: float) -> None:
+    """子进程：模拟平台的流式接口。"""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import StreamingResponse
+    from starlette.routing import Route
+
+    async def completions(request):
+        await request.body()
+
+        async def generate():
+            for i in range(tokens):
+                await asyncio.sleep(1.0 / tps)
+                chunk = {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+                    "choices": [{"index": 0, "delta": {"content": DELTAS[i % len(DELTAS)]}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _serve_app(port: int, provider_port: int, coalesce_bytes: int, coalesce_delay: float) -> None:
+    """子进程：被测服务。"""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    from modules.llm_fetcher import LLMFetcher, coalesce_chunks
+
+    fetcher = LLMFetcher(
+        f"http://127.0.0.1:{provider_port}/v1", "sk-bench", "bench",
+        max_connections=1000, max_keepalive_connections=200
+    )
+
+    async def stream(request):
+        chunks = fetcher.fetch_stream("hi")
+        if request.path_params["mode"] == "coalesced":
+            chunks = coalesce_chunks(chunks, coalesce_bytes, coalesce_delay)
+        return StreamingResponse(chunks, media_type="text/plain")
+
+    async def cpu(request):
+        return JSONResponse({"cpu": time.process_time()})
+
+    app = Starlette(routes=[
+        Route("/stream/{mode}", stream, methods=["GET"]),
+        Route("/cpu", cpu, methods=["GET"]),
+    ])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def wait_ready(url: str, timeout: float = 15.0) -> None:
+    deadline: float = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.perf_counter() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def one_stream(client: httpx.AsyncClient, url: str) -> Dict[str, float]:
+    start: float = time.perf_counter()
+    ttfb: float = 0.0
+    reads: int = 0
+    size: int = 0
+    async with client.stream("GET", url) as response:
+        async for data in response.aiter_raw():
+            if reads == 0:
+                ttfb = time.perf_counter() - start
+            reads += 1
+            size += len(data)
+    return {"ttfb": ttfb, "reads": reads, "bytes": size, "total": time.perf_counter() - start}
+
+
+async def run_round(base: str, mode: str, streams: int) -> Dict[str, float]:
+    limits = httpx.Limits(max_connections=streams * 2, max_keepalive_connections=streams * 2)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        cpu_before: float = (await client.get(f"{base}/cpu")).json()["cpu"]
+        wall: float = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(client, f"{base}/stream/{mode}") for _ in range(streams)))
+        wall = time.perf_counter() - wall
+        cpu_after: float = (await client.get(f"{base}/cpu")).json()["cpu"]
+
+    ttfbs: List[float] = sorted(r["ttfb"] for r in results)
+    return {
+        "cpu_ms_per_stream": (cpu_after - cpu_before) * 1000 / streams,
+        "ttfb_p50_ms": ttfbs[len(ttfbs) // 2] * 1000,
+        "ttfb_p95_ms": ttfbs[min(len(ttfbs) - 1, int(len(ttfbs) * 0.95))] * 1000,
+        "writes_per_stream": statistics.mean(r["reads"] for r in results),
+        "bytes_per_stream": statistics.mean(r["bytes"] for r in results),
+        "wall_s": wall,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="流式块合并基准测试")
+    parser.add_argument("--streams", type=int, default=100, help="并发流数量")
+    parser.add_argument("--tokens", type=int, default=200, help="每条流的增量数")
+    parser.add_argument("--tps", type=float, default=20.0, help="模拟平台每条流每秒输出的增量数")
+    parser.add_argument("--coalesce-bytes", type=int, default=512)
+    parser.add_argument("--coalesce-delay", type=float, default=0.05)
+    parser.add_argument("--rounds", type=int, default=2, help="每种模式的轮数，取CPU最少的一轮")
+    parser.add_argument("--provider-port", type=int, default=18081)
+    parser.add_argument("--app-port", type=int, default=18082)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    provider = ctx.Process(target=_serve_provider, args=(args.provider_port, args.tokens, args.tps), daemon=True)
+    app = ctx.Process(
+        target=_serve_app,
+        args=(args.app_port, args.provider_port, args.coalesce_bytes, args.coalesce_delay),
+        daemon=True
+    )
+    provider.start()
+    app.start()
+    base: str = f"http://127.0.0.1:{args.app_port}"
+
+    async def run() -> None:
+        await wait_ready(f"http://127.0.0.1:{args.provider_port}/")
+        await wait_ready(f"{base}/cpu")
+        # 预热：建立到平台的keep-alive连接
+        await run_round(base, "plain", args.streams)
+
+        print(f"streams={args.streams} tokens={args.tokens} tps={args.tps} "
+              f"coalesce={args.coalesce_bytes}B/{args.coalesce_delay * 1000:.0f}ms")
+        print(f"{'mode':<10} {'cpu ms/stream':>14} {'ttfb p50':>10} {'ttfb p95':>10} {'writes/stream':>14} {'wall s':>8}")
+        for mode in ("plain", "coalesced"):
+            best = min(
+                [await run_round(base, mode, args.streams) for _ in range(args.rounds)],
+                key=lambda r: r["cpu_ms_per_stream"]
+            )
+            print(f"{mode:<10} {best['cpu_ms_per_stream']:>14.2f} {best['ttfb_p50_ms']:>9.1f}ms "
+                  f"{best['ttfb_p95_ms']:>9.1f}ms {best['writes_per_stream']:>14.1f} {best['wall_s']:>8.2f}")
+
+    try:
+        asyncio.run(run())
+    finally:
+        app.terminate()
+        provider.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务树加载器基准测试。
+- 对比旧的逐节点递归加载（`_task_tree_getter`）与新的单条递归CTE加载（`get_task_tree`）。
+- 数据库由内存中的假连接模拟，每次查询固定增加一次往返延迟，用于模拟真实网络中的RTT。
+
+使用：
+```
+python benchmarks/bench_task_tree.py --rtt-ms 0.3
+```
+"""
+
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from modules.databaseman import QueryRegistry
+from services.task_service import TaskService
+
+
+def build_rows(node_count: int, fanout: int = 4) -> List[Dict[str, Any]]:
+    """
+    构造一棵由`node_count`个节点组成的完全`fanout`叉树，按广度优先顺序返回全部行。
+    """
+    now: datetime = datetime.now(timezone.utc)
+    project_id: uuid.UUID = uuid.uuid4()
+    workspace_id: uuid.UUID = uuid.uuid4()
+    creator_id: uuid.UUID = uuid.uuid4()
+
+    rows: List[Dict[str, Any]] = []
+    for i in range(node_count):
+        parent: Optional[uuid.UUID] = rows[(i - 1) // fanout]["id"] if i > 0 else None
+        rows.append({
+            "id": uuid.uuid4(), "project_id": project_id, "workspace_id": workspace_id,
+            "creator_id": creator_id, "assignee_id": None, "parent_task_id": parent,
+            "title": f"task-{i}", "description": "", "status": "backlog", "priority": "medium",
+            "estimated_minutes": 30, "actual_minutes": 0, "due_at": None, "started_at": None,
+            "completed_at": None, "is_recurring": False, "recurrence_rule": None,
+            "recurrence_frequency": "none", "recurrence_meta": "{}", "metadata": "{}",
+            "created_at": now, "updated_at": now, "deleted_at": None,
+        })
+    return rows
+
+
+class FakeConnection:
+    """
+    模拟asyncpg连接，只支持任务树加载用到的三种查询。
+    """
+    def __init__(self, rows: List[Dict[str, Any]], rtt: float):
+        self.rtt: float = rtt
+        self.round_trips: int = 0
+        self.by_id: Dict[str, Dict[str, Any]] = {str(r["id"]): r for r in rows}
+        self.children: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            if r["parent_task_id"] is not None:
+                self.children.setdefault(str(r["parent_task_id"]), []).append(r)
+
+    async def _round_trip(self) -> None:
+        self.round_trips += 1
+        await asyncio.sleep(self.rtt)
+
+    async def fetchrow(self, query: str, task_id: Any) -> Optional[Dict[str, Any]]:
+        await self._round_trip()
+        return self.by_id.get(str(task_id))
+
+    async def fetch(self, query: str, *args: Any) -> List[Dict[str, Any]]:
+        await self._round_trip()
+        if "WITH RECURSIVE" in query:
+            root_id, max_depth, limit = args
+            result: List[Dict[str, Any]] = []
+            level: List[Dict[str, Any]] = [self.by_id[str(root_id)]]
+            depth: int = 0
+            while level and len(result) < limit:
+                for r in level:
+                    result.append(dict(r, depth=depth))
+                if depth >= max_depth:
+                    break
+                level = [c for r in level for c in self.children.get(str(r["id"]), [])]
+                depth += 1
+            return result[:limit]
+        return [{"id": c["id"]} for c in self.children.get(str(args[0]), [])]
+
+
+class FakeDatabaseManager:
+    def __init__(self, conn: FakeConnection):
+        self.conn: FakeConnection = conn
+        self.queries: QueryRegistry = QueryRegistry()
+
+    async def get_connection(
+        self, timeout: float = 5.0, readonly: bool = False, pin_key: Optional[str] = None
+    ) -> FakeConnection:
+        return self.conn
+
+    async def release_connection(self, connection: FakeConnection) -> None:
+        return None
+
+
+async def run(sizes: List[int], rtt: float) -> None:
+    print(f"{'nodes':>8} | {'loader':<10} | {'round trips':>11} | {'time (ms)':>10}")
+    print("-" * 50)
+    for size in sizes:
+        rows = build_rows(size)
+        root_id: str = str(rows[0]["id"])
+
+        conn = FakeConnection(rows, rtt)
+        svc = TaskService(FakeDatabaseManager(conn))    # type: ignore[arg-type]
+        start = time.perf_counter()
+        await svc._task_tree_getter(root_id, conn)
+        old_ms = (time.perf_counter() - start) * 1000
+        print(f"{size:>8} | {'recursive':<10} | {conn.round_trips:>11} | {old_ms:>10.2f}")
+
+        conn = FakeConnection(rows, rtt)
+        svc = TaskService(FakeDatabaseManager(conn))    # type: ignore[arg-type]
+        start = time.perf_counter()
+        tree = await svc.get_task_tree(root_id, max_nodes=max(size, 1))
+        new_ms = (time.perf_counter() - start) * 1000
+        assert tree is not None
+        print(f"{size:>8} | {'cte':<10} | {conn.round_trips:>11} | {new_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Task tree loader benchmark")
+    parser.add_argument("--rtt-ms", type=float, default=0.3, help="每次查询模拟的往返延迟（毫秒）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.rtt_ms / 1000))
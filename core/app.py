@@ -39,10 +39,20 @@ async def lifespan(app: FastAPI):
         try:
             from core.database import db_manager
             from core.redis_cache import redis_manager
+            from core.job_runner import job_runner
+
+            # 先等待后台任务结束，它们仍需要数据库连接
+            await job_runner.shutdown(timeout=10.0)
+            print("Background jobs finished.")
             
             # 在关闭前显示活跃连接数
             active_connections = db_manager.get_active_connections_count()
             print(f"Active database connections before shutdown: {active_connections}")
+
+            # 显示本worker内耗时最多的命名查询
+            for name, stats in list(db_manager.queries.stats().items())[:10]:
+                if stats["calls"]:
+                    print(f"Query {name}: {stats}")
             
             # 使用超时机制关闭数据库连接池
             try:
@@ -54,6 +64,10 @@ async def lifespan(app: FastAPI):
             await redis_manager.close_pool()
             print("Redis connections closed successfully.")
 
+            from core.llm_service import close_llm_fetcher
+            await close_llm_fetcher()
+            print("LLM HTTP connections closed successfully.")
+
         except Exception as e:
             print(f"Error during cleanup: {e}")
             pass
@@ -1,9 +1,15 @@
+from typing import AsyncIterator
+
+from fastapi import Depends
+
 from modules.databaseman import DatabaseManager
 from core.config import get_settings
+from core.redis_cache import redis_manager
 
 
 settings = get_settings()
-db_manager: DatabaseManager = DatabaseManager(**settings.database.__dict__)
+# 读写一致性固定保存在Redis中，多个worker进程之间共享
+db_manager: DatabaseManager = DatabaseManager(**settings.database.__dict__, pin_store=redis_manager)
 
 
 def get_db_manager() -> DatabaseManager:
@@ -14,3 +20,12 @@ def get_db_manager() -> DatabaseManager:
         DatabaseManager: 数据库管理器实例
     """
     return db_manager
+
+
+async def use_unit_of_work(db: DatabaseManager = Depends(get_db_manager)) -> AsyncIterator[None]:
+    """
+    请求级工作单元的依赖：同一请求内的服务调用共用一个数据库连接（在第一次查询时获取，响应发送后归还）。
+    - 只用于依次调用多个服务、且不等待LLM的路由，见`DatabaseManager.unit_of_work`。
+    """
+    async with db.unit_of_work():
+        yield
@@ -0,0 +1,19 @@
+from modules.job_runner import JobRunner
+from core.config import get_settings
+
+
+settings = get_settings()
+job_runner: JobRunner = JobRunner(
+    concurrency=settings.ai.job_concurrency,
+    max_pending=settings.ai.job_max_pending
+)
+
+
+def get_job_runner() -> JobRunner:
+    """
+    获取后台任务执行器实例
+    
+    Returns:
+        JobRunner: 后台任务执行器实例
+    """
+    return job_runner
@@ -1,8 +1,23 @@
-from modules.llm_fetcher import LLMFetcher
-from core.config import load_config
+from typing import Optional
+
+from modules.llm_fetcher import LLMFetcher, LLMResponseCache, LLMGovernor, LLMCassette
+from core.config import get_settings
+from core.redis_cache import redis_manager
+
+
+settings = get_settings()
+# 每个worker进程各自持有一个实例（即一个HTTP连接池），首次使用时才创建，避免在fork前创建连接。
+_llm_fetcher: Optional[LLMFetcher] = None
+# 并发与速率控制器同样按worker持有；令牌桶通过Redis在所有worker之间共享。
+llm_governor: LLMGovernor = LLMGovernor(
+    max_concurrency=settings.ai.llm_max_concurrency,
+    redis_manager=redis_manager,
+    rate_per_second=settings.ai.llm_rate_per_second,
+    burst=settings.ai.llm_burst,
+    max_wait=settings.ai.llm_max_wait,
+    max_retries=settings.ai.llm_max_retries
+)
 
-config = load_config()
-llm_config = config.get("llm", {})
 
 def get_llm_fetcher() -> LLMFetcher:
     """
@@ -11,8 +26,46 @@ def get_llm_fetcher() -> LLMFetcher:
     Returns:
         LLMFetcher: LLM获取器实例
     """
-    # 从配置中获取API密钥等信息
-    config = load_config()
-    llm_config = config.get("llm", {})
-    
-    return LLMFetcher(**llm_config)
\ No newline at end of file
+    global _llm_fetcher
+    if _llm_fetcher is None:
+        # 回答缓存只由配置开启；开启后各调用点仍需显式传入use_cache=True。
+        response_cache: Optional[LLMResponseCache] = None
+        if settings.ai.llm_cache_ttl > 0:
+            response_cache = LLMResponseCache(
+                redis_manager,
+                ttl=settings.ai.llm_cache_ttl,
+                max_entry_bytes=settings.ai.llm_cache_max_entry_bytes,
+                max_entries=settings.ai.llm_cache_max_entries
+            )
+        # 录制/重放磁带同样只由配置开启
+        cassette: Optional[LLMCassette] = None
+        if settings.ai.llm_cassette_path:
+            cassette = LLMCassette(
+                settings.ai.llm_cassette_path,
+                mode=settings.ai.llm_cassette_mode,
+                speed=settings.ai.llm_cassette_speed
+            )
+        _llm_fetcher = LLMFetcher(
+            **settings.llm.__dict__, response_cache=response_cache, governor=llm_governor, cassette=cassette
+        )
+    return _llm_fetcher
+
+
+def get_llm_governor() -> LLMGovernor:
+    """
+    获取LLM并发与速率控制器的依赖注入函数
+
+    Returns:
+        LLMGovernor: 控制器实例
+    """
+    return llm_governor
+
+
+async def close_llm_fetcher() -> None:
+    """
+    关闭LLM获取器的HTTP连接池，在应用关闭时调用。
+    """
+    global _llm_fetcher
+    if _llm_fetcher is not None:
+        await _llm_fetcher.aclose()
+        _llm_fetcher = None
@@ -0,0 +1,22 @@
+from modules.singleflight import SingleFlight
+from core.config import get_settings
+from core.redis_cache import redis_manager
+
+
+settings = get_settings()
+single_flight: SingleFlight = SingleFlight(
+    redis_manager,
+    lock_ttl=settings.ai.singleflight_lock_ttl,
+    result_ttl=settings.ai.singleflight_result_ttl,
+    wait_timeout=settings.ai.singleflight_lock_ttl
+)
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    获取请求合并器实例
+    
+    Returns:
+        SingleFlight: 请求合并器实例
+    """
+    return single_flight
@@ -8,11 +8,14 @@ from typing import Optional, Any, Dict, List
 from modules.databaseman import DatabaseManager
 from modules.redisman import RedisManager
 from modules.llm_fetcher import LLMFetcher
+from modules.singleflight import SingleFlight
 
 # 对应的调度方法，这些也需要被导出
 from core.database import get_db_manager
 from core.redis_cache import get_redis_manager
-from core.llm_service import get_llm_fetcher
+from core.llm_service import get_llm_fetcher, get_llm_governor
+from core.job_runner import get_job_runner
+from core.singleflight import get_single_flight
 
 # 对应的服务
 from services import (
@@ -24,7 +27,9 @@ from services import (
 
 def get_ai_service(
     db_manager: DatabaseManager = Depends(get_db_manager),
-    llm_fetcher: LLMFetcher = Depends(get_llm_fetcher)
+    llm_fetcher: LLMFetcher = Depends(get_llm_fetcher),
+    redis_manager: RedisManager = Depends(get_redis_manager),
+    single_flight: SingleFlight = Depends(get_single_flight)
 ) -> AITaskService:
     """
     获取AI任务服务实例的依赖注入函数
@@ -32,11 +37,13 @@ def get_ai_service(
     Args:
         db_manager (DatabaseManager): 数据库管理器实例
         llm_fetcher (LLMFetcher): LLM获取器实例
+        redis_manager (RedisManager): Redis管理器实例，用于缓存对话窗口
+        single_flight (SingleFlight): 请求合并器实例
         
     Returns:
         AITaskService: AI任务服务实例
     """
-    return AITaskService(db_manager, llm_fetcher)
+    return AITaskService(db_manager, llm_fetcher, redis_manager, single_flight)
 
 def get_project_service(
         db: DatabaseManager = Depends(get_db_manager)
@@ -63,7 +70,8 @@ def get_workspace_service(
 # 导出符号表
 __all__ = [
     # 调度方法
-    "get_db_manager", "get_llm_fetcher", "get_redis_manager",
+    "get_db_manager", "get_llm_fetcher", "get_redis_manager", "get_job_runner",
+    "get_single_flight", "get_llm_governor",
     # 服务方法
     "get_ai_service", "get_project_service", "get_task_service", "get_user_service",
     "get_workspace_service",
@@ -1,9 +1,15 @@
 from .databaseman import (DatabaseManager, DBTimeoutError)
 from .redisman import (RedisManager)
 from .llm_fetcher import (LLMFetcher)
+from .json_extractor import (JSONBlockExtractor, extract_json_block)
+from .job_runner import (JobRunner, JobQueueFullError)
+from .singleflight import (SingleFlight)
 
 __all__ = [
     "DatabaseManager", "DBTimeoutError",
     "RedisManager",
-    "LLMFetcher"
+    "LLMFetcher",
+    "JSONBlockExtractor", "extract_json_block",
+    "JobRunner", "JobQueueFullError",
+    "SingleFlight"
 ]
\ No newline at end of file
@@ -1,5 +1,12 @@
+from .codecs import (install_codecs)
 from .database_manager import (DatabaseManager, DBTimeoutError)
+from .pool_metrics import (ConnectionLease, PoolMetrics)
+from .query_registry import (NamedQuery, PreparedConnection, QueryRegistry, QueryStats, UnknownQueryError)
+from .unit_of_work import (UnitOfWork, current_unit)
 
 __all__ = [
-    "DatabaseManager", "DBTimeoutError"
-]
\ No newline at end of file
+    "DatabaseManager", "DBTimeoutError", "install_codecs",
+    "ConnectionLease", "PoolMetrics",
+    "NamedQuery", "PreparedConnection", "QueryRegistry", "QueryStats", "UnknownQueryError",
+    "UnitOfWork", "current_unit"
+]
@@ -0,0 +1,113 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Tuple
+
+try:
+    import orjson
+except ImportError:     # 未安装orjson时使用标准库
+    orjson = None
+
+
+# PostgreSQL时间类型的纪元，以及表示正负无穷的微秒数
+_PG_EPOCH_UTC: datetime = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_PG_EPOCH: datetime = datetime(2000, 1, 1)
+_PG_INFINITY: int = 2 ** 63 - 1
+_PG_NEG_INFINITY: int = -2 ** 63
+
+
+if orjson is not None:
+    def _dumps(value: Any) -> str:
+        return orjson.dumps(value, default=str).decode()
+
+    _loads: Callable[[Any], Any] = orjson.loads
+else:
+    def _dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    _loads = json.loads
+
+
+def encode_json(value: Any) -> str:
+    """
+    json/jsonb参数的编码器。
+    - 字符串视为已经序列化好的JSON原样发送，兼容此前传入`json.dumps`结果的写法；
+        需要存储JSON字符串标量时请先自行序列化。
+    """
+    if isinstance(value, str):
+        return value
+    return _dumps(value)
+
+
+def decode_json(value: str) -> Any:
+    return _loads(value)
+
+
+def _to_microseconds(value: Any, epoch: datetime) -> Tuple[int]:
+    """私有函数：把datetime、date或ISO格式的字符串转为相对纪元的微秒数。"""
+    if isinstance(value, str):
+        if value == "infinity":
+            return (_PG_INFINITY,)
+        if value == "-infinity":
+            return (_PG_NEG_INFINITY,)
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime) and isinstance(value, date):
+        value = datetime(value.year, value.month, value.day)
+    if epoch.tzinfo is not None:
+        # 与asyncpg一致，不带时区的时间视为UTC
+        value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+    elif value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    delta: timedelta = value - epoch
+    return ((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds,)
+
+
+def _from_microseconds(value: Tuple[int], epoch: datetime) -> str:
+    """私有函数：与asyncpg解码得到的datetime调用`isoformat()`的结果一致。"""
+    microseconds: int = value[0]
+    if microseconds == _PG_INFINITY:
+        return "infinity"
+    if microseconds == _PG_NEG_INFINITY:
+        return "-infinity"
+    return (epoch + timedelta(microseconds=microseconds)).isoformat()
+
+
+def encode_timestamptz(value: Any) -> Tuple[int]:
+    return _to_microseconds(value, _PG_EPOCH_UTC)
+
+
+def decode_timestamptz(value: Tuple[int]) -> str:
+    return _from_microseconds(value, _PG_EPOCH_UTC)
+
+
+def encode_timestamp(value: Any) -> Tuple[int]:
+    return _to_microseconds(value, _PG_EPOCH)
+
+
+def decode_timestamp(value: Tuple[int]) -> str:
+    return _from_microseconds(value, _PG_EPOCH)
+
+
+async def install_codecs(connection: Any, iso_timestamps: bool = False) -> None:
+    """
+    在连接上安装类型编解码器，通过`asyncpg.create_pool(init=...)`在每条新连接上调用一次。
+    - json/jsonb：直接解码为Python对象（有orjson时使用orjson），参数可以直接传入dict/list。
+    - uuid：以文本格式收发，查询结果直接是`str`；参数可以是`str`或`uuid.UUID`。
+    - `iso_timestamps=True`时，timestamp/timestamptz解码为ISO格式的字符串（timestamptz为UTC），
+        参数可以是datetime或ISO格式的字符串。
+    """
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name, schema="pg_catalog", encoder=encode_json, decoder=decode_json, format="text"
+        )
+    await connection.set_type_codec(
+        "uuid", schema="pg_catalog", encoder=str, decoder=str, format="text"
+    )
+    if iso_timestamps:
+        await connection.set_type_codec(
+            "timestamptz", schema="pg_catalog",
+            encoder=encode_timestamptz, decoder=decode_timestamptz, format="tuple"
+        )
+        await connection.set_type_codec(
+            "timestamp", schema="pg_catalog",
+            encoder=encode_timestamp, decoder=decode_timestamp, format="tuple"
+        )
@@ -1,18 +1,49 @@
 import asyncpg
 import asyncio
+import math
+import time
 from contextlib import asynccontextmanager
-from typing import Optional, Any, Dict
+from dataclasses import dataclass
+from typing import Optional, Any, Dict, List, Sequence, Tuple
+
+from .codecs import install_codecs
+from .pool_metrics import PoolMetrics
+from .query_registry import PreparedConnection, QueryRegistry
+from .unit_of_work import UnitOfWork, _current_unit, current_unit
 
 class DBTimeoutError(TimeoutError):
     """自定义数据库超时异常。"""
     def __init__(self, message: str = "Database operation timed out"):
         super().__init__(message)
 
+# 记录的读写一致性固定数量超过该值时，清理已过期的记录
+_PIN_PRUNE_SIZE: int = 10000
+
+# 共享存储（Redis）中读写一致性固定的键前缀
+PIN_KEY_PREFIX: str = "db:pin:"
+
+
+@dataclass
+class _Replica:
+    """私有类：一个只读副本及其连接池。"""
+    host: str
+    port: int
+    pool: Any = None
+    # 获取连接出错后，在该时间（time.monotonic）之前不再使用
+    down_until: float = 0.0
+    reads: int = 0
+    errors: int = 0
+
+
 class DatabaseManager:
     """
     数据库管理器。
     - 在本管理器内，所有函数均为**异步调用**——为尽可能不阻塞IO。
     - 异步编程需要使用asyncio库。
+    - 配置了只读副本时，`get_connection(readonly=True)`轮流从副本获取连接：
+        副本不可用时回退到主库；同一`pin_key`刚写入过的一小段时间内也使用主库，以便读到自己的写入
+        （提供`pin_store`时对所有worker进程生效）。
+    - 在`unit_of_work()`内，嵌套的服务调用共用一个连接（可选共用一个事务），见`UnitOfWork`。
     """
     def __init__(
         self,
@@ -22,7 +53,16 @@ class DatabaseManager:
         db_database_name: str,
         db_port: int,
         minconn: int = 1,
-        maxconn: int = 20
+        maxconn: int = 20,
+        prepare_statements: bool = True,
+        leak_threshold: float = 30.0,
+        leak_check_interval: float = 5.0,
+        leak_stacks: bool = False,
+        replica_hosts: Sequence[str] = (),
+        read_your_writes_window: float = 2.0,
+        replica_retry_interval: float = 10.0,
+        iso_timestamps: bool = False,
+        pin_store: Optional[Any] = None
     ):
         """
         初始化类。
@@ -35,6 +75,19 @@ class DatabaseManager:
             db_port (int): 数据库对外端口。
             minconn (int): 连接池最小连接数量。
             maxconn (int): 连接池最大连接数量。
+            prepare_statements (bool): 是否在每条连接上预编译命名查询（见`QueryRegistry`）。
+                经过PgBouncer等事务级连接池代理时设为False，此时同时关闭asyncpg自身的语句缓存。
+            leak_threshold (float): 连接持有超过该秒数时打印借出时的调用栈，为0时不检查。
+            leak_check_interval (float): 泄漏检查的间隔（秒）。
+            leak_stacks (bool): 每次借出连接时记录完整的调用栈，泄漏报告中附带；有额外开销，只在排查时开启。
+            replica_hosts (Sequence[str]): 只读副本地址，格式为`host`或`host:port`（省略时使用`db_port`），
+                使用与主库相同的用户名、密码与数据库名。
+            read_your_writes_window (float): 写入后该秒数内，同一`pin_key`的只读查询仍使用主库。
+            replica_retry_interval (float): 副本获取连接出错后，暂停使用该副本的秒数。
+            iso_timestamps (bool): 是否把timestamp/timestamptz直接解码为ISO格式的字符串（见`install_codecs`）。
+                json/jsonb与uuid的编解码器总是安装。
+            pin_store (Optional[RedisManager]): 在各worker进程间共享读写一致性固定的存储，
+                需要提供`set(key, value, expire)`与`exists(key)`；为None时固定只在当前进程内有效。
         """
         self.db_url: str = db_url
         self.db_username = db_username
@@ -44,9 +97,57 @@ class DatabaseManager:
         self.minconn: int = minconn
         self.maxconn: int = maxconn
 
+        self.prepare_statements: bool = prepare_statements
+        # 为True时查询结果中的UUID与时间均已是字符串，服务层无需再逐字段转换
+        self.iso_timestamps: bool = iso_timestamps
+        # 命名查询注册表：服务层按名称执行常用查询，并统计调用次数与耗时
+        self.queries: QueryRegistry = QueryRegistry(prepare=prepare_statements)
+
         self.connection_pool: Optional[asyncpg.pool.Pool] = None
-        # 添加活跃连接计数器
-        self._active_connections = 0
+        # 连接池指标：等待时间、借出中的连接、各调用位置的持有时长与泄漏检测
+        self.leak_stacks: bool = leak_stacks
+        self.metrics: PoolMetrics = PoolMetrics(capture_stacks=leak_stacks)
+        self.leak_threshold: float = leak_threshold
+        self.leak_check_interval: float = leak_check_interval
+        self._leak_watcher: Optional[asyncio.Task] = None
+
+        # 只读副本，以及借出连接的来源（副本）与写入后需要固定到主库的键
+        self.replicas: List[_Replica] = [self._parse_replica(host) for host in replica_hosts]
+        self.read_your_writes_window: float = read_your_writes_window
+        self.replica_retry_interval: float = replica_retry_interval
+        self._next_replica: int = 0
+        self._leased: Dict[int, Tuple[Optional[_Replica], Optional[str]]] = {}
+        self._pins: Dict[str, float] = {}
+        self.pin_store: Optional[Any] = pin_store
+
+    def _parse_replica(self, address: str) -> _Replica:
+        """私有函数：解析`host`或`host:port`形式的副本地址。"""
+        host, _, port = address.strip().rpartition(":")
+        if not host or not port.isdigit():
+            return _Replica(address.strip(), self.db_port)
+        return _Replica(host, int(port))
+
+    def _pool_options(self) -> Dict[str, Any]:
+        """私有函数：主库与副本连接池共用的参数。"""
+        if self.prepare_statements:
+            statement_options: Dict[str, Any] = {"connection_class": PreparedConnection}
+        else:
+            # 事务级连接池代理之后不能使用命名的预编译语句
+            statement_options = {"statement_cache_size": 0}
+        return {
+            "user": self.db_username,
+            "password": self.db_password,
+            "database": self.db_database_name,
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "timeout": 10,
+            "init": self._init_connection,
+            **statement_options
+        }
+
+    async def _init_connection(self, connection: asyncpg.Connection) -> None:
+        """私有函数：连接池中的每条新连接建立时安装类型编解码器。"""
+        await install_codecs(connection, self.iso_timestamps)
 
     async def init_pool(self) -> None:
         """
@@ -55,34 +156,92 @@ class DatabaseManager:
         print(f"Connection details - Host: {self.db_url}, Port: {self.db_port}, DB: {self.db_database_name}")
         try:
             self.connection_pool = await asyncpg.create_pool(
-                user=self.db_username,
-                password=self.db_password,
-                database=self.db_database_name,
                 host=self.db_url,
-                min_size=self.minconn,
-                max_size=self.maxconn,
                 port=self.db_port,
-                timeout=10
+                **self._pool_options()
             )
-            self._active_connections = 0
-            pass
         except Exception as e:
             raise ConnectionError(f"Failed to initialize asyncpg pool: {str(e)}")
+        self.metrics = PoolMetrics(capture_stacks=self.leak_stacks)
+        # 副本无法连接时不影响启动，只读查询回退到主库
+        for replica in self.replicas:
+            try:
+                replica.pool = await asyncpg.create_pool(
+                    host=replica.host,
+                    port=replica.port,
+                    **self._pool_options()
+                )
+            except Exception as e:
+                replica.pool = None
+                print(f"WARNING: Failed to connect to replica {replica.host}:{replica.port}, "
+                      f"reads will use the primary: {str(e)}")
+        if self.leak_threshold > 0 and self._leak_watcher is None:
+            self._leak_watcher = asyncio.get_running_loop().create_task(self._watch_leaks())
+
+    async def _watch_leaks(self) -> None:
+        """私有函数：定期检查持有过久的连接。"""
+        while True:
+            await asyncio.sleep(self.leak_check_interval)
+            self.metrics.find_leaks(self.leak_threshold)
 
-    async def get_connection(self, timeout: float = 5.0) -> asyncpg.Connection:
+    async def get_connection(
+        self,
+        timeout: float = 5.0,
+        readonly: bool = False,
+        pin_key: Optional[str] = None
+    ) -> asyncpg.Connection:
         """
         从连接池获取一个连接。
         - 在获取连接并使用完毕后，必须使用本实例内的`release_connection`函数释放连接。
             否则会造成连接泄漏（类似内存泄漏）。
+        - `readonly=True`时可能返回只读副本的连接，只能用于查询，且可能落后主库少许时间。
+        - `pin_key`通常为用户ID或工作空间ID：只读连接在该键最近写入过时使用主库；
+            写连接（`readonly=False`）释放时把该键固定到主库`read_your_writes_window`秒。
+        - 处于`unit_of_work()`内时返回工作单元共用的主库连接，`release_connection`只将其归还给工作单元；
+            只读连接仅在单元开启了事务或已经写入（持有连接）时共用，否则按普通方式获取，仍可使用只读副本。
         
         注意：请在try块内使用，如果等待超时，该块会抛出`TimeoutError`。
 
         Args:
             timeout (float): 超时等待时长（秒）
+            readonly (bool): 是否只用于读取。
+            pin_key (Optional[str]): 读写一致性的键。
         
         Returns:
             (asyncpg.Connection): 连接对象
         """
+        unit: Optional[UnitOfWork] = current_unit(self)
+        if unit is not None and (not readonly or unit.transaction or unit.connection is not None):
+            try:
+                shared: Optional[asyncpg.Connection] = await unit.borrow(timeout)
+            except DBTimeoutError:
+                raise
+            except asyncio.TimeoutError:
+                raise DBTimeoutError(f"Timeout for {timeout} seconds waiting for the unit of work connection.")
+            if shared is not None:
+                if not readonly and pin_key is not None:
+                    unit.pin_keys.append(pin_key)
+                return shared
+
+        if readonly and self.replicas and not (pin_key is not None and await self._is_pinned(pin_key)):
+            replica: Optional[_Replica] = self._choose_replica()
+            if replica is not None:
+                start: float = time.perf_counter()
+                replica_conn: Optional[asyncpg.Connection] = await self._acquire_replica(replica, timeout / 2)
+                if replica_conn is not None:
+                    return replica_conn
+                # 回退到主库时只等待剩余的时间
+                timeout = max(timeout - (time.perf_counter() - start), timeout / 2)
+
+        connection: asyncpg.Connection = await self._acquire_primary(timeout)
+        if not readonly and pin_key is not None:
+            self._leased[id(connection)] = (None, pin_key)
+        return connection
+
+    async def _acquire_primary(self, timeout: float) -> asyncpg.Connection:
+        """私有函数：从主库连接池获取连接。"""
+        start: float = time.perf_counter()
+        self.metrics.waiting += 1
         try:
             if self.connection_pool is None:
                 raise ConnectionError(
@@ -90,12 +249,100 @@ class DatabaseManager:
                     "Use init_pool() before get connection."
                 )
             connection = await self.connection_pool.acquire(timeout=timeout)
-            self._active_connections += 1
+            self.metrics.record_wait(time.perf_counter() - start)
+            self.metrics.on_acquired(connection)
             return connection
         except asyncio.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, "timeout")
             raise DBTimeoutError(f"Timeout for {timeout} seconds without free connection.")
         except Exception as e:
+            self.metrics.record_wait(time.perf_counter() - start, "error")
             raise EOFError(f"A Special error here: {e!r}") from e
+        finally:
+            self.metrics.waiting -= 1
+
+    async def _acquire_replica(self, replica: _Replica, timeout: float) -> Optional[asyncpg.Connection]:
+        """
+        私有函数：从副本获取连接，失败时返回None，由调用方回退到主库。
+        - 副本连接池已满而等待超时时只回退本次；连接出错时在`replica_retry_interval`秒内不再使用该副本。
+        """
+        start: float = time.perf_counter()
+        self.metrics.waiting += 1
+        try:
+            connection = await replica.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, "timeout")
+            return None
+        except Exception as e:
+            self.metrics.record_wait(time.perf_counter() - start, "error")
+            replica.errors += 1
+            replica.down_until = time.monotonic() + self.replica_retry_interval
+            print(f"WARNING: Replica {replica.host}:{replica.port} unavailable, "
+                  f"falling back to the primary: {e!r}")
+            return None
+        finally:
+            self.metrics.waiting -= 1
+        self.metrics.record_wait(time.perf_counter() - start)
+        self.metrics.on_acquired(connection)
+        replica.reads += 1
+        self._leased[id(connection)] = (replica, None)
+        return connection
+
+    def _choose_replica(self) -> Optional[_Replica]:
+        """私有函数：轮流选择一个可用的副本；没有可用副本时返回None。"""
+        if not self.replicas:
+            return None
+        now: float = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica: _Replica = self.replicas[self._next_replica % len(self.replicas)]
+            self._next_replica += 1
+            if replica.pool is not None and replica.down_until <= now:
+                return replica
+        return None
+
+    async def pin_to_primary(self, *keys: Any) -> None:
+        """
+        在`read_your_writes_window`秒内，让这些键的只读查询使用主库。
+        - 写入时无法提前确定键（例如按ID更新后才知道所属工作空间）时，在写入后调用。
+        - 提供了`pin_store`时同时写入共享存储（`SET key EX`），其他worker进程的只读查询同样使用主库；
+            否则固定只在当前worker进程内有效。
+        """
+        if not self.replicas or self.read_your_writes_window <= 0:
+            return
+        now: float = time.monotonic()
+        if len(self._pins) > _PIN_PRUNE_SIZE:
+            self._pins = {key: until for key, until in self._pins.items() if until > now}
+        pinned: List[str] = [str(key) for key in keys if key is not None]
+        for key in pinned:
+            self._pins[key] = now + self.read_your_writes_window
+        if self.pin_store is None or not pinned:
+            return
+        # Redis的过期时间以秒为单位，向上取整，宁可多读一会儿主库
+        expire: int = max(1, math.ceil(self.read_your_writes_window))
+        try:
+            await asyncio.gather(*(
+                self.pin_store.set(PIN_KEY_PREFIX + key, 1, expire=expire) for key in pinned
+            ))
+        except Exception as e:
+            print(f"WARNING: Failed to share read-your-writes pins, other workers may read replicas: {e!r}")
+
+    async def _is_pinned(self, key: str) -> bool:
+        """
+        私有函数：该键是否仍在写入后的固定时间内。
+        - 先查当前进程内的记录，未命中且提供了`pin_store`时再查共享存储（其他worker的写入）。
+        """
+        until: Optional[float] = self._pins.get(key)
+        if until is not None:
+            if until > time.monotonic():
+                return True
+            del self._pins[key]
+        if self.pin_store is None:
+            return False
+        try:
+            return await self.pin_store.exists(PIN_KEY_PREFIX + key) > 0
+        except Exception:
+            # 无法确认时读主库
+            return True
 
     async def release_connection(self, connection: asyncpg.Connection) -> None:
         """
@@ -104,17 +351,33 @@ class DatabaseManager:
         Args:
             connection (asyncpg.Connection): 连接对象
         """
+        unit: Optional[UnitOfWork] = current_unit(self)
+        if unit is not None and unit.owns(connection):
+            unit.give_back()
+            return
+        self.metrics.on_released(connection)
+        replica, pin_key = self._leased.pop(id(connection), (None, None))
+        if pin_key is not None:
+            await self.pin_to_primary(pin_key)
+        if replica is not None:
+            if replica.pool is not None:
+                await replica.pool.release(connection)
+            return
         if self.connection_pool is not None:
             await self.connection_pool.release(connection)
-            self._active_connections -= 1
 
     async def close_all_connections(self) -> None:
         """
         关闭连接池。
         """
+        if self._leak_watcher is not None:
+            self._leak_watcher.cancel()
+            self._leak_watcher = None
         if self.connection_pool is not None:
-            # 显示当前活跃连接数
-            print(f"WARNING: There are {self._active_connections} active connections that may not be released!")
+            # 显示当前活跃连接数及其借出位置
+            if self.metrics.in_use:
+                print(f"WARNING: There are {self.metrics.in_use} active connections that may not be released!")
+                self.metrics.find_leaks(0.0)
             
             try:
                 # 使用 asyncio.wait_for 设置超时
@@ -124,25 +387,68 @@ class DatabaseManager:
                 # 如果超时，我们仍然将连接池设为None
             finally:
                 self.connection_pool = None
-                self._active_connections = 0
+        for replica in self.replicas:
+            if replica.pool is None:
+                continue
+            try:
+                await asyncio.wait_for(replica.pool.close(), timeout=30.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                replica.pool = None
+        self._leased.clear()
+        self._pins.clear()
     
     @asynccontextmanager
-    async def acquire(self):
+    async def acquire(self, readonly: bool = False, pin_key: Optional[str] = None):
         """
-        连接管理器。
+        连接管理器，参数见`get_connection`。
         - **请在async with上下文中使用，例：**
         ```
         db = DatabaseManager()
         async with db.acquire() as conn:
             conn.somefunction()
+        async with db.acquire(readonly=True, pin_key=user_id) as conn:
+            conn.somefunction()
         ```
         """
-        conn = await self.get_connection()
+        conn = await self.get_connection(readonly=readonly, pin_key=pin_key)
         try:
             yield conn
         finally:
             await self.release_connection(conn)
 
+    @asynccontextmanager
+    async def unit_of_work(self, transaction: bool = False):
+        """
+        工作单元：范围内经由本管理器获取的连接共用同一个主库连接，连接在第一次使用时才获取。
+        - 嵌套使用时加入外层的工作单元；外层未开启事务而内层需要事务时，内层使用新的连接与事务。
+        - 不要在范围内等待LLM等耗时的外部调用，否则共用连接会一直被占用。
+        ```
+        async with db.unit_of_work(transaction=True):
+            await project_service.create_project(...)
+            await task_service.create_task(...)
+        ```
+
+        Args:
+            transaction (bool): 是否在共用连接上开启事务，正常结束时提交，出现异常时回滚。
+        """
+        outer: Optional[UnitOfWork] = current_unit(self)
+        if outer is not None and (outer.transaction or not transaction):
+            yield outer
+            return
+        unit: UnitOfWork = UnitOfWork(self, transaction)
+        token = _current_unit.set(unit)
+        failed: bool = False
+        try:
+            yield unit
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_unit.reset(token)
+            await unit.close(failed)
+
     def get_active_connections_count(self) -> int:
         """
         获取当前活跃连接数。
@@ -150,7 +456,26 @@ class DatabaseManager:
         Returns:
             int: 当前活跃连接数
         """
-        return self._active_connections
+        return self.metrics.in_use
+
+    def pool_snapshot(self) -> Dict[str, Any]:
+        """
+        连接池指标快照，用于指标接口与测试，见`PoolMetrics.snapshot`。
+        """
+        snapshot: Dict[str, Any] = self.metrics.snapshot(self.connection_pool)
+        if self.replicas:
+            now: float = time.monotonic()
+            snapshot["replicas"] = [
+                {
+                    "host": f"{replica.host}:{replica.port}",
+                    "available": replica.pool is not None and replica.down_until <= now,
+                    "reads": replica.reads,
+                    "errors": replica.errors,
+                }
+                for replica in self.replicas
+            ]
+            snapshot["pinned_keys"] = sum(1 for until in self._pins.values() if until > now)
+        return snapshot
 
 # 使用示例
 async def main():
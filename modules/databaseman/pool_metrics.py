@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 获取连接等待时间直方图的桶上界（毫秒），最后一个桶为+Inf
+WAIT_BUCKETS_MS: Tuple[float, ...] = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# 定位调用位置时跳过的模块：本包与contextlib（`acquire`上下文管理器）
+_SKIPPED_MODULE: str = __name__.rsplit(".", 1)[0]
+
+# 泄漏报告中保留的栈帧数
+_STACK_LIMIT: int = 16
+
+
+@dataclass
+class ConnectionLease:
+    """一次借出的连接：借出位置、借出时间，以及开启`capture_stacks`时借出时的调用栈。"""
+    site: str
+    acquired_at: float
+    stack: Optional[traceback.StackSummary] = None
+    reported: bool = False
+
+    def held_for(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.acquired_at
+
+
+@dataclass
+class _HoldStats:
+    """私有类：单个调用位置的持有时长统计。"""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+@dataclass
+class PoolMetrics:
+    """
+    连接池指标，由`DatabaseManager`在获取与释放连接时更新。
+    - 获取连接的等待时间直方图（毫秒），以及成功、超时、出错的次数。
+    - 当前借出的连接按连接对象记录，释放时按对象匹配，重复释放或释放未知连接不会让计数漂移。
+    - 按调用位置（服务层的文件、行号与函数）统计持有时长。
+    - 持有超过阈值的连接视为疑似泄漏，报告借出位置；`capture_stacks=True`时另外报告借出时的调用栈。
+        每次借出只取一个栈帧，完整的调用栈需要逐帧遍历，默认不记录，排查泄漏时再开启。
+    """
+    wait_buckets: Tuple[float, ...] = WAIT_BUCKETS_MS
+    capture_stacks: bool = False
+    acquired_total: int = 0
+    timeouts_total: int = 0
+    errors_total: int = 0
+    leaks_total: int = 0
+    wait_total: float = 0.0
+    waiting: int = 0
+    _wait_counts: List[int] = field(default_factory=list)
+    _leases: Dict[int, ConnectionLease] = field(default_factory=dict)
+    _holds: Dict[str, _HoldStats] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self._wait_counts = [0] * (len(self.wait_buckets) + 1)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._leases)
+
+    def record_wait(self, seconds: float, outcome: str = "ok") -> None:
+        """
+        记录一次获取连接的等待。
+
+        Args:
+            seconds (float): 等待时长（秒）。
+            outcome (str): "ok"、"timeout"或"error"。
+        """
+        ms: float = seconds * 1000
+        index: int = len(self.wait_buckets)
+        for i, bound in enumerate(self.wait_buckets):
+            if ms <= bound:
+                index = i
+                break
+        self._wait_counts[index] += 1
+        self.wait_total += seconds
+        if outcome == "ok":
+            self.acquired_total += 1
+        elif outcome == "timeout":
+            self.timeouts_total += 1
+        else:
+            self.errors_total += 1
+
+    def on_acquired(self, connection: Any) -> None:
+        """记录借出的连接及借出位置。"""
+        frame = _caller_frame()
+        site: str = "<unknown>"
+        stack: Optional[traceback.StackSummary] = None
+        if frame is not None:
+            site = f"{_short_path(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+            if self.capture_stacks:
+                # 不读取源码行，格式化报告时才读取
+                stack = traceback.StackSummary.extract(
+                    traceback.walk_stack(frame), limit=_STACK_LIMIT, lookup_lines=False
+                )
+        self._leases[id(connection)] = ConnectionLease(site, time.monotonic(), stack)
+
+    def on_released(self, connection: Any) -> Optional[float]:
+        """
+        记录归还的连接。
+
+        Returns:
+            Optional[float]: 持有时长（秒）；连接不是经由本管理器借出时返回None。
+        """
+        lease: Optional[ConnectionLease] = self._leases.pop(id(connection), None)
+        if lease is None:
+            return None
+        held: float = lease.held_for()
+        stats: _HoldStats = self._holds.setdefault(lease.site, _HoldStats())
+        stats.count += 1
+        stats.total += held
+        if held > stats.max:
+            stats.max = held
+        if lease.reported:
+            print(f"Connection from {lease.site} released after {held:.1f}s (reported as leaked).")
+        return held
+
+    def find_leaks(self, threshold: float) -> List[ConnectionLease]:
+        """
+        找出持有超过`threshold`秒、尚未报告过的连接，并打印借出时的调用栈。
+
+        Returns:
+            List[ConnectionLease]: 本次新发现的疑似泄漏。
+        """
+        now: float = time.monotonic()
+        found: List[ConnectionLease] = []
+        for lease in self._leases.values():
+            if lease.reported or lease.held_for(now) < threshold:
+                continue
+            lease.reported = True
+            self.leaks_total += 1
+            found.append(lease)
+            detail: str = (
+                f"Acquired at:\n{''.join(lease.stack.format())}" if lease.stack is not None
+                else "Set DB_LEAK_STACKS=1 to record the acquiring call stack."
+            )
+            print(
+                f"WARNING: Database connection held for {lease.held_for(now):.1f}s by {lease.site}, "
+                f"possibly leaked. {detail}"
+            )
+        return found
+
+    def snapshot(self, pool: Any = None) -> Dict[str, Any]:
+        """
+        返回指标快照，可直接用于指标接口或测试。
+
+        Args:
+            pool: asyncpg连接池；提供时附带池大小与空闲连接数。
+
+        Returns:
+            (Dict[str, Any]): 计数、仪表、等待直方图（累积计数）与各调用位置的持有时长（毫秒）。
+        """
+        now: float = time.monotonic()
+        cumulative: Dict[str, int] = {}
+        running: int = 0
+        for bound, count in zip([*map(str, self.wait_buckets), "+Inf"], self._wait_counts):
+            running += count
+            cumulative[bound] = running
+        observed: int = running
+
+        holds: Dict[str, Dict[str, Any]] = {
+            site: {
+                "count": s.count,
+                "avg_ms": round(s.total / s.count * 1000, 2) if s.count else 0.0,
+                "max_ms": round(s.max * 1000, 2),
+                "total_ms": round(s.total * 1000, 2),
+            }
+            for site, s in sorted(self._holds.items(), key=lambda item: item[1].total, reverse=True)
+        }
+        held_now: List[Dict[str, Any]] = [
+            {"site": lease.site, "held_ms": round(lease.held_for(now) * 1000, 2), "reported": lease.reported}
+            for lease in sorted(self._leases.values(), key=lambda lease: lease.acquired_at)
+        ]
+
+        result: Dict[str, Any] = {
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "acquired_total": self.acquired_total,
+            "timeouts_total": self.timeouts_total,
+            "errors_total": self.errors_total,
+            "leaks_total": self.leaks_total,
+            "wait_ms_avg": round(self.wait_total / observed * 1000, 3) if observed else 0.0,
+            "wait_ms_histogram": cumulative,
+            "hold_by_site": holds,
+            "held_now": held_now,
+        }
+        if pool is not None and hasattr(pool, "get_size"):
+            result["size"] = pool.get_size()
+            result["idle"] = pool.get_idle_size()
+            result["max_size"] = pool.get_max_size()
+        return result
+
+
+def _caller_frame() -> Any:
+    """私有函数：调用栈中第一个不属于本包与contextlib的栈帧。"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module: str = frame.f_globals.get("__name__", "")
+        if module != "contextlib" and not module.startswith(_SKIPPED_MODULE):
+            return frame
+        frame = frame.f_back
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _short_path(path: str) -> str:
+    """私有函数：项目内的文件显示为相对路径。"""
+    try:
+        relative: str = os.path.relpath(path)
+    except ValueError:
+        return path
+    return path if relative.startswith("..") else relative
@@ -0,0 +1,184 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Union
+
+import asyncpg
+
+
+class UnknownQueryError(KeyError):
+    """按名称调用了未注册的查询。"""
+    def __init__(self, name: str):
+        super().__init__(f"Named query is not registered: {name}")
+        self.name: str = name
+
+
+@dataclass(frozen=True)
+class NamedQuery:
+    """
+    带名称的SQL语句，名称用于预编译缓存与统计，例如`tasks.get_by_id`。
+    - 定义放在服务层的`services/queries.py`，第一次执行时自动注册到`QueryRegistry`。
+    """
+    name: str
+    sql: str
+
+
+@dataclass
+class QueryStats:
+    """单个命名查询的调用统计。"""
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    # 在各连接上第一次执行的次数，正常情况下不超过连接池大小。预编译交给asyncpg的连接级语句缓存（LRU），
+    # 缓存溢出后被淘汰、再次预编译的情况不计入，因此这不是预编译次数
+    first_use_per_conn: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "first_use_per_conn": self.first_use_per_conn,
+        }
+
+
+class PreparedConnection(asyncpg.Connection):
+    """
+    记录已在本连接上执行过的命名查询的连接类，通过`asyncpg.create_pool(connection_class=...)`使用。
+    - 预编译语句由asyncpg按连接缓存（`statement_cache_size`，LRU），这里只记录名称，用于统计各查询在多少条连接上用过。
+    - 不保存`PreparedStatement`对象：连接每次归还连接池后，之前取得的语句对象都会失效
+        （asyncpg检查`_pool_release_ctr`，调用时抛出`InterfaceError`）。
+    - 连接被连接池关闭重建后，在新连接上第一次调用时重新预编译。
+    """
+    __slots__ = ("named_queries",)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.named_queries: Set[str] = set()
+
+
+class QueryRegistry:
+    """
+    命名查询注册表，挂在`DatabaseManager.queries`上。
+    - 预编译交给asyncpg的连接级语句缓存：命名查询在一条连接上第一次执行时预编译，之后直接按语句执行，
+        省去解析与计划；缓存满时最久未用的语句被淘汰，下次使用时重新预编译（不计入统计）。
+    - 记录每个查询的调用次数、出错次数与耗时，见`stats`。
+    - `prepare=False`时不使用命名的预编译语句，直接发送SQL文本；配合连接池的`statement_cache_size=0`，
+        可以在PgBouncer等事务级连接池代理之后使用（同一会话的语句可能落在不同的后端连接上）。
+    - 连接不是`PreparedConnection`时（例如测试中的假连接）照常执行，只是不统计`first_use_per_conn`。
+
+    使用示例：
+    ```
+    TASKS_GET_BY_ID = NamedQuery("tasks.get_by_id", "SELECT * FROM tasks WHERE id=$1")
+    row = await db.queries.fetchrow(conn, TASKS_GET_BY_ID, task_id)
+    ```
+    """
+    def __init__(self, prepare: bool = True) -> None:
+        """
+        初始化注册表。
+
+        Args:
+            prepare (bool): 是否在每条连接上预编译命名查询。
+        """
+        self.prepare: bool = prepare
+        self._queries: Dict[str, str] = {}
+        self._stats: Dict[str, QueryStats] = {}
+
+    def register(self, name: str, sql: str) -> NamedQuery:
+        """
+        注册命名查询；同名查询重复注册相同的SQL时无影响。
+
+        Raises:
+            ValueError: 同名查询已注册了不同的SQL。
+        """
+        existing: Optional[str] = self._queries.get(name)
+        if existing is not None and existing != sql:
+            raise ValueError(f"Named query {name} is already registered with different SQL")
+        self._queries[name] = sql
+        self._stats.setdefault(name, QueryStats())
+        return NamedQuery(name, sql)
+
+    def sql(self, name: str) -> str:
+        """
+        取出命名查询的SQL。
+
+        Raises:
+            UnknownQueryError: 查询未注册。
+        """
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise UnknownQueryError(name) from None
+
+    def names(self) -> List[str]:
+        return sorted(self._queries)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各命名查询的调用统计，按总耗时从高到低排列。
+        """
+        ordered = sorted(self._stats.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return {name: stats.as_dict() for name, stats in ordered}
+
+    def reset_stats(self) -> None:
+        for name in self._stats:
+            self._stats[name] = QueryStats()
+
+    async def fetch(self, conn: Any, query: Union[NamedQuery, str], *args: Any,
+                    timeout: Optional[float] = None) -> List[Any]:
+        return await self._run(conn, query, "fetch", args, timeout)
+
+    async def fetchrow(self, conn: Any, query: Union[NamedQuery, str], *args: Any,
+                       timeout: Optional[float] = None) -> Optional[Any]:
+        return await self._run(conn, query, "fetchrow", args, timeout)
+
+    async def fetchval(self, conn: Any, query: Union[NamedQuery, str], *args: Any,
+                       timeout: Optional[float] = None) -> Any:
+        return await self._run(conn, query, "fetchval", args, timeout)
+
+    async def execute(self, conn: Any, query: Union[NamedQuery, str], *args: Any,
+                      timeout: Optional[float] = None) -> str:
+        """
+        执行查询并返回状态字符串（例如"UPDATE 1"），与`Connection.execute`一致。
+        """
+        return await self._run(conn, query, "execute", args, timeout)
+
+    def _resolve(self, query: Union[NamedQuery, str]) -> NamedQuery:
+        """私有函数：按名称查找，或注册`NamedQuery`。"""
+        if isinstance(query, NamedQuery):
+            if self._queries.get(query.name) != query.sql:
+                self.register(query.name, query.sql)
+            return query
+        return NamedQuery(query, self.sql(query))
+
+    async def _run(
+        self,
+        conn: Any,
+        query: Union[NamedQuery, str],
+        method: str,
+        args: tuple,
+        timeout: Optional[float]
+    ) -> Any:
+        """私有函数：执行并记录耗时。"""
+        named: NamedQuery = self._resolve(query)
+        stats: QueryStats = self._stats[named.name]
+        start: float = time.perf_counter()
+        try:
+            seen: Optional[Set[str]] = getattr(conn, "named_queries", None) if self.prepare else None
+            if isinstance(seen, set) and named.name not in seen:
+                seen.add(named.name)
+                stats.first_use_per_conn += 1
+            kwargs: Dict[str, Any] = {} if timeout is None else {"timeout": timeout}
+            # 表结构变化导致缓存的语句失效时，asyncpg在事务外自动重新预编译并重试一次
+            return await getattr(conn, method)(named.sql, *args, **kwargs)
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed: float = (time.perf_counter() - start) * 1000
+            stats.calls += 1
+            stats.total_ms += elapsed
+            if elapsed > stats.max_ms:
+                stats.max_ms = elapsed
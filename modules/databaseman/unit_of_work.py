@@ -0,0 +1,107 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+
+class UnitOfWork:
+    """
+    一次请求（或一段`async with db.unit_of_work()`）内共用的数据库连接，由`DatabaseManager`通过上下文变量查找。
+    - 连接在第一次写入（或开启事务时的第一次查询）时才从主库获取，没有查询时不占用连接池。
+    - 获取共用连接之后单元内的只读查询同样使用该连接（读到本单元的写入）；在此之前的只读查询不经过单元，可以使用只读副本。
+    - 同一个协程内嵌套的服务调用直接复用该连接，不会在持有连接时再次等待连接池（连接池耗尽时的嵌套死锁）。
+    - 其他协程（例如`asyncio.gather`的并发分支）在连接被占用时：开启了事务则排队等待，
+        否则从连接池另取连接，不共用同一个连接上的并发查询。
+    - 结束后上下文变量仍可能被后台任务继承，此时`closed`为True，调用方按普通方式获取连接。
+    """
+    def __init__(self, db: Any, transaction: bool = False) -> None:
+        """
+        初始化。
+
+        Args:
+            db (DatabaseManager): 所属的数据库管理器。
+            transaction (bool): 是否在共用连接上开启事务，正常结束时提交，出现异常时回滚。
+        """
+        self.db: Any = db
+        self.transaction: bool = transaction
+        self.connection: Optional[Any] = None
+        self.closed: bool = False
+        # 本单元内写入时使用的读写一致性键，结束（提交）后再固定到主库
+        self.pin_keys: List[str] = []
+        self._tx: Optional[Any] = None
+        self._owner: Optional[asyncio.Task] = None
+        self._depth: int = 0
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def owns(self, connection: Any) -> bool:
+        """连接是否为本单元借出中的共用连接。"""
+        return self._depth > 0 and connection is self.connection
+
+    async def borrow(self, timeout: float) -> Optional[Any]:
+        """
+        借出共用连接。
+
+        Returns:
+            Optional[Any]: 共用连接；连接正被其他协程使用且未开启事务时返回None，由调用方另取连接。
+        """
+        task: Optional[asyncio.Task] = asyncio.current_task()
+        if self._depth > 0:
+            if self._owner is task:
+                self._depth += 1
+                return self.connection
+            if not self.transaction:
+                return None
+        await asyncio.wait_for(self._lock.acquire(), timeout)
+        try:
+            if self.connection is None:
+                self.connection = await self.db._acquire_primary(timeout)
+                if self.transaction:
+                    self._tx = self.connection.transaction()
+                    await self._tx.start()
+        except BaseException:
+            self._lock.release()
+            raise
+        self._owner = task
+        self._depth = 1
+        return self.connection
+
+    def give_back(self) -> None:
+        """归还借出的共用连接，连接仍由本单元持有到结束。"""
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            self._lock.release()
+
+    async def close(self, failed: bool) -> None:
+        """
+        结束本单元：提交或回滚事务，并把连接归还连接池。
+
+        Args:
+            failed (bool): 是否因异常结束。
+        """
+        self.closed = True
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        try:
+            if self._tx is not None:
+                if failed:
+                    await self._tx.rollback()
+                else:
+                    await self._tx.commit()
+        finally:
+            self._tx = None
+            await self.db.release_connection(connection)
+        if not failed and self.pin_keys:
+            await self.db.pin_to_primary(*self.pin_keys)
+
+
+# 当前上下文中的工作单元，由`DatabaseManager.unit_of_work`设置
+_current_unit: ContextVar[Optional[UnitOfWork]] = ContextVar("databaseman_unit_of_work", default=None)
+
+
+def current_unit(db: Any) -> Optional[UnitOfWork]:
+    """当前上下文中属于`db`且尚未结束的工作单元。"""
+    unit: Optional[UnitOfWork] = _current_unit.get()
+    if unit is None or unit.closed or unit.db is not db:
+        return None
+    return unit
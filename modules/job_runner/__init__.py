@@ -0,0 +1,5 @@
+from .job_runner import (JobRunner, JobQueueFullError)
+
+__all__ = [
+    "JobRunner", "JobQueueFullError"
+]
@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Optional, Set
+
+
+class JobQueueFullError(RuntimeError):
+    """排队中的任务数已达上限。"""
+    def __init__(self, message: str = "Job queue is full"):
+        super().__init__(message)
+
+
+class JobRunner:
+    """
+    进程内的后台任务执行器。
+    - 提交的任务立刻返回，由事件循环在后台执行；同时运行的任务数由信号量限制。
+    - 排队（含运行中）的任务数超过`max_pending`时拒绝提交，避免无限堆积。
+    - 每个任务在全新的`contextvars.Context`中运行，不会继承提交它的请求的上下文。
+    - 任务只存在于当前worker进程内，进程退出时未完成的任务会被取消。
+
+    使用示例：
+    ```
+    runner = JobRunner(concurrency=4)
+    runner.submit(lambda: some_coroutine(arg))
+    ...
+    await runner.shutdown()
+    ```
+    """
+    def __init__(self, concurrency: int = 4, max_pending: int = 100) -> None:
+        """
+        初始化执行器。
+
+        Args:
+            concurrency (int): 同时运行的最大任务数。
+            max_pending (int): 排队与运行中任务数之和的上限。
+        """
+        self.concurrency: int = concurrency
+        self.max_pending: int = max_pending
+
+        # 信号量需要在事件循环内创建，首次提交时再初始化。
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._running: int = 0
+
+    @property
+    def pending_count(self) -> int:
+        """排队与运行中的任务数。"""
+        return len(self._tasks)
+
+    @property
+    def running_count(self) -> int:
+        """正在运行的任务数。"""
+        return self._running
+
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """
+        提交一个后台任务。
+
+        Args:
+            job (Callable[[], Awaitable[Any]]): 返回协程的无参函数；在获取到执行名额后才会被调用。
+
+        Returns:
+            (asyncio.Task): 对应的asyncio任务。
+
+        Raises:
+            JobQueueFullError: 排队任务数已达上限。
+        """
+        if len(self._tasks) >= self.max_pending:
+            raise JobQueueFullError(f"Too many pending jobs ({len(self._tasks)}/{self.max_pending}).")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        task: asyncio.Task = asyncio.get_running_loop().create_task(
+            self._run(job), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, job: Callable[[], Awaitable[Any]]) -> Any:
+        """私有函数：在信号量限制下执行任务，异常只打印而不向外抛出。"""
+        assert self._semaphore is not None
+        async with self._semaphore:
+            self._running += 1
+            try:
+                return await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # 任务自身应负责记录失败状态，这里只做兜底日志。
+                print(f"Background job failed: {exc!r}")
+                return None
+            finally:
+                self._running -= 1
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        等待运行中的任务结束，超时后取消剩余任务。
+
+        Args:
+            timeout (float): 最长等待时间（秒）。
+        """
+        if not self._tasks:
+            return
+        tasks = list(self._tasks)
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
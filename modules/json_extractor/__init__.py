@@ -0,0 +1,10 @@
+from .json_extractor import (
+    JSONBlockExtractor, extract_json_block, strip_code_fence,
+    JSON_BEGIN_MARKER, JSON_END_MARKER
+)
+from .task_stream import TaskStreamParser
+
+__all__ = [
+    "JSONBlockExtractor", "extract_json_block", "strip_code_fence",
+    "JSON_BEGIN_MARKER", "JSON_END_MARKER", "TaskStreamParser"
+]
@@ -0,0 +1,307 @@
+import json
+import re
+from bisect import bisect_right
+from typing import Any, List, Optional, Tuple
+
+# LLM输出中包裹JSON块的标记，见llm_prompts内的提示词。
+JSON_BEGIN_MARKER: str = "<<<JSON_BEGIN>>>"
+JSON_END_MARKER: str = "<<<JSON_END>>>"
+
+# 不在字符串内时，需要关心的字符。
+_STRUCTURAL = re.compile(r'[{}"]')
+# 在字符串内时，需要关心的字符。
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# 结果兜底时，最多丢弃几个未闭合的左大括号重新扫描。
+_MAX_RESCANS: int = 8
+# 顶层片段解析失败时允许回退重扫的字符数，按全文长度的倍数计，保证整体仍为线性。
+_RESCAN_BUDGET_FACTOR: int = 2
+
+
+def strip_code_fence(content: str) -> str:
+    """
+    去掉包裹在内容外层的Markdown代码块标记（```或```json）。
+
+    Args:
+        content (str): 原始内容。
+
+    Returns:
+        (str): 去掉代码块标记后的内容。
+    """
+    content = content.strip()
+    if not content.startswith("```"):
+        return content
+
+    lines: List[str] = content.splitlines()
+    if lines and lines[0].strip().startswith("```"):
+        lines = lines[1:]
+    if lines and lines[-1].strip().startswith("```"):
+        lines = lines[:-1]
+    return "\n".join(lines).strip()
+
+
+def _is_json(candidate: str) -> bool:
+    try:
+        json.loads(candidate)
+        return True
+    except ValueError:
+        return False
+
+
+class JSONBlockExtractor:
+    """
+    从LLM输出中提取JSON对象块的流式提取器。
+    - 优先使用`<<<JSON_BEGIN>>>`/`<<<JSON_END>>>`标记之间的内容，并去掉代码块标记。
+    - 否则对全文做一次感知字符串的大括号扫描，整体为O(n)，每个候选片段只会被`json.loads`一次。
+    - 可以分块调用`feed`，标记或片段跨块也能正确识别；输入的块不会被反复拼接。
+
+    使用示例：
+    ```
+    extractor = JSONBlockExtractor()
+    async for chunk in llm.fetch_stream(...):
+        extractor.feed(chunk)
+    json_text = extractor.result()
+    ```
+    """
+    def __init__(
+        self,
+        begin_marker: Optional[str] = JSON_BEGIN_MARKER,
+        end_marker: Optional[str] = JSON_END_MARKER,
+        _rescans: int = _MAX_RESCANS
+    ) -> None:
+        """
+        初始化提取器。
+
+        Args:
+            begin_marker (Optional[str]): JSON块开头标记，为None时不识别标记。
+            end_marker (Optional[str]): JSON块结尾标记。
+        """
+        self.begin_marker: Optional[str] = begin_marker
+        self.end_marker: Optional[str] = end_marker
+        self._rescans: int = _rescans
+
+        # 已输入的块，及每块在全文中的起始位置
+        self._chunks: List[str] = []
+        self._offsets: List[int] = []
+        self._length: int = 0
+
+        # 标记扫描状态
+        self._marker_tail: str = ""
+        self._block_start: Optional[int] = None
+        self._marker_block: Optional[str] = None
+
+        # 大括号扫描状态
+        self._in_string: bool = False
+        self._skip_next: bool = False
+        # 未闭合的左大括号：[位置, 其内部已闭合的最外层片段列表]
+        self._stack: List[List[Any]] = []
+        # 在顶层闭合且可解析的JSON对象
+        self._objects: List[str] = []
+        # 已用于回退重扫的字符数
+        self._rescanned: int = 0
+
+    @property
+    def text(self) -> str:
+        """目前已输入的全部文本。"""
+        return self._slice(0, self._length)
+
+    @property
+    def marker_block(self) -> Optional[str]:
+        """标记之间的内容；标记尚未闭合时为None。"""
+        return self._marker_block
+
+    @property
+    def objects(self) -> List[str]:
+        """目前已在顶层闭合且可被解析的JSON对象。"""
+        return list(self._objects)
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        输入一段文本。
+
+        Args:
+            chunk (str): 新到达的文本片段。
+
+        Returns:
+            (List[str]): 本次新闭合、且可被解析的顶层JSON对象。
+        """
+        if not chunk:
+            return []
+        base: int = self._length
+        self._chunks.append(chunk)
+        self._offsets.append(base)
+        self._length += len(chunk)
+
+        if self.begin_marker and self.end_marker and self._marker_block is None:
+            self._scan_markers(chunk, base)
+        return self._scan_braces(chunk, base)
+
+    def result(self) -> Optional[str]:
+        """
+        返回最合适的JSON块。
+        - 标记块可以被解析时直接返回；否则在标记块内部继续查找。
+        - 没有标记时，返回第一个可以被解析的顶层对象。
+        - 仍找不到时，在未闭合的左大括号内部查找（例如推理文本中遗留了单个"{"）。
+
+        Returns:
+            (Optional[str]): JSON字符串；找不到时返回None。
+        """
+        if self._marker_block is not None:
+            if _is_json(self._marker_block):
+                return self._marker_block
+            inner: Optional[str] = extract_json_block(self._marker_block, use_markers=False)
+            return inner if inner is not None else self._marker_block
+
+        if self._objects:
+            return self._objects[0]
+
+        spans: List[Tuple[int, int]] = sorted(span for entry in self._stack for span in entry[1])
+        for start, end in spans:
+            candidate: str = self._slice(start, end)
+            if _is_json(candidate):
+                return candidate
+
+        # 未闭合的左大括号后面若出现了落单的引号，字符串状态会被带偏；丢弃第一个左大括号重新扫描。
+        if self._stack and self._rescans > 0:
+            retry = JSONBlockExtractor(None, None, _rescans=self._rescans - 1)
+            retry.feed(self._slice(self._stack[0][0] + 1, self._length))
+            return retry.result()
+        return None
+
+    def _slice(self, start: int, end: int) -> str:
+        """私有函数：取出全文中[start, end)的内容，只拼接覆盖该区间的块。"""
+        if start >= end:
+            return ""
+        first: int = bisect_right(self._offsets, start) - 1
+        last: int = bisect_right(self._offsets, end - 1) - 1
+        if first == last:
+            base: int = self._offsets[first]
+            return self._chunks[first][start - base:end - base]
+        parts: List[str] = [self._chunks[first][start - self._offsets[first]:]]
+        parts.extend(self._chunks[first + 1:last])
+        parts.append(self._chunks[last][:end - self._offsets[last]])
+        return "".join(parts)
+
+    def _scan_markers(self, chunk: str, base: int) -> None:
+        """私有函数：在上一块的末尾及本块中增量查找开头和结尾标记。"""
+        assert self.begin_marker is not None and self.end_marker is not None
+        # 标记可能被切分在两个块之间，带上上一块的末尾一起查找。
+        window: str = self._marker_tail + chunk
+        window_base: int = base - len(self._marker_tail)
+        pos: int = 0
+
+        while True:
+            if self._block_start is None:
+                idx: int = window.find(self.begin_marker, pos)
+                if idx == -1:
+                    self._marker_tail = window[max(pos, len(window) - len(self.begin_marker) + 1):]
+                    return
+                self._block_start = window_base + idx + len(self.begin_marker)
+                pos = idx + len(self.begin_marker)
+
+            end_idx: int = window.find(self.end_marker, max(pos, self._block_start - window_base))
+            if end_idx == -1:
+                keep: int = max(len(window) - len(self.end_marker) + 1, self._block_start - window_base, 0)
+                self._marker_tail = window[keep:]
+                return
+
+            block: str = strip_code_fence(self._slice(self._block_start, window_base + end_idx))
+            if block:
+                self._marker_block = block
+                self._marker_tail = ""
+                return
+            # 空标记块：继续寻找下一对标记。
+            self._block_start = None
+            pos = end_idx + len(self.end_marker)
+
+    def _scan_braces(self, chunk: str, base: int) -> List[str]:
+        """私有函数：扫描新到达的块，每个字符摊还只被访问常数次。"""
+        stack: List[List[Any]] = self._stack
+        found: List[str] = []
+        # 待扫描的片段：(文本, 文本在全文中的起始位置, 片段内的起始下标)
+        segments: List[Tuple[str, int, int]] = [(chunk, base, 0)]
+
+        while segments:
+            text, text_base, pos = segments.pop()
+            n: int = len(text)
+            if self._skip_next and pos < n:
+                # 上一块以转义符结尾，跳过被转义的字符。
+                self._skip_next = False
+                pos += 1
+
+            while pos < n:
+                if self._in_string:
+                    m = _STRING_SPECIAL.search(text, pos)
+                    if m is None:
+                        break
+                    i: int = m.start()
+                    if text[i] == "\\":
+                        if i + 1 >= n:
+                            self._skip_next = True
+                            break
+                        pos = i + 2
+                        continue
+                    self._in_string = False
+                    pos = i + 1
+                    continue
+
+                if not stack:
+                    # 顶层只需要关心左大括号。
+                    i = text.find("{", pos)
+                    if i == -1:
+                        break
+                    stack.append([text_base + i, []])
+                    pos = i + 1
+                    continue
+
+                m = _STRUCTURAL.search(text, pos)
+                if m is None:
+                    break
+                i = m.start()
+                ch: str = text[i]
+                pos = i + 1
+                if ch == '"':
+                    self._in_string = True
+                elif ch == "{":
+                    stack.append([text_base + i, []])
+                else:
+                    start: int = stack.pop()[0]
+                    end: int = text_base + i + 1
+                    if stack:
+                        # 只记录最外层片段，内部的片段随父片段一起丢弃。
+                        stack[-1][1].append((start, end))
+                        continue
+
+                    candidate: str = self._slice(start, end)
+                    if _is_json(candidate):
+                        found.append(candidate)
+                    elif '"' in candidate and self._rescanned + len(candidate) <= _RESCAN_BUDGET_FACTOR * self._length:
+                        # 片段内出现过引号，可能是落单的引号带偏了字符串状态，从左大括号之后重扫该片段。
+                        self._rescanned += len(candidate)
+                        segments.append((text, text_base, pos))
+                        segments.append((candidate[1:], start + 1, 0))
+                        break
+
+        self._objects.extend(found)
+        return found
+
+
+def extract_json_block(text: Optional[str], use_markers: bool = True) -> Optional[str]:
+    """
+    从一段完整的文本中提取JSON对象块。
+
+    Args:
+        text (Optional[str]): LLM输出的全文。
+        use_markers (bool): 是否优先使用`<<<JSON_BEGIN>>>`/`<<<JSON_END>>>`标记。
+
+    Returns:
+        (Optional[str]): JSON字符串；找不到时返回None。
+    """
+    if not text:
+        return None
+    if use_markers:
+        extractor = JSONBlockExtractor()
+    else:
+        extractor = JSONBlockExtractor(None, None)
+    extractor.feed(text)
+    return extractor.result()
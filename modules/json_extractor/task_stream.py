@@ -0,0 +1,320 @@
+import json
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .json_extractor import JSON_BEGIN_MARKER, _STRING_SPECIAL
+
+
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_NUMBER_CHARS = re.compile(r'[-+0-9.eE]+')
+_LITERALS = (("true", True), ("false", False), ("null", None))
+_WHITESPACE = " \t\r\n"
+
+# 任务对象中会被收集的字段，其余字段（以及嵌套的其他对象/数组）被忽略。
+TASK_FIELDS = ("title", "description", "estimated_time", "estimated_time_unit", "priority")
+
+
+class _TaskNode:
+    """私有类：解析中的一个任务对象。"""
+    __slots__ = ("id", "parent", "fields", "emitted", "deferred")
+
+    def __init__(self, parent: Optional["_TaskNode"]) -> None:
+        self.id: str = str(uuid.uuid4())
+        self.parent: Optional[_TaskNode] = parent
+        self.fields: Dict[str, Any] = {}
+        self.emitted: bool = False
+        self.deferred: List[_TaskNode] = []
+
+
+class _Frame:
+    """私有类：解析栈中的一个对象或数组。"""
+    __slots__ = ("is_object", "state", "key", "task", "owner", "holds_tasks")
+
+    def __init__(
+        self,
+        is_object: bool,
+        task: Optional[_TaskNode] = None,
+        owner: Optional[_TaskNode] = None,
+        holds_tasks: bool = False
+    ) -> None:
+        self.is_object: bool = is_object
+        # 对象："key" -> "colon" -> "value" -> "next"；数组："value" -> "next"
+        self.state: str = "key" if is_object else "value"
+        self.key: Optional[str] = None
+        self.task: Optional[_TaskNode] = task      # 本对象是任务时为对应的任务
+        self.owner: Optional[_TaskNode] = owner    # 本数组是tasks/subtasks时为其所属的上级任务
+        self.holds_tasks: bool = holds_tasks
+
+
+class TaskStreamParser:
+    """
+    增量解析任务分解JSON（`main_goal`/`tasks`/`subtasks`结构），不等整棵树读完就逐个输出任务。
+    - 每个任务在对象开始时预先分配UUID，输出时带上上级任务的ID，因此可以在整棵树读完前逐个写入数据库。
+    - 任务在开始读取`subtasks`时（已读到标题）或对象闭合时输出，以先到者为准；上级任务总是先于其子任务输出。
+    - 因此写在`subtasks`之后的字段（例如`priority`）不会出现在已输出的任务中，按缺省值处理；
+        提示词要求`subtasks`为每个任务的最后一个字段。推迟到对象闭合再输出会让整棵树都等到根任务闭合。
+    - 只在`<<<JSON_BEGIN>>>`标记之后，或回答一开头就是JSON对象（可包在代码块中）时开始解析；
+        每个字符只被扫描一次，输入块不会被反复拼接。
+    - 语法错误时停止解析并记录`error`，已输出的任务不会被撤回。
+
+    使用示例：
+    ```
+    parser = TaskStreamParser()
+    async for chunk in llm.fetch_stream(...):
+        for task in parser.feed(chunk):
+            ...  # {"id", "parent_task_id", "title", "description", ...}
+    parser.close()
+    ```
+    """
+    def __init__(self, begin_marker: str = JSON_BEGIN_MARKER) -> None:
+        """
+        初始化解析器。
+
+        Args:
+            begin_marker (str): JSON块的开始标记。
+        """
+        self.begin_marker: str = begin_marker
+        self.started: bool = False
+        self.done: bool = False
+        self.error: Optional[str] = None
+
+        self._buf: str = ""
+        self._prose: bool = False           # 开始标记之前出现过非JSON内容
+        self._stack: List[_Frame] = []
+        self._string_scan: int = 0          # 未读完的字符串已扫描的长度
+        self._out: List[Dict[str, Any]] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        输入一段文本。
+
+        Args:
+            text (str): 流式输出的一块。
+
+        Returns:
+            (List[Dict[str, Any]]): 本次新读完的任务，按先序排列。
+        """
+        if self.done or self.error is not None or not text:
+            return []
+        self._buf += text
+        if not self.started and not self._seek():
+            return []
+        self._parse()
+        out, self._out = self._out, []
+        return out
+
+    def close(self) -> None:
+        """
+        输入结束。JSON已开始但未闭合时记录`error`。
+        """
+        if self.started and not self.done and self.error is None:
+            self.error = "JSON ended before the root object was closed"
+
+    def _seek(self) -> bool:
+        """私有函数：寻找JSON的开头，找到时丢弃之前的内容。"""
+        index: int = self._buf.find(self.begin_marker)
+        if index != -1:
+            self._buf = self._buf[index + len(self.begin_marker):]
+            self.started = True
+            return True
+
+        if not self._prose:
+            head: str = self._buf.lstrip(_WHITESPACE)
+            if head.startswith("{") or head.startswith("```"):
+                self._buf = head
+                self.started = True
+                return True
+            if head and not "```".startswith(head):
+                self._prose = True
+
+        # 只保留可能是标记前缀的尾部
+        keep: int = len(self.begin_marker) - 1
+        if self._prose and len(self._buf) > keep:
+            self._buf = self._buf[-keep:]
+        return False
+
+    def _fail(self, message: str) -> None:
+        self.error = message
+        self._buf = ""
+
+    def _parse(self) -> None:
+        """私有函数：尽可能多地消费缓冲区中的完整记号。"""
+        buf: str = self._buf
+        n: int = len(buf)
+        i: int = 0
+        stack: List[_Frame] = self._stack
+
+        while i < n and not self.done:
+            c: str = buf[i]
+            if c in _WHITESPACE:
+                i += 1
+                continue
+
+            top: Optional[_Frame] = stack[-1] if stack else None
+
+            if top is None:
+                # 根：允许JSON外包一层代码块
+                if c == "`":
+                    newline: int = buf.find("\n", i)
+                    if newline == -1:
+                        break
+                    i = newline + 1
+                    continue
+                if c != "{":
+                    self._fail(f"Expected '{{' at the start of the JSON block, got {c!r}")
+                    return
+                stack.append(_Frame(True))
+                i += 1
+                continue
+
+            if top.is_object and top.state == "key":
+                if c == "}":
+                    i += 1
+                    self._close_container()
+                    continue
+                if c != '"':
+                    self._fail(f"Expected an object key, got {c!r}")
+                    return
+                end: int = self._string_end(buf, i)
+                if end == -1:
+                    break
+                top.key = json.loads(buf[i:end])
+                top.state = "colon"
+                i = end
+                continue
+
+            if top.is_object and top.state == "colon":
+                if c != ":":
+                    self._fail(f"Expected ':', got {c!r}")
+                    return
+                top.state = "value"
+                i += 1
+                continue
+
+            if top.state == "next":
+                if c == ",":
+                    top.state = "key" if top.is_object else "value"
+                    i += 1
+                    continue
+                if c == ("}" if top.is_object else "]"):
+                    i += 1
+                    self._close_container()
+                    continue
+                self._fail(f"Expected ',' or a closing bracket, got {c!r}")
+                return
+
+            # 读取一个值
+            if c == "]" and not top.is_object:
+                i += 1
+                self._close_container()
+                continue
+            if c == "{" or c == "[":
+                top.state = "next"
+                self._open_container(top, c == "{")
+                i += 1
+                continue
+            if c == '"':
+                end = self._string_end(buf, i)
+                if end == -1:
+                    break
+                self._scalar(top, json.loads(buf[i:end]))
+                i = end
+                continue
+            if c == "-" or c.isdigit():
+                match = _NUMBER_CHARS.match(buf, i)
+                assert match is not None
+                if match.end() == n:
+                    break  # 数字可能还没有结束
+                if _NUMBER.fullmatch(match.group()) is None:
+                    self._fail(f"Invalid number {match.group()!r}")
+                    return
+                self._scalar(top, json.loads(match.group()))
+                i = match.end()
+                continue
+            for literal, value in _LITERALS:
+                if buf.startswith(literal, i):
+                    self._scalar(top, value)
+                    i += len(literal)
+                    break
+                if n - i < len(literal) and literal.startswith(buf[i:]):
+                    self._buf = buf[i:]
+                    return
+            else:
+                self._fail(f"Unexpected character {c!r}")
+                return
+
+        self._buf = "" if self.done else buf[i:]
+
+    def _string_end(self, buf: str, start: int) -> int:
+        """
+        私有函数：返回从`start`开始的字符串字面量的结束位置，未读完时返回-1。
+        - 未读完时记下已扫描的长度（相对字符串开头），下次从该处继续，长字符串跨多块时仍为线性。
+        """
+        j: int = start + max(1, self._string_scan)
+        while True:
+            match = _STRING_SPECIAL.search(buf, j)
+            if match is None:
+                self._string_scan = len(buf) - start
+                return -1
+            if match.group() == "\\":
+                j = match.end() + 1
+                if j > len(buf):
+                    self._string_scan = match.start() - start
+                    return -1
+                continue
+            self._string_scan = 0
+            return match.end()
+
+    def _open_container(self, parent: _Frame, is_object: bool) -> None:
+        """私有函数：进入一个对象或数组，并判断它是否为任务或任务列表。"""
+        if is_object:
+            task: Optional[_TaskNode] = None
+            if parent.holds_tasks:
+                task = _TaskNode(parent.owner)
+            self._stack.append(_Frame(True, task=task))
+            return
+
+        holds_tasks: bool = False
+        owner: Optional[_TaskNode] = None
+        if parent.is_object:
+            if parent.key == "tasks" and len(self._stack) == 1:
+                holds_tasks = True
+            elif parent.key == "subtasks" and parent.task is not None:
+                holds_tasks = True
+                owner = parent.task
+                # 子任务开始时输出上级任务，之后读到的上级任务字段被忽略（见类说明）
+                if "title" in owner.fields:
+                    self._emit(owner)
+        self._stack.append(_Frame(False, owner=owner, holds_tasks=holds_tasks))
+
+    def _close_container(self) -> None:
+        """私有函数：离开当前对象或数组。"""
+        frame: _Frame = self._stack.pop()
+        if frame.task is not None and not frame.task.emitted:
+            self._emit(frame.task)
+        if not self._stack:
+            self.done = True
+
+    def _scalar(self, frame: _Frame, value: Any) -> None:
+        """私有函数：记录任务对象中的标量字段。"""
+        if frame.is_object:
+            if frame.task is not None and frame.key in TASK_FIELDS:
+                frame.task.fields[frame.key] = value
+        frame.state = "next"
+
+    def _emit(self, node: _TaskNode) -> None:
+        """私有函数：输出任务；上级任务尚未输出时先挂起，待上级输出后按顺序补上。"""
+        if node.parent is not None and not node.parent.emitted:
+            node.parent.deferred.append(node)
+            return
+        node.emitted = True
+        record: Dict[str, Any] = {
+            "id": node.id,
+            "parent_task_id": node.parent.id if node.parent is not None else None,
+        }
+        record.update(node.fields)
+        self._out.append(record)
+        for child in node.deferred:
+            self._emit(child)
+        node.deferred = []
@@ -1,5 +1,13 @@
 from .llm_fetcher import LLMFetcher
+from .tokens import estimate_tokens, MESSAGE_TOKEN_OVERHEAD
+from .response_cache import LLMResponseCache
+from .governor import LLMGovernor, LLMRateLimitedError
+from .cassette import LLMCassette, LLMCassetteMissError
+from .streaming import LLMStreamEvent, BoundedTextBuffer, with_heartbeat, coalesce_chunks, SSE_HEARTBEAT
 
 __all__ = [
-    "LLMFetcher"
-]
\ No newline at end of file
+    "LLMFetcher", "LLMResponseCache", "LLMGovernor", "LLMRateLimitedError",
+    "LLMCassette", "LLMCassetteMissError",
+    "LLMStreamEvent", "BoundedTextBuffer", "with_heartbeat", "coalesce_chunks", "SSE_HEARTBEAT",
+    "estimate_tokens", "MESSAGE_TOKEN_OVERHEAD"
+]
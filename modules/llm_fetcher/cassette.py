@@ -0,0 +1,256 @@
+import codecs
+import hashlib
+import json
+import os
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+
+# OpenAI兼容接口流式响应的结束标记
+_SSE_DONE = "data: [DONE]"
+
+# 录制时保留的响应头，其余（长度、编码、日期等）在重放时没有意义
+_KEPT_HEADERS = ("content-type", "retry-after", "retry-after-ms", "x-request-id")
+
+CASSETTE_MODES = ("record", "replay", "auto")
+
+
+class LLMCassetteMissError(RuntimeError):
+    """重放模式下磁带中没有与请求匹配的记录。"""
+    def __init__(self, key: str, path: str):
+        super().__init__(f"No recorded LLM response for request {key[:12]} in cassette {path}")
+        self.key: str = key
+
+
+class LLMCassette:
+    """
+    LLM请求的录制/重放磁带，工作在HTTP传输层，对`LLMFetcher`与OpenAI SDK透明。
+    - record：请求照常发往平台，每个完整读完的响应连同分块时间线追加到JSONL文件（每行一次交互）。
+    - replay：按请求内容匹配磁带中的记录并在本地重放，不访问网络；找不到时抛出`LLMCassetteMissError`。
+    - auto：能匹配时重放，否则转发给平台并录制。
+    - 匹配键为请求方法、路径与规范化后的JSON请求体的哈希；同一请求录制了多次时按录制顺序轮流重放。
+    - 重放时按原始时间线（响应头到达时间、每块的到达时间）等待，`speed`为加速倍数，为0时不等待。
+
+    使用示例：
+    ```
+    cassette = LLMCassette("cassettes/decompose.jsonl", mode="replay", speed=10.0)
+    llm = LLMFetcher(api_url, api_key, model, cassette=cassette)
+    ```
+    """
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0) -> None:
+        """
+        初始化磁带。
+
+        Args:
+            path (str): JSONL文件路径；录制时追加写入。
+            mode (str): "record"、"replay"或"auto"。
+            speed (float): 重放加速倍数，1为原速，为0时不等待。
+        """
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path: str = path
+        self.mode: str = mode
+        self.speed: float = speed
+
+        self._episodes: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self.hits: int = 0
+        self.recorded: int = 0
+        if mode != "record":
+            self.load()
+
+    def load(self) -> None:
+        """
+        从文件载入全部记录；文件不存在时视为空磁带。
+        """
+        self._episodes = {}
+        self._cursor = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    episode: Dict[str, Any] = json.loads(line)
+                    self._episodes.setdefault(episode["key"], []).append(episode)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._episodes.values())
+
+    @staticmethod
+    def make_key(method: str, path: str, body: bytes) -> str:
+        """
+        计算请求的匹配键。JSON请求体按键排序后参与哈希，字段顺序不同的相同请求可以匹配。
+
+        Args:
+            method (str): HTTP方法。
+            path (str): 请求路径（不含主机，换一个平台地址仍可匹配）。
+            body (bytes): 请求体。
+        """
+        try:
+            canonical: bytes = json.dumps(
+                json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+        except ValueError:
+            canonical = body
+        digest = hashlib.sha256(f"{method.upper()} {path}\n".encode("utf-8"))
+        digest.update(canonical)
+        return digest.hexdigest()
+
+    def transport(self, inner: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncBaseTransport:
+        """
+        创建录制/重放传输层。
+
+        Args:
+            inner (Optional[httpx.AsyncBaseTransport]): 真实的传输层；纯重放时可以为None。
+        """
+        return _CassetteTransport(self, inner)
+
+    def next_episode(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        取出与匹配键对应的下一条记录，没有时返回None。
+        """
+        episodes: Optional[List[Dict[str, Any]]] = self._episodes.get(key)
+        if not episodes:
+            return None
+        index: int = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        self.hits += 1
+        return episodes[index % len(episodes)]
+
+    def add(self, episode: Dict[str, Any]) -> None:
+        """
+        追加一条记录并立即写入文件。
+        """
+        self._episodes.setdefault(episode["key"], []).append(episode)
+        self.recorded += 1
+        directory: str = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(episode, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    async def wait_until(self, start: float, offset_ms: float) -> None:
+        """
+        重放时等到原始时间线上的`offset_ms`（相对请求开始，按`speed`缩放）。
+        """
+        if self.speed <= 0:
+            return
+        delay: float = start + offset_ms / 1000.0 / self.speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _CassetteTransport(httpx.AsyncBaseTransport):
+    """私有类：磁带的httpx传输层。"""
+    def __init__(self, cassette: LLMCassette, inner: Optional[httpx.AsyncBaseTransport]) -> None:
+        self.cassette: LLMCassette = cassette
+        self.inner: Optional[httpx.AsyncBaseTransport] = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start: float = time.perf_counter()
+        body: bytes = await request.aread()
+        key: str = LLMCassette.make_key(request.method, request.url.path, body)
+
+        if self.cassette.mode != "record":
+            episode: Optional[Dict[str, Any]] = self.cassette.next_episode(key)
+            if episode is not None:
+                await self.cassette.wait_until(start, episode["headers_ms"])
+                return httpx.Response(
+                    episode["status"],
+                    headers=episode["headers"],
+                    stream=_ReplayStream(self.cassette, episode["chunks"], start),
+                    request=request
+                )
+            if self.cassette.mode == "replay":
+                raise LLMCassetteMissError(key, self.cassette.path)
+
+        if self.inner is None:
+            raise RuntimeError("Cassette recording requires an inner transport")
+        # 录制未压缩的原始字节，重放时无需再解码
+        request.headers["Accept-Encoding"] = "identity"
+        response: httpx.Response = await self.inner.handle_async_request(request)
+        episode = {
+            "key": key,
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS},
+            "headers_ms": round((time.perf_counter() - start) * 1000, 1),
+            "chunks": [],
+        }
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(self.cassette, response, episode, start),
+            extensions=response.extensions,
+            request=request
+        )
+
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """
+    私有类：转发响应体并记录每块的到达时间，完整读完后写入磁带。
+    - SDK读到流式响应的`[DONE]`后不会再读到EOF就关闭响应，因此关闭时收到过结束标记也视为完整。
+    """
+    def __init__(
+        self,
+        cassette: LLMCassette,
+        response: httpx.Response,
+        episode: Dict[str, Any],
+        start: float
+    ) -> None:
+        self.cassette: LLMCassette = cassette
+        self.response: httpx.Response = response
+        self.episode: Dict[str, Any] = episode
+        self.start: float = start
+        self.complete: bool = False
+        self.saved: bool = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        # 多字节字符可能被拆在两块之间，未完整的字节并入下一块记录
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chunks: List[List[Any]] = self.episode["chunks"]
+        async for data in self.response.aiter_raw():
+            text: str = decoder.decode(data)
+            if text:
+                chunks.append([round((time.perf_counter() - self.start) * 1000, 1), text])
+            yield data
+        tail: str = decoder.decode(b"", final=True)
+        if tail:
+            chunks.append([round((time.perf_counter() - self.start) * 1000, 1), tail])
+        self.complete = True
+        self._save()
+
+    def _save(self) -> None:
+        """私有函数：只录制完整读完的响应；中途断开的流不会被写入。"""
+        if self.saved:
+            return
+        chunks: List[List[Any]] = self.episode["chunks"]
+        if self.complete or (chunks and chunks[-1][1].rstrip().endswith(_SSE_DONE)):
+            self.saved = True
+            self.cassette.add(self.episode)
+
+    async def aclose(self) -> None:
+        self._save()
+        await self.response.aclose()
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """私有类：按录制的时间线输出响应体。"""
+    def __init__(self, cassette: LLMCassette, chunks: List[List[Any]], start: float) -> None:
+        self.cassette: LLMCassette = cassette
+        self.chunks: List[List[Any]] = chunks
+        self.start: float = start
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for offset_ms, text in self.chunks:
+            await self.cassette.wait_until(self.start, offset_ms)
+            yield text.encode("utf-8")
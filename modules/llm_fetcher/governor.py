@@ -0,0 +1,268 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+import openai
+
+from modules.redisman import RedisManager
+
+
+# 集群共享的令牌桶，时间取自Redis服务端，避免各worker时钟不一致。
+# 返回需要等待的秒数（字符串，Lua数字返回给客户端时会被截断为整数），为"0"时表示已取得令牌。
+# KEYS[1]: 令牌桶  ARGV[1]: 每秒补充的令牌数  ARGV[2]: 桶容量
+_TOKEN_BUCKET_SCRIPT: str = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# 可以重试的上游状态码
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMRateLimitedError(RuntimeError):
+    """在最长排队时间内没有取得LLM调用名额。"""
+    def __init__(self, message: str = "LLM is busy, please retry later", retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after: float = retry_after
+
+
+class LLMGovernor:
+    """
+    LLM调用的并发与速率控制器。
+    - worker内：信号量限制同时进行的LLM请求数（流式请求在整个读取期间占用名额）。
+    - 集群内（提供Redis且`rate_per_second`大于0时）：所有worker共享一个令牌桶，限制每秒发起的请求数。
+    - 排队超过`max_wait`仍未取得名额时抛出`LLMRateLimitedError`，而不是无限等待。
+    - 上游返回429/5xx时按`Retry-After`（若有）或指数退避加随机抖动重试，最多`max_retries`次。
+    - `snapshot`返回排队深度、等待时间等指标。
+    """
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        redis_manager: Optional[RedisManager] = None,
+        rate_per_second: float = 0.0,
+        burst: int = 10,
+        max_wait: float = 30.0,
+        max_retries: int = 3,
+        base_backoff: float = 0.5,
+        max_backoff: float = 20.0,
+        bucket_key: str = "llm:bucket"
+    ) -> None:
+        """
+        初始化控制器。
+
+        Args:
+            max_concurrency (int): 每个worker同时进行的最大LLM请求数。
+            redis_manager (Optional[RedisManager]): Redis管理器，为None时不启用集群令牌桶。
+            rate_per_second (float): 集群每秒最多发起的请求数，为0时不启用令牌桶。
+            burst (int): 令牌桶容量，即允许的瞬时突发请求数。
+            max_wait (float): 排队等待名额的最长时间（秒）。
+            max_retries (int): 上游限流或出错时的最大重试次数。
+            base_backoff (float): 指数退避的初始间隔（秒）。
+            max_backoff (float): 单次退避的最长间隔（秒）。
+            bucket_key (str): 令牌桶在Redis中的键。
+        """
+        self.max_concurrency: int = max_concurrency
+        self.redis_manager: Optional[RedisManager] = redis_manager
+        self.rate_per_second: float = rate_per_second
+        self.burst: int = burst
+        self.max_wait: float = max_wait
+        self.max_retries: int = max_retries
+        self.base_backoff: float = base_backoff
+        self.max_backoff: float = max_backoff
+        self.bucket_key: str = bucket_key
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # 指标
+        self._waiting: int = 0
+        self._in_flight: int = 0
+        self._acquired_total: int = 0
+        self._rejected_total: int = 0
+        self._retries_total: int = 0
+        self._wait_total: float = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1024)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        占用一个LLM调用名额，退出上下文时归还。
+
+        Raises:
+            LLMRateLimitedError: 在`max_wait`内没有取得名额。
+        """
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            assert self._semaphore is not None
+            self._semaphore.release()
+
+    async def _acquire(self) -> None:
+        """私有函数：依次取得worker内的并发名额和集群令牌桶中的令牌。"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        start: float = loop.time()
+        deadline: float = start + self.max_wait
+        self._waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._rejected_total += 1
+                raise LLMRateLimitedError(retry_after=self.base_backoff)
+
+            try:
+                await self._take_token(deadline)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self._waiting -= 1
+
+        waited: float = loop.time() - start
+        self._in_flight += 1
+        self._acquired_total += 1
+        self._wait_total += waited
+        self._recent_waits.append(waited)
+
+    async def _take_token(self, deadline: float) -> None:
+        """私有函数：从集群令牌桶中取得一个令牌；Redis不可用时放行。"""
+        if self.redis_manager is None or self.rate_per_second <= 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                wait = float(await self.redis_manager.eval_script(
+                    _TOKEN_BUCKET_SCRIPT, [self.bucket_key], [self.rate_per_second, self.burst]
+                ))
+            except Exception as exc:
+                print(f"LLMGovernor: 令牌桶不可用，直接放行: {exc!r}")
+                return
+            if wait <= 0:
+                return
+            if loop.time() + wait > deadline:
+                self._rejected_total += 1
+                raise LLMRateLimitedError(retry_after=wait)
+            # 加一点抖动，避免多个等待者同时醒来再次争抢
+            await asyncio.sleep(wait + random.uniform(0, wait / 2))
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], hold_slot: bool = True) -> Any:
+        """
+        在名额内执行一次上游请求，遇到可重试的错误时退避后重试。
+
+        Args:
+            fn (Callable[[], Awaitable[Any]]): 发起上游请求的无参函数。
+            hold_slot (bool): 是否在执行期间占用名额；调用方已经在`slot`内时传入False。
+
+        Returns:
+            (Any): `fn`的返回值。
+        """
+        attempt: int = 0
+        while True:
+            try:
+                if hold_slot:
+                    async with self.slot():
+                        return await fn()
+                return await fn()
+            except Exception as exc:
+                delay: Optional[float] = self.retry_delay(exc, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._retries_total += 1
+                await asyncio.sleep(delay)
+
+    def retry_delay(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """
+        计算重试前需要等待的时间。
+
+        Args:
+            exc (BaseException): 上游请求抛出的异常。
+            attempt (int): 已经重试的次数。
+
+        Returns:
+            (Optional[float]): 等待秒数；不可重试时返回None。
+        """
+        if isinstance(exc, openai.APIStatusError):
+            if exc.status_code not in _RETRYABLE_STATUS:
+                return None
+            retry_after: Optional[float] = _parse_retry_after(exc.response.headers)
+            if retry_after is not None:
+                return min(self.max_backoff, retry_after) + random.uniform(0, self.base_backoff)
+        elif not isinstance(exc, openai.APIConnectionError):
+            return None
+
+        # 指数退避加全抖动
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        返回当前worker的指标快照。
+
+        Returns:
+            (Dict[str, Any]): 排队深度、进行中的请求数、累计计数与等待时间统计（毫秒）。
+        """
+        waits = sorted(self._recent_waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "acquired_total": self._acquired_total,
+            "rejected_total": self._rejected_total,
+            "retries_total": self._retries_total,
+            "wait_ms_avg": round(self._wait_total / self._acquired_total * 1000, 2) if self._acquired_total else 0.0,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 2) if waits else 0.0,
+            "rate_per_second": self.rate_per_second,
+        }
+
+
+def _parse_retry_after(headers: Any) -> Optional[float]:
+    """私有函数：解析`retry-after-ms`或`Retry-After`（秒数或HTTP日期）。"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
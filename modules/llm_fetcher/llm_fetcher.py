@@ -1,45 +1,98 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, NOT_GIVEN
 from openai.types.chat import ChatCompletion
+import httpx
 
 import asyncio
-from typing import Callable, Optional, AsyncGenerator, List, Dict
+from typing import Callable, Optional, AsyncGenerator, List, Dict, Tuple
 
 from routes.models.ai_llm_models import LLMContext  # 上下文内容
+from .response_cache import LLMResponseCache
+from .governor import LLMGovernor
+from .streaming import LLMStreamEvent
+from .cassette import LLMCassette
 
 class LLMFetcher:
     def __init__(
         self,
         api_url: str,
         api_key: str,
-        model: str
+        model: str,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        http_client: Optional[httpx.AsyncClient] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        governor: Optional[LLMGovernor] = None,
+        cassette: Optional[LLMCassette] = None
     ) -> None:
         """
         初始化LLM上下文管理器。
+        - 所有请求共用同一个`httpx.AsyncClient`（即同一个keep-alive连接池），同一worker内应只创建一个实例。
         
         Args:
             api_url (str): 对应平台的API链接。
             api_key (str): 对应平台的API密钥。
             model (str): 对应平台的模型。
+            connect_timeout (float): 建立连接的超时时间（秒）。
+            read_timeout (float): 两次读取之间的超时时间（秒），流式输出时即为相邻两个块的最大间隔。
+            max_connections (int): 连接池的最大连接数。
+            max_keepalive_connections (int): 连接池中保持空闲的最大连接数。
+            http_client (Optional[httpx.AsyncClient]): 外部传入的HTTP客户端，为None时自动创建。
+            response_cache (Optional[LLMResponseCache]): 回答缓存；为None时`use_cache`参数不生效。
+            governor (Optional[LLMGovernor]): 并发与速率控制器；提供时由它负责重试，SDK自身不再重试。
+            cassette (Optional[LLMCassette]): 录制/重放磁带，只作用于自动创建的HTTP客户端；
+                传入`http_client`时请自行使用`cassette.transport(...)`。
         """
         self.api_url = api_url
         self.api_key = api_key
         self.model = model
 
+        self.timeout: httpx.Timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        limits: httpx.Limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.cassette: Optional[LLMCassette] = cassette
+        if http_client is None and cassette is not None:
+            http_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=cassette.transport(httpx.AsyncHTTPTransport(limits=limits))
+            )
+        self.http_client: httpx.AsyncClient = http_client or httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=limits
+        )
+
+        self.response_cache: Optional[LLMResponseCache] = response_cache
+        self.governor: Optional[LLMGovernor] = governor
+
         # 创建上下文。
-        self.context: OpenAI = self._init_context()
+        self.context: AsyncOpenAI = self._init_context()
 
-    def _init_context(self) -> OpenAI:
-        return OpenAI(
+    def _init_context(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
             api_key=self.api_key, 
-            base_url=self.api_url
+            base_url=self.api_url,
+            timeout=self.timeout,
+            http_client=self.http_client,
+            # 由控制器统一退避重试，避免SDK的重试绕过排队与限流
+            max_retries=0 if self.governor is not None else 2
         )
+
+    async def aclose(self) -> None:
+        """
+        关闭底层的HTTP连接池。应在worker退出时调用。
+        """
+        await self.http_client.aclose()
     
-    def fetch(
+    async def fetch(
         self,
         msg: str,
         system_prompt: Optional[str] = None,
         temperature: float = 0.4,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        use_cache: bool = False
     ) -> ChatCompletion:
         """
         和LLM之间对话。
@@ -49,20 +102,40 @@ class LLMFetcher:
             system_prompt (str): 系统提示词。
             temperature (float): 当前温度。
             max_tokens (int): 最大token数量。
+            use_cache (bool): 是否使用回答缓存（需要配置`response_cache`）。
         """
         if not system_prompt:
             system_prompt = ""
 
-        response = self.context.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": msg},
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=False
-        )
+        messages: List[Dict[str, str]] = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": msg},
+        ]
+
+        cache_key: Optional[str] = None
+        if use_cache and self.response_cache is not None:
+            cache_key = self.response_cache.make_key(
+                "completion", self.model, messages, temperature=temperature, max_tokens=max_tokens
+            )
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached)
+
+        async def request() -> ChatCompletion:
+            return await self.context.chat.completions.create(
+                model=self.model,
+                messages=messages,  # type: ignore
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=False
+            )
+
+        if self.governor is not None:
+            response = await self.governor.call(request)
+        else:
+            response = await request()
+        if cache_key is not None and self.response_cache is not None:
+            await self.response_cache.set(cache_key, response.model_dump(mode="json"))
         return response
     
     async def fetch_stream(
@@ -72,13 +145,15 @@ class LLMFetcher:
         system_prompt: Optional[str] = None,
         temperature: float = 0.4,
         max_tokens: int = 4096,
-        output_reasoning: bool = False
+        output_reasoning: bool = False,
+        usage: Optional[Dict[str, int]] = None,
+        use_cache: bool = False
     ) -> AsyncGenerator[str, None]:
         """
-        流式对话方法。使用示例：
+        流式对话方法。读取过程不会阻塞事件循环。使用示例：
         ```
-        llm = LLMFetcher("your_key", "your_api")
-        async with llm.fetch_stream("早安喵") as chunk:
+        llm = LLMFetcher("your_api", "your_key", "your_model")
+        async for chunk in llm.fetch_stream("早安喵"):
             print(chunk, end="", flush=True)
         ```
 
@@ -89,7 +164,68 @@ class LLMFetcher:
             temperature: 当前温度。
             max_tokens: 最大token数量。
             output_reasoning: 是否输出正在思考的内容。
+            usage: 传入一个字典时，流结束后会写入平台返回的`prompt_tokens`与`completion_tokens`。
+            use_cache: 是否使用回答缓存（需要配置`response_cache`）。命中时逐块重放缓存的输出；
+                未命中时只有完整读完的流才会被缓存。
         """
+        payload: List[Dict[str, str]] = self._build_payload(msg, prev_messages, system_prompt)
+
+        if not use_cache or self.response_cache is None:
+            async for chunk in self._stream_upstream(payload, temperature, max_tokens, output_reasoning, usage):
+                yield chunk
+            return
+
+        cache_key: str = self.response_cache.make_key(
+            "stream", self.model, payload,
+            temperature=temperature, max_tokens=max_tokens, output_reasoning=output_reasoning
+        )
+        cached = await self.response_cache.get(cache_key)
+        if cached is not None:
+            if usage is not None:
+                usage.update(cached.get("usage") or {})
+            for chunk in cached["chunks"]:
+                yield chunk
+            return
+
+        # 未命中：边转发边记录，流正常结束后写入缓存。
+        chunks: List[str] = []
+        stream_usage: Dict[str, int] = {} if usage is None else usage
+        async for chunk in self._stream_upstream(payload, temperature, max_tokens, output_reasoning, stream_usage):
+            chunks.append(chunk)
+            yield chunk
+        await self.response_cache.set(cache_key, {"chunks": chunks, "usage": stream_usage})
+
+    async def fetch_stream_events(
+        self,
+        msg: str,
+        prev_messages: Optional[List[LLMContext]] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.4,
+        max_tokens: int = 4096,
+        output_reasoning: bool = True,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncGenerator[LLMStreamEvent, None]:
+        """
+        流式对话方法，按类型输出事件而不是混入标记的文本。
+        - 只产出"reasoning"与"content"事件，其余事件由调用方补充。
+        - 不使用回答缓存；提前关闭生成器时会立即关闭上游连接。
+
+        Args:
+            参数含义同`fetch_stream`。
+        """
+        payload: List[Dict[str, str]] = self._build_payload(msg, prev_messages, system_prompt)
+        async for kind, text in self._stream_deltas(payload, temperature, max_tokens, usage):
+            if kind == "reasoning" and not output_reasoning:
+                continue
+            yield LLMStreamEvent(kind, text)
+
+    def _build_payload(
+        self,
+        msg: str,
+        prev_messages: Optional[List[LLMContext]],
+        system_prompt: Optional[str]
+    ) -> List[Dict[str, str]]:
+        """私有函数：拼接系统提示词、历史上下文与本轮用户输入。"""
         if not system_prompt:
             system_prompt = ""
         
@@ -103,34 +239,98 @@ class LLMFetcher:
 
         # 再放本轮用户输入
         messages.append(LLMContext("user", msg))
+        return [{"role": m.role, "content": m.content} for m in messages]
 
-        response = self.context.chat.completions.create(
-            model=self.model,
-            messages=[{"role": m.role, "content": m.content} for m in messages],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=True,
-            stream_options={}
-        )
+    async def _stream_upstream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        output_reasoning: bool,
+        usage: Optional[Dict[str, int]]
+    ) -> AsyncGenerator[str, None]:
+        """
+        私有函数：向平台发起流式请求并逐块输出文本，思考内容用标记包围。
+        """
         in_thinking: bool = False
+        async for kind, text in self._stream_deltas(messages, temperature, max_tokens, usage):
+            if kind == "reasoning":
+                if not output_reasoning:
+                    continue
+                if in_thinking == False:
+                    yield f"\n<<<THINKING>>>\n"
+                    in_thinking = True
+                yield text
+            else:
+                if in_thinking:
+                    yield f"\n<<<THINK_END>>>\n"
+                    in_thinking = False
+                yield text
+
+    async def _stream_deltas(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        usage: Optional[Dict[str, int]]
+    ) -> AsyncGenerator[Tuple[str, str], None]:
+        """
+        私有函数：向平台发起流式请求，逐块输出`("reasoning" | "content", 文本)`。
+        - 有控制器时，整个读取过程都占用一个名额；只有建立流之前的错误会被重试。
+        """
+        if self.governor is None:
+            async for delta in self._read_stream(messages, temperature, max_tokens, usage):
+                yield delta
+            return
+
+        async with self.governor.slot():
+            async for delta in self._read_stream(messages, temperature, max_tokens, usage):
+                yield delta
+
+    async def _read_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        usage: Optional[Dict[str, int]]
+    ) -> AsyncGenerator[Tuple[str, str], None]:
+        """私有函数：建立流并解析每个块。"""
+        async def request():
+            return await self.context.chat.completions.create(
+                model=self.model,
+                messages=messages,  # type: ignore
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                # 不需要用量时不发送该字段，部分OpenAI兼容平台不接受空的stream_options
+                stream_options={"include_usage": True} if usage is not None else NOT_GIVEN
+            )
+
+        if self.governor is not None:
+            response = await self.governor.call(request, hold_slot=False)
+        else:
+            response = await request()
 
-        for chunk in response:
-            delta = chunk.choices[0].delta
+        try:
+            async for chunk in response:
+                if usage is not None and chunk.usage is not None:
+                    usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                    usage["completion_tokens"] = chunk.usage.completion_tokens
 
-            if hasattr(delta, "reasoning_content"):
-                # 这俩东西都是可用的
-                if chunk.choices[0].delta.reasoning_content:            # type: ignore
-                    if output_reasoning:
-                        if in_thinking == False:
-                            yield f"\n<<<THINKING>>>\n"
-                            in_thinking = True
-                        yield chunk.choices[0].delta.reasoning_content      # type: ignore
+                # 部分平台会发送不含choices的块（例如用量统计）
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
 
-                if chunk.choices[0].delta.content:
-                    if in_thinking:
-                        yield f"\n<<<THINK_END>>>\n"
-                        in_thinking = False
-                    yield chunk.choices[0].delta.content
+                # 只有推理模型才会带有reasoning_content
+                reasoning: Optional[str] = getattr(delta, "reasoning_content", None)
+                if reasoning:
+                    yield "reasoning", reasoning
+                if delta.content:
+                    yield "content", delta.content
+        finally:
+            # 客户端断开或提前退出时，及时把连接归还连接池。
+            await response.close()
 
 async def chat_test():
     llm = LLMFetcher(
@@ -153,6 +353,7 @@ async def chat_test():
         max_tokens=8192
     ):
         print(chunk, end="", flush=True)
+    await llm.aclose()
 
 if __name__ == "__main__":
     try:
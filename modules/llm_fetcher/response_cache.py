@@ -0,0 +1,118 @@
+from typing import Any, Dict, Optional, Sequence
+import hashlib
+import json
+import time
+
+from modules.redisman import RedisManager
+
+
+# 写入一条缓存并维护按写入时间排序的索引，超出条数上限时淘汰最旧的条目。
+# KEYS[1]: 条目键  KEYS[2]: 索引ZSET
+# ARGV[1]: 值  ARGV[2]: 过期时间（秒）  ARGV[3]: 当前时间戳  ARGV[4]: 最大条目数
+_STORE_SCRIPT: str = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]))
+local overflow = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if overflow > 0 then
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, overflow - 1)
+    redis.call('DEL', unpack(oldest))
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, overflow - 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+class LLMResponseCache:
+    """
+    LLM回答的精确匹配缓存，存放在Redis中。
+    - 键为模型、系统提示词、消息列表与采样参数的规范化JSON的SHA-256，参数完全相同才会命中。
+    - 每条缓存都有过期时间；超过`max_entry_bytes`的回答不缓存；总条目数超过`max_entries`时淘汰最早写入的条目。
+    - 流式回答按块缓存，命中时可以逐块重放。
+    - Redis出错时视为未命中，不影响正常请求。
+    """
+    def __init__(
+        self,
+        redis_manager: RedisManager,
+        ttl: int = 3600,
+        max_entry_bytes: int = 256 * 1024,
+        max_entries: int = 10000,
+        prefix: str = "llm:resp"
+    ) -> None:
+        """
+        初始化缓存。
+
+        Args:
+            redis_manager (RedisManager): Redis管理器。
+            ttl (int): 每条缓存的过期时间（秒）。
+            max_entry_bytes (int): 单条缓存的最大字节数。
+            max_entries (int): 缓存条目数上限。
+            prefix (str): 键前缀。
+        """
+        self.redis_manager: RedisManager = redis_manager
+        self.ttl: int = ttl
+        self.max_entry_bytes: int = max_entry_bytes
+        self.max_entries: int = max_entries
+        self.prefix: str = prefix
+
+    def make_key(
+        self,
+        kind: str,
+        model: str,
+        messages: Sequence[Dict[str, str]],
+        **params: Any
+    ) -> str:
+        """
+        计算缓存键。
+
+        Args:
+            kind (str): 回答类型（"completion"或"stream"），两者分开缓存。
+            model (str): 模型名。
+            messages (Sequence[Dict[str, str]]): 完整的消息列表（含系统提示词）。
+            **params: 其余会影响输出的参数，如temperature、max_tokens。
+
+        Returns:
+            (str): Redis键。
+        """
+        payload: str = json.dumps(
+            {"model": model, "messages": list(messages), "params": params},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        digest: str = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{kind}:{digest}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取一条缓存。
+
+        Returns:
+            Optional[Dict[str, Any]]: 缓存内容；未命中或出错时返回None。
+        """
+        try:
+            value = await self.redis_manager.get(key)
+        except Exception as exc:
+            print(f"LLM缓存读取失败: {exc!r}")
+            return None
+        return value if isinstance(value, dict) else None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> bool:
+        """
+        写入一条缓存。
+
+        Returns:
+            bool: 是否写入；超过单条大小上限或出错时返回False。
+        """
+        encoded: str = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        if len(encoded.encode("utf-8")) > self.max_entry_bytes:
+            return False
+        try:
+            await self.redis_manager.eval_script(
+                _STORE_SCRIPT,
+                [key, f"{self.prefix}:index"],
+                [encoded, self.ttl, int(time.time()), self.max_entries]
+            )
+            return True
+        except Exception as exc:
+            print(f"LLM缓存写入失败: {exc!r}")
+            return False
@@ -0,0 +1,222 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, List, Optional, TypeVar, Union
+
+
+T = TypeVar("T")
+
+# SSE注释行，客户端（EventSource）会忽略它，仅用于保活与尽早发现断开的连接。
+SSE_HEARTBEAT: str = ": ping\n\n"
+
+
+@dataclass
+class LLMStreamEvent:
+    """
+    流式对话中的一个事件。
+    - event: "reasoning"（思考内容）、"content"（回答内容）、"task_created"（根据回答创建了任务）、
+        "tasks_discarded"（之前推送的任务已撤销，附带任务ID）、"done"（结束，附带用量）或"error"（出错）。
+    - data: 事件内容，文本或可以被JSON序列化的对象。
+    """
+    event: str
+    data: Any
+
+    def encode(self) -> str:
+        """
+        编码为一条SSE消息。
+
+        Returns:
+            (str): `event: ...\\ndata: ...\\n\\n`格式的文本，data为JSON。
+        """
+        payload: str = json.dumps(self.data, ensure_ascii=False, default=str)
+        return f"event: {self.event}\ndata: {payload}\n\n"
+
+
+class BoundedTextBuffer:
+    """
+    有上限的文本缓冲区，用于收集流式回答。
+    - 追加为O(1)，读取时才拼接；超出`max_chars`的部分被丢弃并记录`truncated`。
+    """
+    def __init__(self, max_chars: int) -> None:
+        """
+        初始化缓冲区。
+
+        Args:
+            max_chars (int): 最多保留的字符数。
+        """
+        self.max_chars: int = max_chars
+        self.truncated: bool = False
+        self._parts: List[str] = []
+        self._length: int = 0
+
+    def append(self, text: str) -> None:
+        """追加一段文本，超出上限的部分被丢弃。"""
+        room: int = self.max_chars - self._length
+        if len(text) > room:
+            self.truncated = True
+            text = text[:max(0, room)]
+        if text:
+            self._parts.append(text)
+            self._length += len(text)
+
+    def getvalue(self) -> str:
+        """返回已收集的文本。"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self) -> int:
+        return self._length
+
+
+async def with_heartbeat(
+    source: AsyncIterator[T],
+    interval: float,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    poll_interval: float = 1.0
+) -> AsyncGenerator[Optional[T], None]:
+    """
+    转发`source`的元素；超过`interval`秒没有新元素时产出一个None，由调用方发送心跳。
+    - 提供`is_disconnected`时，等待期间每隔`poll_interval`秒检查一次客户端是否已断开，
+        断开后立即停止，并取消`source`（即取消上游请求）。
+    - `source`抛出异常时先输出已缓存的内容，再抛出该异常；无论以何种方式结束，都会关闭`source`。
+
+    Args:
+        source (AsyncIterator[T]): 数据源。
+        interval (float): 心跳间隔（秒）。
+        is_disconnected (Optional[Callable[[], Awaitable[bool]]]): 检查客户端是否断开的函数。
+        poll_interval (float): 检查断开的间隔（秒）。
+    """
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Future] = None
+    try:
+        last_output: float = loop.time()
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(source.__anext__())
+
+            timeout: float = max(0.0, last_output + interval - loop.time())
+            if is_disconnected is not None:
+                timeout = min(timeout, poll_interval)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if done:
+                future, pending = pending, None
+                try:
+                    item = future.result()
+                except StopAsyncIteration:
+                    return
+                last_output = loop.time()
+                yield item
+                continue
+
+            if is_disconnected is not None and await is_disconnected():
+                return
+            if loop.time() >= last_output + interval:
+                last_output = loop.time()
+                yield None
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[Union[str, LLMStreamEvent]],
+    max_bytes: int = 512,
+    max_delay: float = 0.05
+) -> AsyncGenerator[Union[str, LLMStreamEvent], None]:
+    """
+    合并流式输出中细碎的块，减少每个块一次的socket写入。
+    - 第一个块立即输出，不影响首字节时间；之后的块先缓存，累计达到`max_bytes`字节
+        或距缓存第一个块已过`max_delay`秒时（先到者为准）合并输出。
+    - 文本块直接拼接；事件只合并相邻且类型相同的文本事件，类型变化时先输出已缓存的内容，保证顺序不变。
+    - `source`抛出异常时先输出已缓存的内容，再抛出该异常；无论以何种方式结束，都会关闭`source`。
+
+    Args:
+        source (AsyncIterator[Union[str, LLMStreamEvent]]): `fetch_stream`或`fetch_stream_events`的输出。
+        max_bytes (int): 触发输出的累计字节数（UTF-8）。
+        max_delay (float): 缓存的最长时间（秒）。
+    """
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Future] = None
+    parts: List[str] = []
+    size: int = 0
+    kind: Optional[str] = None  # 缓存中内容的事件类型；文本块为None
+    deadline: float = 0.0
+    first: bool = True
+
+    def flush() -> Union[str, LLMStreamEvent]:
+        nonlocal parts, size
+        text: str = "".join(parts)
+        parts, size = [], 0
+        return text if kind is None else LLMStreamEvent(kind, text)
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(source.__anext__())
+            if parts:
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - loop.time()))
+                if not done:
+                    yield flush()
+                    continue
+            else:
+                await asyncio.wait({pending})
+
+            future, pending = pending, None
+            try:
+                item = future.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # 数据源出错：先输出已缓存的内容，再向外抛出
+                if parts:
+                    yield flush()
+                raise
+
+            if first:
+                first = False
+                yield item
+                continue
+
+            if isinstance(item, LLMStreamEvent):
+                if not isinstance(item.data, str):
+                    if parts:
+                        yield flush()
+                    yield item
+                    continue
+                item_kind: Optional[str] = item.event
+                text = item.data
+            else:
+                item_kind = None
+                text = item
+
+            if parts and item_kind != kind:
+                yield flush()
+            if not parts:
+                kind = item_kind
+                deadline = loop.time() + max_delay
+            parts.append(text)
+            size += len(text.encode("utf-8"))
+            if size >= max_bytes:
+                yield flush()
+
+        if parts:
+            yield flush()
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,21 @@
+from typing import Optional
+
+# 每条消息在对话格式中的额外开销（角色、分隔符等）
+MESSAGE_TOKEN_OVERHEAD: int = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    粗略估算一段文本的token数，不依赖具体模型的分词器。
+    - 按UTF-8字节数的1/3估算：英文约每3个字符1个token，中文约每个字1个token，整体偏保守。
+    - 与`get_context`中SQL的估算公式`(octet_length(content) + 2) / 3 + 4`保持一致。
+
+    Args:
+        text (Optional[str]): 文本内容。
+
+    Returns:
+        (int): 估算的token数（含单条消息的固定开销）。
+    """
+    if not text:
+        return MESSAGE_TOKEN_OVERHEAD
+    return (len(text.encode("utf-8")) + 2) // 3 + MESSAGE_TOKEN_OVERHEAD
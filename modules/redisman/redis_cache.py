@@ -1,6 +1,6 @@
 import redis
 import redis.asyncio as ario
-from typing import Any, Optional, Dict, Union
+from typing import Any, Optional, Dict, List, Sequence, Union
 import json
 import pickle
 import asyncio
@@ -33,6 +33,8 @@ class RedisManager:
         """
         self.redis_pool: Optional[ario.ConnectionPool] = None
         self.redis_client: Optional[ario.Redis] = None
+        # 已注册的Lua脚本
+        self._scripts: Dict[str, Any] = {}
 
         # redis连接池参数
         self.host: str = host
@@ -94,6 +96,7 @@ class RedisManager:
             await self.redis_pool.disconnect()
             self.redis_pool = None
         self.redis_client = None
+        self._scripts = {}
 
     async def set(self, key: str, value: Any, expire: Optional[int] = None, serialize: str = "json") -> bool:
         """
@@ -251,4 +254,69 @@ class RedisManager:
             async for key in self.redis_client.scan_iter(match=pattern):
                 yield key
         except Exception as e:
-            print(f"Redis scan iter error: {e}")
\ No newline at end of file
+            print(f"Redis scan iter error: {e}")
+
+    async def list_range(self, key: str, start: int = 0, end: int = -1) -> List[Any]:
+        """
+        获取列表中指定区间的元素
+        
+        Args:
+            key: 键
+            start: 起始下标
+            end: 结束下标（包含），-1表示到末尾
+            
+        Returns:
+            List[Any]: 区间内的元素，键不存在时为空列表
+
+        Raises:
+            与其他方法不同，Redis出错时直接抛出异常，由调用方决定如何降级。
+        """
+        if not self.redis_client:
+            raise RuntimeError("Redis client not initialized. Call init_pool() first.")
+            
+        return await self.redis_client.lrange(key, start, end)
+
+    async def eval_script(self, script: str, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        """
+        原子地执行一段Lua脚本
+        - 脚本会按SHA缓存在服务端（EVALSHA），重复执行时不必重复传输脚本内容。
+        
+        Args:
+            script: Lua脚本
+            keys: 脚本中的KEYS
+            args: 脚本中的ARGV
+            
+        Returns:
+            Any: 脚本的返回值
+
+        Raises:
+            Redis出错时直接抛出异常，由调用方决定如何降级。
+        """
+        if not self.redis_client:
+            raise RuntimeError("Redis client not initialized. Call init_pool() first.")
+            
+        registered = self._scripts.get(script)
+        if registered is None:
+            registered = self.redis_client.register_script(script)
+            self._scripts[script] = registered
+        return await registered(keys=list(keys), args=list(args))
+
+    async def set_nx(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
+        """
+        仅当键不存在时设置键值对（SET NX），可用作简单的分布式锁
+        
+        Args:
+            key: 键
+            value: 值（按原样写入，不做序列化）
+            expire: 过期时间(秒)
+            
+        Returns:
+            bool: 是否设置成功（键已存在时为False）
+
+        Raises:
+            Redis出错时直接抛出异常，由调用方决定如何降级。
+        """
+        if not self.redis_client:
+            raise RuntimeError("Redis client not initialized. Call init_pool() first.")
+            
+        return bool(await self.redis_client.set(key, value, nx=True, ex=expire))
@@ -0,0 +1,123 @@
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from modules.redisman import RedisManager
+
+
+# 只有锁仍属于自己时才释放，避免误删其他worker在锁过期后重新获取的锁。
+# KEYS[1]: 锁  ARGV[1]: 加锁时写入的令牌
+_RELEASE_SCRIPT: str = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：同一个键同时只执行一次，所有调用方共享同一个结果。
+    - worker内：同一个键的调用方等待同一个asyncio任务；调用方取消不会影响其他调用方。
+    - 跨worker（提供Redis时）：用`SET NX`加锁，持锁者执行后把结果写入结果键，
+        其他worker轮询结果键；持锁者失败时锁被释放，等待者会尝试自己获取锁并执行。
+    - 结果键在`result_ttl`内保留，期间到达的重复请求（例如前端重试）直接得到该结果。
+    - 跨worker共享的结果必须可以被JSON序列化；Redis不可用时退化为只在worker内合并。
+
+    使用示例：
+    ```
+    flight = SingleFlight(redis_manager)
+    result = await flight.do("decompose:user:goal-hash", lambda: service.run(...))
+    ```
+    """
+    def __init__(
+        self,
+        redis_manager: Optional[RedisManager] = None,
+        lock_ttl: int = 300,
+        result_ttl: int = 30,
+        wait_timeout: float = 300.0,
+        poll_interval: float = 0.2,
+        prefix: str = "sf"
+    ) -> None:
+        """
+        初始化。
+
+        Args:
+            redis_manager (Optional[RedisManager]): Redis管理器，为None时只在worker内合并。
+            lock_ttl (int): 跨worker锁的过期时间（秒），应大于单次执行的最长耗时。
+            result_ttl (int): 结果键的保留时间（秒）。
+            wait_timeout (float): 等待其他worker结果的最长时间（秒），超时后自行执行。
+            poll_interval (float): 轮询结果键的间隔（秒）。
+            prefix (str): 键前缀。
+        """
+        self.redis_manager: Optional[RedisManager] = redis_manager
+        self.lock_ttl: int = lock_ttl
+        self.result_ttl: int = result_ttl
+        self.wait_timeout: float = wait_timeout
+        self.poll_interval: float = poll_interval
+        self.prefix: str = prefix
+
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行`fn`，或等待正在执行的相同请求的结果。
+
+        Args:
+            key (str): 请求的唯一键，参数完全相同的请求应得到相同的键。
+            fn (Callable[[], Awaitable[Any]]): 返回协程的无参函数。
+
+        Returns:
+            (Any): `fn`的返回值；执行失败时所有worker内的调用方都会收到同一个异常。
+        """
+        task: Optional[asyncio.Task] = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._execute(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        # shield：某个调用方被取消时，共享的任务继续执行。
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        """私有函数：任务结束后移出在途表。"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 所有调用方都已离开时，避免出现“异常未被获取”的警告。
+            task.exception()
+
+    async def _execute(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """私有函数：跨worker加锁执行，或等待其他worker的结果。"""
+        if self.redis_manager is None:
+            return await fn()
+
+        lock_key: str = f"{self.prefix}:lock:{key}"
+        result_key: str = f"{self.prefix}:result:{key}"
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + self.wait_timeout
+
+        while True:
+            token: str = uuid.uuid4().hex
+            try:
+                cached = await self.redis_manager.get(result_key)
+                if isinstance(cached, dict) and "value" in cached:
+                    return cached["value"]
+                acquired: bool = await self.redis_manager.set_nx(lock_key, token, self.lock_ttl)
+            except Exception as exc:
+                print(f"SingleFlight: Redis不可用，直接执行: {exc!r}")
+                return await fn()
+
+            if acquired:
+                try:
+                    value = await fn()
+                    await self.redis_manager.set(result_key, {"value": value}, expire=self.result_ttl)
+                    return value
+                finally:
+                    try:
+                        await self.redis_manager.eval_script(_RELEASE_SCRIPT, [lock_key], [token])
+                    except Exception as exc:
+                        print(f"SingleFlight: 释放锁失败，等待其过期: {exc!r}")
+
+            if loop.time() >= deadline:
+                return await fn()
+            await asyncio.sleep(self.poll_interval)
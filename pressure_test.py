@@ -1,8 +1,9 @@
 # async_pressure.py
+import argparse
 import asyncio
 import time
 import statistics
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
 
 import httpx
 from tqdm import tqdm
@@ -12,28 +13,56 @@ class AsyncPressureTester:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
 
-    async def _single_request(self, client: httpx.AsyncClient, endpoint: str, sem: asyncio.Semaphore) -> Dict:
+    async def _single_request(
+        self,
+        client: httpx.AsyncClient,
+        endpoint: str,
+        sem: asyncio.Semaphore,
+        payload: Optional[Dict[str, Any]] = None,
+        stream: bool = False
+    ) -> Dict:
+        """payload不为None时发送POST；stream为True时逐块读取响应并记录首字节时间。"""
         async with sem:
             start = time.perf_counter()
+            ttfb_ms: Optional[float] = None
             try:
-                resp = await client.get(f"{self.base_url}{endpoint}")
+                method = "GET" if payload is None else "POST"
+                if stream:
+                    async with client.stream(method, f"{self.base_url}{endpoint}", json=payload) as resp:
+                        async for _ in resp.aiter_raw():
+                            if ttfb_ms is None:
+                                ttfb_ms = (time.perf_counter() - start) * 1000
+                        status_code = resp.status_code
+                else:
+                    resp = await client.request(method, f"{self.base_url}{endpoint}", json=payload)
+                    status_code = resp.status_code
                 elapsed_ms = (time.perf_counter() - start) * 1000
                 return {
-                    "status_code": resp.status_code,
+                    "status_code": status_code,
                     "response_time_ms": elapsed_ms,
-                    "success": resp.status_code == 200,
-                    "error": None
+                    "ttfb_ms": ttfb_ms,
+                    "success": status_code == 200,
+                    "error": None if status_code == 200 else f"HTTP {status_code}"
                 }
             except Exception as e:
                 elapsed_ms = (time.perf_counter() - start) * 1000
                 return {
                     "status_code": None,
                     "response_time_ms": elapsed_ms,
+                    "ttfb_ms": ttfb_ms,
                     "success": False,
                     "error": str(e)
                 }
 
-    async def concurrent_test(self, endpoint: str, concurrent_users: int, requests_per_user: int) -> List[Dict]:
+    async def concurrent_test(
+        self,
+        endpoint: str,
+        concurrent_users: int,
+        requests_per_user: int,
+        payload: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        timeout: float = 30.0
+    ) -> List[Dict]:
         total_requests = concurrent_users * requests_per_user
         sem = asyncio.Semaphore(concurrent_users)  # 限制并发
         results: List[Dict] = []
@@ -42,9 +71,12 @@ class AsyncPressureTester:
         # 配置连接上限，避免打开过多连接（根据需要调整）
         limits = httpx.Limits(max_connections=concurrent_users * 2, max_keepalive_connections=concurrent_users)
 
-        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
             # 创建 tasks（立即 schedule）
-            tasks = [asyncio.create_task(self._single_request(client, endpoint, sem)) for _ in range(total_requests)]
+            tasks = [
+                asyncio.create_task(self._single_request(client, endpoint, sem, payload, stream))
+                for _ in range(total_requests)
+            ]
 
             # 用 tqdm + asyncio.as_completed 正确显示进度
             ac = asyncio.as_completed(tasks)
@@ -63,12 +95,22 @@ class AsyncPressureTester:
 
         return results
 
-    async def pressure_test(self, endpoint: str, concurrent_users: int, requests_per_user: int) -> Dict:
+    async def pressure_test(
+        self,
+        endpoint: str,
+        concurrent_users: int,
+        requests_per_user: int,
+        payload: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        timeout: float = 30.0
+    ) -> Dict:
         print(f"开始压力测试: {endpoint}")
         print(f"并发用户数: {concurrent_users}, 每用户请求数: {requests_per_user}")
 
         start_time = time.time()
-        results = await self.concurrent_test(endpoint, concurrent_users, requests_per_user)
+        results = await self.concurrent_test(
+            endpoint, concurrent_users, requests_per_user, payload, stream, timeout
+        )
         end_time = time.time()
 
         total_time = end_time - start_time
@@ -87,6 +129,9 @@ class AsyncPressureTester:
             avg_response_time = min_response_time = max_response_time = median_response_time = 0
 
         success_rate = (successful_requests / total_requests) * 100 if total_requests > 0 else 0
+        throughput = successful_requests / total_time if total_time > 0 else 0
+
+        ttfbs = sorted(r["ttfb_ms"] for r in results if r["success"] and r.get("ttfb_ms") is not None)
 
         report = {
             "test_info": {
@@ -99,7 +144,8 @@ class AsyncPressureTester:
                 "total_time_seconds": round(total_time, 2),
                 "successful_requests": successful_requests,
                 "failed_requests": failed_requests,
-                "success_rate": round(success_rate, 2)
+                "success_rate": round(success_rate, 2),
+                "throughput_rps": round(throughput, 2)
             },
             "response_time_stats": {
                 "average_ms": round(avg_response_time, 2),
@@ -107,6 +153,10 @@ class AsyncPressureTester:
                 "max_ms": round(max_response_time, 2),
                 "median_ms": round(median_response_time, 2)
             },
+            "ttfb_stats": {
+                "median_ms": round(statistics.median(ttfbs), 2),
+                "p95_ms": round(ttfbs[min(len(ttfbs) - 1, int(len(ttfbs) * 0.95))], 2)
+            } if ttfbs else None,
             "raw_results": results
         }
         return report
@@ -128,17 +178,63 @@ class AsyncPressureTester:
         print(f"成功请求数: {results['successful_requests']}")
         print(f"失败请求数: {results['failed_requests']}")
         print(f"成功率: {results['success_rate']}%")
+        print(f"吞吐量: {results['throughput_rps']} 请求/秒")
         print("-"*50)
         print(f"平均响应时间: {response_stats['average_ms']} ms")
         print(f"最小响应时间: {response_stats['min_ms']} ms")
         print(f"最大响应时间: {response_stats['max_ms']} ms")
         print(f"中位响应时间: {response_stats['median_ms']} ms")
+        if report.get("ttfb_stats"):
+            print(f"首字节时间中位数: {report['ttfb_stats']['median_ms']} ms")
+            print(f"首字节时间P95: {report['ttfb_stats']['p95_ms']} ms")
         print("="*50)
 
 
+def build_ai_payload(args: argparse.Namespace, stream_format: Optional[str] = None) -> Dict[str, Any]:
+    """AI接口的请求体；离线压测时后端应通过LLM_API_URL指向scripts/mock_llm_server.py。"""
+    payload: Dict[str, Any] = {
+        "time": "",
+        "token": args.token,
+        "message": args.message,
+        "user_id": args.user_id,
+        "workspace_id": args.workspace_id,
+        "project_id": args.project_id,
+    }
+    if stream_format is not None:
+        payload["stream_format"] = stream_format
+    return payload
+
+
 async def main():
-    tester = AsyncPressureTester("http://127.0.0.1:3000")
-    report = await tester.pressure_test("/health", concurrent_users=50, requests_per_user=100)
+    parser = argparse.ArgumentParser(description="异步压力测试")
+    parser.add_argument("--base-url", default="http://127.0.0.1:3000")
+    parser.add_argument(
+        "--mode", choices=["health", "ai-chat", "ai-stream"], default="health",
+        help="health: GET /health；ai-chat: POST /ai/chat/；ai-stream: POST /ai/chat-stream/（SSE）"
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=100, help="每个并发用户的请求数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AI接口的单次请求超时（秒）")
+    parser.add_argument("--message", default="帮我规划一次社团活动")
+    parser.add_argument("--token", default=None, help="ai-stream模式需要有效的登录token")
+    parser.add_argument("--user-id", default="00000000-0000-0000-0000-000000000000")
+    parser.add_argument("--workspace-id", default="00000000-0000-0000-0000-000000000000")
+    parser.add_argument("--project-id", default="00000000-0000-0000-0000-000000000000")
+    args = parser.parse_args()
+
+    tester = AsyncPressureTester(args.base_url)
+    if args.mode == "health":
+        report = await tester.pressure_test("/health", concurrent_users=args.concurrency, requests_per_user=args.requests)
+    elif args.mode == "ai-chat":
+        report = await tester.pressure_test(
+            "/ai/chat/", args.concurrency, args.requests,
+            payload=build_ai_payload(args), timeout=args.timeout
+        )
+    else:
+        report = await tester.pressure_test(
+            "/ai/chat-stream/", args.concurrency, args.requests,
+            payload=build_ai_payload(args, stream_format="sse"), stream=True, timeout=args.timeout
+        )
     tester.print_report(report)
 
     print("\n" + "="*50)
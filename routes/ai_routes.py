@@ -1,24 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from typing import Dict, Optional, Any, List, AsyncGenerator
+import asyncio
 import json
+import math
+from dataclasses import asdict
 
 from core.database import get_db_manager
 from core.llm_service import get_llm_fetcher
+from core.job_runner import get_job_runner
 
 from core.utils.getters import get_ai_service, get_redis_manager, get_task_service
 from core.utils.user_id_fetch import get_user_id_from_redis_by_token
 
 from modules import LLMFetcher, DatabaseManager
 from modules.redisman import RedisManager
-from services import AITaskService, TaskService
-from core.config import load_config
+from modules.job_runner import JobRunner, JobQueueFullError
+from modules.llm_fetcher import (
+    LLMRateLimitedError, LLMStreamEvent, BoundedTextBuffer, with_heartbeat, coalesce_chunks, SSE_HEARTBEAT
+)
+from services import AITaskService, TaskService, StreamingTaskCreator
+from core.config import load_config, get_settings
+from services.models.task_data_model import Task
 
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
 
 from .models.ai_llm_models import (
     TaskDecomposeRequest, 
     TaskSuggestionRequest, 
+    TaskSuggestionBatchRequest,
     ChatRequest,
     TaskDecomposeResponse,
     TaskSuggestionResponse,
@@ -28,32 +38,67 @@ from .models.ai_llm_models import (
 )
 
 router = APIRouter(prefix="/ai", tags=["ai"])
+settings = get_settings()
+
+
+def _llm_busy(exc: LLMRateLimitedError) -> HTTPException:
+    """私有函数：LLM调用名额排队超时，返回429并提示客户端稍后重试。"""
+    return HTTPException(
+        status_code=429,
+        detail=str(exc),
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
 
 
 @router.post("/decompose/", response_model=Dict[str, Any])
 async def decompose_task(
     request: TaskDecomposeRequest,
-    service: AITaskService = Depends(get_ai_service)
+    response: Response,
+    service: AITaskService = Depends(get_ai_service),
+    runner: JobRunner = Depends(get_job_runner)
 ) -> Dict[str, Any]:
     """
     使用AI将大目标分解为具体任务
-    - TODO: 这个东西的底层方法已经是流式方法，但尚未具有存储用户认为的方案。
+    - `background`为True时只提交后台任务并返回202与`ai_request_id`，状态为queued。
     
     Args:
         request (TaskDecomposeRequest): 任务分解请求
+        response (Response): 响应对象，用于设置状态码
         service (AITaskService): AI任务服务实例
+        runner (JobRunner): 后台任务执行器
         
     Returns:
-        Dict[str, Any]: 分解后的任务结构
+        Dict[str, Any]: 分解后的任务结构；后台任务模式下为请求ID与状态
     """
     try:
+        if request.background:
+            job = await service.submit_decompose_job(
+                request.user_id,
+                request.goal,
+                request.workspace_id,
+                request.project_id,
+                runner,
+                mode=request.mode
+            )
+            response.status_code = 202
+            return {
+                "success": True,
+                "data": job,
+                "message": "任务分解已提交"
+            }
+
         result = await service.decompose_task(
             request.user_id, 
             request.goal, 
             request.workspace_id,
-            request.project_id
+            request.project_id,
+            mode=request.mode
         )
         return result
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except LLMRateLimitedError as e:
+        raise _llm_busy(e)
     except DatabaseConnectionError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except DatabaseTimeoutError as e:
@@ -68,7 +113,7 @@ async def get_task_decomposition(
     service: AITaskService = Depends(get_ai_service)
 ) -> Dict[str, Any]:
     """
-    获取已存储的任务分解结果
+    获取任务分解请求的状态（queued/running/done/failed），完成时一并返回分解结果
     
     Args:
         ai_request_id (str): AI请求ID
@@ -76,18 +121,52 @@ async def get_task_decomposition(
         service (AITaskService): AI任务服务实例
         
     Returns:
-        Dict[str, Any]: 存储的任务分解结果
+        Dict[str, Any]: 请求状态与存储的任务分解结果
     """
     try:
-        result = await service.get_task_decomposition(user_id, ai_request_id)
-        if result:
-            return {
-                "success": True,
-                "data": result,
-                "message": "获取任务分解结果成功"
-            }
-        else:
-            raise HTTPException(status_code=404, detail="未找到对应的任务分解结果")
+        result = await service.get_decompose_job(user_id, ai_request_id)
+    except DatabaseConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except DatabaseTimeoutError as e:
+        raise HTTPException(status_code=408, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result:
+        raise HTTPException(status_code=404, detail="未找到对应的任务分解结果")
+    return {
+        "success": True,
+        "data": result,
+        "message": "获取任务分解结果成功"
+    }
+
+@router.post("/suggestions/batch/", response_model=Dict[str, Any])
+async def get_task_suggestions_batch(
+    request: TaskSuggestionBatchRequest,
+    service: AITaskService = Depends(get_ai_service)
+) -> Dict[str, Any]:
+    """
+    批量获取多个任务的AI建议，任务信息一次查询取出，多个任务共用一次或几次LLM调用
+    - 必须声明在`/suggestions/{task_id}/`之前，否则"batch"会被当作任务ID。
+    
+    Args:
+        request (TaskSuggestionBatchRequest): 批量任务建议请求
+        service (AITaskService): AI任务服务实例
+        
+    Returns:
+        Dict[str, Any]: 按任务ID组织的AI建议，以及不存在或未得到建议的任务ID
+    """
+    if not request.task_ids:
+        raise HTTPException(status_code=400, detail="task_ids不能为空")
+    if len(request.task_ids) > settings.ai.suggestion_batch_max_request:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一次最多请求{settings.ai.suggestion_batch_max_request}个任务的建议"
+        )
+    try:
+        return await service.get_task_suggestions_batch(request.user_id, request.task_ids)
+    except LLMRateLimitedError as e:
+        raise _llm_busy(e)
     except DatabaseConnectionError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except DatabaseTimeoutError as e:
@@ -116,6 +195,8 @@ async def get_task_suggestions(
     try:
         suggestions = await service.get_task_suggestions(request.user_id, task_id)
         return suggestions
+    except LLMRateLimitedError as e:
+        raise _llm_busy(e)
     except DatabaseConnectionError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except DatabaseTimeoutError as e:
@@ -146,11 +227,12 @@ async def chat_with_ai(
             system_prompt = load_config()["llm"]["task_decompose"]
         
         # 调用LLM
-        response = llm_fetcher.fetch(
+        response = await llm_fetcher.fetch(
             msg=request.message,
             system_prompt=system_prompt,
             temperature=0.7,
-            max_tokens=2048
+            max_tokens=2048,
+            use_cache=True
         )
         
         ai_response: Optional[str] = response.choices[0].message.content
@@ -161,23 +243,31 @@ async def chat_with_ai(
             data=ChatData(response=ai_response),
             message="对话成功"
         )
+    except LLMRateLimitedError as e:
+        raise _llm_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat-stream/")
 async def chat_with_ai_stream(
     request: ChatRequest,
+    http_request: Request,
     llm_fetcher: LLMFetcher = Depends(get_llm_fetcher),
     service: AITaskService = Depends(get_ai_service),
     redis_man: RedisManager = Depends(get_redis_manager),
     task_man: TaskService = Depends(get_task_service),
-    database: DatabaseManager = Depends(get_db_manager)
+    database: DatabaseManager = Depends(get_db_manager),
+    runner: JobRunner = Depends(get_job_runner)
 ):
     """
     与AI进行流式对话
+    - `stream_format`为"text"时返回混入思考标记的纯文本。
+    - `stream_format`为"sse"时返回Server-Sent Events，事件类型为reasoning、content、task_created、done与error，
+        空闲时发送心跳注释；客户端断开后立即取消上游生成，且不保存本轮对话。
     
     Args:
         request (ChatRequest): 聊天请求
+        http_request (Request): 原始HTTP请求，用于检测客户端断开
         llm_fetcher (LLMFetcher): LLM获取器实例
         redis_man (RedisManager): Redis管理器实例
         
@@ -195,52 +285,30 @@ async def chat_with_ai_stream(
         
         user_id: str = await get_user_id_from_redis_by_token(request.token)
 
-        # 从数据库内获取上下文。现在这个东西仅仅是一个作用在内存系统中的东西。await service.get_context(request.workspace_id, request.project_id, user_id) or
+        # 从数据库内获取上下文：只取token预算内的最新消息。
         history: List[LLMContext] = await service.get_context(request.workspace_id, request.project_id, user_id) or []
 
-        # 准备消息历史
+        # 准备消息历史（本轮用户消息由fetch_stream追加）
         messages: List[LLMContext] = []
         for item in history:
             messages.append(LLMContext(item.role, item.content))
-            
-        # 添加当前用户消息
-        messages.append(LLMContext("user", request.message))
-        
-        # 调用LLM流式方法
-        async def generate():
-            full_response = ""
-            async for chunk in llm_fetcher.fetch_stream(
-                msg=request.message,
-                prev_messages=messages,
-                system_prompt=system_prompt,
-                temperature=0.7,
-                max_tokens=8192,
-                output_reasoning=True
-            ):
-                full_response += chunk
-                yield chunk
-            
-            # 将对话历史保存到数据库内。
-            nonlocal history
+
+        async def finish(full_response: str, usage: Dict[str, int], create_tasks: bool = True) -> Optional[Task]:
+            """回答结束后：按回答中的JSON创建任务（已经边读边创建时跳过），并保存本轮对话。"""
+            created: Optional[Task] = None
             user_msg: LLMContext = LLMContext("user", request.message)
             llm_msg: LLMContext = LLMContext("assistant", full_response)
-            history.append(user_msg)    
-            history.append(llm_msg)
-
-            print("Now hisotries:", len(history))
 
-            json_msg: Optional[str] = service._extract_json_block(full_response)
-            print(json_msg)
+            json_msg: Optional[str] = service._extract_json_block(full_response) if create_tasks else None
 
             # 如果可以出JSON，则将其解析并按照任务主表分解
             # 强化检查：确保json_msg不仅存在且去除空格后非空
             if json_msg and isinstance(json_msg, str) and json_msg.strip():
-                nonlocal user_id
                 # 进一步确保要解析的JSON内容有效
                 cleaned_json_msg = json_msg.strip()
                 if cleaned_json_msg:  # 再次确认非空
                     try:
-                        await task_man.create_task_by_json(
+                        created = await task_man.create_task_by_json(
                             project_id=request.project_id,
                             workspace_id=request.workspace_id,
                             creator_id=user_id,
@@ -249,17 +317,115 @@ async def chat_with_ai_stream(
                     except ValueError as e:
                         # 记录JSON解析错误但不中断流程
                         print(f"Warning: Failed to parse AI-generated JSON: {e}")
-            # TODO: 当内容过期时，将上下文保存在数据库内。
-
-            # 只保留最近10轮对话
-            if len(history) > 20:  # 10轮对话包含用户和助手的消息
-                history = history[-20:]
-                
+            # 用户消息的token数按估算记录（平台的prompt_tokens包含了全部历史）；
+            # AI回复优先使用平台返回的completion_tokens。
             await service.save_context(
-                request.workspace_id, request.project_id, user_id, (history[-2], history[-1])
+                request.workspace_id, request.project_id, user_id, (user_msg, llm_msg),
+                token_counts=(None, usage.get("completion_tokens"))
             )
+            # 历史过长时在后台压缩较早的对话，下一轮读取到的是摘要加最近的对话
+            service.schedule_context_compaction(request.workspace_id, request.project_id, user_id, runner)
+            return created
         
+        # 调用LLM流式方法
+        async def generate():
+            full_response = BoundedTextBuffer(settings.ai.stream_max_response_chars)
+            usage: Dict[str, int] = {}
+            chunks = llm_fetcher.fetch_stream(
+                msg=request.message,
+                prev_messages=messages,
+                system_prompt=system_prompt,
+                temperature=0.7,
+                max_tokens=8192,
+                output_reasoning=True,
+                usage=usage
+            )
+            # 合并细碎的增量，减少socket写入次数
+            async for chunk in coalesce_chunks(
+                chunks, settings.ai.stream_coalesce_bytes, settings.ai.stream_coalesce_delay
+            ):
+                full_response.append(chunk)
+                yield chunk
+            
+            # 将对话历史保存到数据库内。
+            await finish(full_response.getvalue(), usage)
+
+        async def generate_events():
+            # 只收集回答内容：思考内容不进入上下文，也不参与JSON提取。
+            content = BoundedTextBuffer(settings.ai.stream_max_response_chars)
+            usage: Dict[str, int] = {}
+            # 回答中的任务JSON每读完一个任务就写入数据库并推送给客户端
+            creator = StreamingTaskCreator(task_man, request.project_id, request.workspace_id, user_id)
+            completed: bool = False
+            error: Optional[Dict[str, Any]] = None
+
+            def discarded_event() -> Optional[bytes]:
+                # 已推送给客户端的任务被撤销时，告知这些任务ID已不存在
+                task_ids: List[str] = creator.take_discarded()
+                return LLMStreamEvent("tasks_discarded", {"task_ids": task_ids}).encode() if task_ids else None
+
+            try:
+                events = llm_fetcher.fetch_stream_events(
+                    msg=request.message,
+                    prev_messages=messages,
+                    system_prompt=system_prompt,
+                    temperature=0.7,
+                    max_tokens=8192,
+                    output_reasoning=True,
+                    usage=usage
+                )
+                events = coalesce_chunks(
+                    events, settings.ai.stream_coalesce_bytes, settings.ai.stream_coalesce_delay
+                )
+                async for event in with_heartbeat(
+                    events, settings.ai.stream_heartbeat_interval, http_request.is_disconnected
+                ):
+                    if event is None:
+                        yield SSE_HEARTBEAT
+                        continue
+                    yield event.encode()
+                    if event.event == "content":
+                        content.append(event.data)
+                        for task in await creator.feed(event.data):
+                            yield LLMStreamEvent("task_created", asdict(task)).encode()
+
+                if await http_request.is_disconnected():
+                    return
+                completed = True
+                streamed: bool = await creator.finish()
+                discarded: Optional[bytes] = discarded_event()
+                if discarded is not None:
+                    yield discarded
+                created: Optional[Task] = await finish(content.getvalue(), usage, create_tasks=not streamed)
+                if created is not None:
+                    yield LLMStreamEvent("task_created", asdict(created)).encode()
+                yield LLMStreamEvent("done", {"usage": usage, "truncated": content.truncated}).encode()
+            except LLMRateLimitedError as e:
+                error = {"message": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                error = {"message": str(e)}
+            finally:
+                # 客户端断开或中途出错：撤销已经创建的部分任务；取消本身继续向外传播。
+                if not completed and creator.created:
+                    try:
+                        await asyncio.shield(creator.abort())
+                    except Exception as e:
+                        print(f"Warning: Failed to discard streamed tasks: {e!r}")
+            # 出错时先通知撤销的任务，再发送错误事件；客户端断开时不会执行到这里
+            discarded = discarded_event()
+            if discarded is not None:
+                yield discarded
+            if error is not None:
+                yield LLMStreamEvent("error", error).encode()
+
+        if request.stream_format == "sse":
+            return StreamingResponse(
+                generate_events(),
+                media_type="text/event-stream",
+                # 禁止代理缓冲与缓存，保证事件实时到达
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         # 返回一个处理流式内容的handler。
         return StreamingResponse(generate(), media_type="text/plain")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,4 +1,4 @@
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Literal, Optional
 from pydantic import BaseModel
 from dataclasses import dataclass
 
@@ -12,6 +12,10 @@ class TaskDecomposeRequest(BaseRequest):
     user_id: str
     project_id: str
     workspace_id: str
+    # 为True时以后台任务模式运行：立即返回ai_request_id，随后轮询GET /ai/decompose/{ai_request_id}/
+    background: bool = False
+    # single：一次生成整棵任务树；fanout：先生成各阶段，再并行展开每个阶段（适合较大的目标）
+    mode: Literal["single", "fanout"] = "single"
 
 
 @dataclass
@@ -23,6 +27,15 @@ class TaskSuggestionRequest(BaseRequest):
     project_id: str
 
 
+@dataclass
+class TaskSuggestionBatchRequest(BaseRequest):
+    """批量任务建议请求模型"""
+    task_ids: List[str]
+    user_id: str
+    workspace_id: str
+    project_id: str
+
+
 @dataclass
 class ChatRequest(BaseRequest):
     """AI聊天请求模型"""
@@ -31,6 +44,8 @@ class ChatRequest(BaseRequest):
     workspace_id: str
     project_id: str
     system_prompt: Optional[str] = None
+    # 流式输出格式："text"为混入思考标记的纯文本；"sse"为带类型的Server-Sent Events
+    stream_format: Literal["text", "sse"] = "text"
 
 
 @dataclass
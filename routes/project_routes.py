@@ -7,7 +7,7 @@ from dataclasses import dataclass
 
 # 自己写的东西喵
 from modules.databaseman import DatabaseManager
-from core.database import get_db_manager
+from core.database import get_db_manager, use_unit_of_work
 from services import ProjectService, WorkspaceService, AITaskService
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
 
@@ -33,7 +33,7 @@ from routes.models.project_models import (  # 路由
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
-@router.post("/create/", response_model=ProjectCreateResponse)
+@router.post("/create/", response_model=ProjectCreateResponse, dependencies=[Depends(use_unit_of_work)])
 async def create_project(
     request: ProjectCreateRequest, 
     svc: ProjectService = Depends(get_project_service),
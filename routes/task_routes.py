@@ -80,7 +80,7 @@ async def list_tasks(
 
         tree: List[TaskTree] = []
         for d in data:
-            t: Optional[TaskTree] = await svc.get_task_tree(d.id)
+            t: Optional[TaskTree] = await svc.get_task_tree(d.id, pin_key=request.workspace_id)
             if t is None:
                 raise ValueError("Task not found.")
             tree.append(t)
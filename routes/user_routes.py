@@ -3,7 +3,7 @@ from typing import Dict, Optional, Any
 from dataclasses import dataclass
 from modules.databaseman import DatabaseManager
 from modules.redisman import RedisManager
-from core.database import get_db_manager
+from core.database import get_db_manager, use_unit_of_work
 from core.redis_cache import get_redis_manager
 from services.user_service import UserService
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
@@ -40,7 +40,7 @@ def get_user_service(db_manager: DatabaseManager = Depends(get_db_manager)) -> U
     return UserService(db_manager)
 
 
-@router.post("/register/", response_model=RegisterResponse)
+@router.post("/register/", response_model=RegisterResponse, dependencies=[Depends(use_unit_of_work)])
 async def register_user(
     request: UserRegisterRequest,
     service: UserService = Depends(get_user_service)
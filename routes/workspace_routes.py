@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from modules.databaseman import DatabaseManager
 from modules.redisman import RedisManager
 
+from core.database import use_unit_of_work
 from core.utils.getters import (
     get_user_service, get_workspace_service,
     get_db_manager, get_redis_manager
@@ -101,7 +102,7 @@ async def get_workspace(
         raise HTTPException(status_code=503 if isinstance(e, DatabaseConnectionError) else 408, detail=str(e))
 
 
-@router.put("/{workspace_id}/", response_model=WorkspaceUpdateResponse)
+@router.put("/{workspace_id}/", response_model=WorkspaceUpdateResponse, dependencies=[Depends(use_unit_of_work)])
 async def update_workspace(
     workspace_id: str, 
     request: WorkspaceUpdateRequest, 
@@ -128,7 +129,7 @@ async def update_workspace(
         raise HTTPException(status_code=503 if isinstance(e, DatabaseConnectionError) else 408, detail=str(e))
 
 
-@router.delete("/{workspace_id}/", response_model=WorkspaceDeleteResponse)
+@router.delete("/{workspace_id}/", response_model=WorkspaceDeleteResponse, dependencies=[Depends(use_unit_of_work)])
 async def delete_workspace(
     workspace_id: str, 
     request: WorkspaceDeleteRequest, 
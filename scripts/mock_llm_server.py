@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地的OpenAI兼容模拟LLM服务，用于离线压测AI相关接口，不会调用真实的平台。
+- POST /v1/chat/completions：支持流式（SSE）与非流式；流式时可先输出`reasoning_content`增量，
+    并在请求`stream_options.include_usage`时输出用量块。
+- GET /v1/models：返回模拟的模型列表。
+- 可配置每秒输出的token数、首token延迟、出错率（返回429并带Retry-After，或500）。
+- 回答为固定的任务分解JSON（带`<<<JSON_BEGIN>>>`/`<<<JSON_END>>>`标记），或原样回显用户消息。
+
+用法：
+```
+python scripts/mock_llm_server.py --port 18080 --tps 50 --ttft 0.3 --reasoning-tokens 40 --error-rate 0.01
+# 让后端指向它
+LLM_API_URL=http://127.0.0.1:18080/v1 python app.py
+```
+"""
+
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+# 固定的任务分解结果，结构与llm_prompts/task_composer.txt一致
+DECOMPOSITION: Dict[str, Any] = {
+    "main_goal": "准备一次社团活动",
+    "tasks": [{
+        "title": "筹备社团活动",
+        "description": "完成活动从策划到复盘的全部工作",
+        "estimated_time": 3,
+        "estimated_time_unit": "day",
+        "priority": "high",
+        "subtasks": [
+            {
+                "title": "确定活动方案",
+                "description": "确定主题、时间、地点与预算",
+                "estimated_time": 2,
+                "estimated_time_unit": "hour",
+                "priority": "high",
+                "subtasks": [
+                    {"title": "收集成员意见", "description": "发放问卷并汇总结果", "estimated_time": 30,
+                     "estimated_time_unit": "minute", "priority": "medium", "subtasks": []},
+                    {"title": "编写预算表", "description": "列出物料与场地费用", "estimated_time": 45,
+                     "estimated_time_unit": "minute", "priority": "medium", "subtasks": []},
+                ],
+            },
+            {
+                "title": "布置场地",
+                "description": "按方案采购物料并完成布置",
+                "estimated_time": 4,
+                "estimated_time_unit": "hour",
+                "priority": "medium",
+                "subtasks": [],
+            },
+            {
+                "title": "活动复盘",
+                "description": "整理照片与反馈，输出复盘文档",
+                "estimated_time": 1,
+                "estimated_time_unit": "hour",
+                "priority": "low",
+                "subtasks": [],
+            },
+        ],
+    }],
+    "summary": "先确定方案，再布置场地，最后复盘。",
+}
+
+REASONING_TEXT: str = "用户希望把目标拆解为可执行的任务。先确认主任务，再按阶段拆分子任务，并估算每一步的耗时。"
+
+
+@dataclass
+class MockLLMConfig:
+    """模拟服务的行为配置。"""
+    tps: float = 50.0               # 每条流每秒输出的token数，为0时不限速
+    ttft: float = 0.3               # 首token延迟（秒）
+    reasoning_tokens: int = 0       # 回答前输出的reasoning_content token数
+    error_rate: float = 0.0         # 出错的请求比例
+    error_status: int = 429         # 出错时的状态码
+    retry_after: float = 1.0        # 429时的Retry-After（秒）
+    answer: str = "decomposition"   # "decomposition"或"echo"
+    model: str = "mock-reasoner"
+    seed: Optional[int] = None
+
+
+def split_tokens(text: str, rng: random.Random) -> List[str]:
+    """把文本切成1~3个字符的片段，近似平台输出的token粒度。"""
+    tokens: List[str] = []
+    i: int = 0
+    while i < len(text):
+        step: int = rng.randint(1, 3)
+        tokens.append(text[i:i + step])
+        i += step
+    return tokens
+
+
+def answer_text(config: MockLLMConfig, messages: List[Dict[str, Any]]) -> str:
+    """生成回答内容。"""
+    if config.answer == "echo":
+        user_messages = [m for m in messages if m.get("role") == "user"]
+        return str(user_messages[-1].get("content", "")) if user_messages else ""
+    return "<<<JSON_BEGIN>>>\n" + json.dumps(DECOMPOSITION, ensure_ascii=False, indent=2) + "\n<<<JSON_END>>>"
+
+
+def create_app(config: MockLLMConfig) -> Starlette:
+    """
+    创建模拟服务的ASGI应用，也可以在测试或基准中通过`httpx.ASGITransport`直接使用。
+
+    Args:
+        config (MockLLMConfig): 行为配置。
+    """
+    rng: random.Random = random.Random(config.seed)
+
+    def estimate(text: str) -> int:
+        return max(1, len(text.encode("utf-8")) // 3)
+
+    def chunk(delta: Dict[str, Any], completion_id: str, finish_reason: Optional[str] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": config.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def completions(request: Request) -> Response:
+        body: Dict[str, Any] = await request.json()
+        messages: List[Dict[str, Any]] = body.get("messages") or []
+
+        if config.error_rate > 0 and rng.random() < config.error_rate:
+            headers: Dict[str, str] = {}
+            if config.error_status == 429:
+                headers["retry-after"] = str(config.retry_after)
+            return JSONResponse(
+                {"error": {"message": "mock upstream error", "type": "mock_error", "code": config.error_status}},
+                status_code=config.error_status,
+                headers=headers
+            )
+
+        content: str = answer_text(config, messages)
+        reasoning: str = (REASONING_TEXT * (config.reasoning_tokens // 20 + 1))[:config.reasoning_tokens * 2]
+        prompt_tokens: int = sum(estimate(str(m.get("content", ""))) for m in messages)
+        content_tokens: List[str] = split_tokens(content, rng)
+        reasoning_tokens: List[str] = split_tokens(reasoning, rng) if config.reasoning_tokens else []
+        usage: Dict[str, int] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content_tokens) + len(reasoning_tokens),
+            "total_tokens": prompt_tokens + len(content_tokens) + len(reasoning_tokens),
+        }
+        completion_id: str = f"chatcmpl-{uuid.uuid4().hex}"
+
+        if not body.get("stream"):
+            # 非流式：等待整段生成所需的时间后一次返回
+            total: int = len(content_tokens) + len(reasoning_tokens)
+            await asyncio.sleep(config.ttft + (total / config.tps if config.tps > 0 else 0))
+            message: Dict[str, Any] = {"role": "assistant", "content": content}
+            if reasoning:
+                message["reasoning_content"] = reasoning
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": config.model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        include_usage: bool = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def generate() -> AsyncGenerator[str, None]:
+            await asyncio.sleep(config.ttft)
+            interval: float = 1.0 / config.tps if config.tps > 0 else 0.0
+            start: float = time.perf_counter()
+            sent: int = 0
+            deltas = [{"reasoning_content": t, "content": None} for t in reasoning_tokens]
+            deltas += [{"content": t} for t in content_tokens]
+            for index, delta in enumerate(deltas):
+                if index == 0:
+                    delta["role"] = "assistant"
+                # 按绝对时间对齐，避免sleep的误差累积
+                sent += 1
+                delay: float = start + sent * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk(delta, completion_id)
+            yield chunk({}, completion_id, finish_reason="stop")
+            if include_usage:
+                tail = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": config.model, "choices": [], "usage": usage,
+                }
+                yield f"data: {json.dumps(tail)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    async def models(request: Request) -> Response:
+        return JSONResponse({
+            "object": "list",
+            "data": [{"id": config.model, "object": "model", "created": 0, "owned_by": "mock"}],
+        })
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", completions, methods=["POST"]),
+        Route("/chat/completions", completions, methods=["POST"]),
+        Route("/v1/models", models, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地模拟LLM服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--tps", type=float, default=50.0, help="每条流每秒输出的token数，0为不限速")
+    parser.add_argument("--ttft", type=float, default=0.3, help="首token延迟（秒）")
+    parser.add_argument("--reasoning-tokens", type=int, default=0, help="回答前输出的reasoning_content token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="出错的请求比例（0~1）")
+    parser.add_argument("--error-status", type=int, default=429, help="出错时返回的状态码")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429时Retry-After的秒数")
+    parser.add_argument("--answer", choices=["decomposition", "echo"], default="decomposition")
+    parser.add_argument("--model", default="mock-reasoner")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockLLMConfig(
+        tps=args.tps,
+        ttft=args.ttft,
+        reasoning_tokens=args.reasoning_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        answer=args.answer,
+        model=args.model,
+        seed=args.seed,
+    )
+    print(f"Mock LLM server: http://{args.host}:{args.port}/v1  ({config})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from .ai_task_service import AITaskService
 from .management_service import ManagementService
 from .project_service import ProjectService
 from .task_service import TaskService
+from .streaming_task_creator import StreamingTaskCreator
 from .user_service import UserService
 from .workspace_service import WorkspaceService
 
@@ -1,30 +1,207 @@
 from typing import Dict, List, Any, Optional, Tuple
-from modules.llm_fetcher.llm_fetcher import LLMFetcher
+from modules.llm_fetcher import LLMFetcher, LLMRateLimitedError, estimate_tokens
 from modules.databaseman import DatabaseManager, DBTimeoutError
+from asyncpg import Connection
+from modules.json_extractor import extract_json_block, TaskStreamParser
+from modules.job_runner import JobRunner, JobQueueFullError
+from modules.redisman import RedisManager
+from modules.singleflight import SingleFlight
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
 from settings import get_settings
+import asyncio
+import hashlib
 import json
+import re
 import uuid
+from dataclasses import asdict
 from datetime import datetime
 from routes.models.ai_llm_models import LLMContext  # 上下文内容
+from .conversation_cache import ConversationWindowCache
+from .task_service import TaskService
+from .models.task_data_model import TaskInfo, TaskListInfo
+
+AI_REQUEST_INSERT_QUERY: str = """
+INSERT INTO ai_requests (id, user_id, prompt, response_text, status)
+VALUES ($1, $2, $3, $4, $5)
+"""
+
+# response为NULL时保留原有内容
+AI_REQUEST_STATUS_UPDATE_QUERY: str = """
+UPDATE ai_requests
+SET status = $2, response_text = COALESCE($3, response_text)
+WHERE id = $1
+"""
+
+AI_TASK_SUGGESTION_INSERT_QUERY: str = """
+INSERT INTO ai_task_suggestions (ai_request_id, user_id, suggestion, metadata)
+VALUES ($1, $2, $3, $4)
+"""
+
+# 追加一轮对话：upsert所属的对话线程并一次分配顺序号，再用unnest一次写入全部消息。
+# 同一线程的并发写入在线程记录的行锁上排队，顺序号不会重复。
+CONTEXT_APPEND_QUERY: str = """
+WITH thread AS (
+    INSERT INTO ai_conversations (project_id, workspace_id, creator_id, model_name, last_sequence_number)
+    VALUES ($1, $2, $3, $4, cardinality($5::text[]))
+    ON CONFLICT (creator_id, workspace_id, project_id) WHERE deleted_at IS NULL
+    DO UPDATE SET last_sequence_number = ai_conversations.last_sequence_number + cardinality($5::text[]),
+                  model_name = EXCLUDED.model_name,
+                  updated_at = now()
+    RETURNING id, last_sequence_number
+), inserted AS (
+    INSERT INTO ai_messages (conversation_id, role, content, tokens, sequence_number)
+    SELECT thread.id, m.role, m.content, m.tokens,
+           thread.last_sequence_number - cardinality($5::text[]) + m.ord
+    FROM thread, unnest($5::text[], $6::text[], $7::int[]) WITH ORDINALITY AS m(role, content, tokens, ord)
+)
+SELECT id FROM thread
+"""
+
+# 在线程内按顺序号倒序累加token数，取出预算内的最新消息；tokens为0时按`estimate_tokens`的公式估算。
+CONTEXT_WINDOW_QUERY: str = """
+WITH recent AS (
+    SELECT am.role, am.content, am.sequence_number,
+           CASE WHEN am.tokens > 0 THEN am.tokens
+                ELSE (octet_length(am.content) + 2) / 3 + 4 END AS tokens
+    FROM ai_conversations ac
+    JOIN ai_messages am ON am.conversation_id = ac.id
+    WHERE ac.project_id = $1
+      AND ac.workspace_id = $2
+      AND ac.creator_id = $3
+      AND ac.deleted_at IS NULL
+      AND NOT am.compacted
+    ORDER BY am.sequence_number DESC
+    LIMIT $5
+), windowed AS (
+    SELECT role, content, tokens, sequence_number,
+           SUM(tokens) OVER (
+               ORDER BY sequence_number DESC
+               ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+           ) AS running_tokens
+    FROM recent
+)
+SELECT role, content, tokens
+FROM windowed
+WHERE running_tokens <= $4
+ORDER BY sequence_number
+"""
+
+# 对话压缩：未压缩消息的token总数，每轮对话后检查，只返回一个数字
+CONTEXT_ACTIVE_TOKENS_QUERY: str = """
+SELECT COALESCE(SUM(CASE WHEN am.tokens > 0 THEN am.tokens
+                         ELSE (octet_length(am.content) + 2) / 3 + 4 END), 0) AS tokens
+FROM ai_conversations ac
+JOIN ai_messages am ON am.conversation_id = ac.id
+WHERE ac.project_id = $1
+  AND ac.workspace_id = $2
+  AND ac.creator_id = $3
+  AND ac.deleted_at IS NULL
+  AND NOT am.compacted
+"""
+
+# 对话压缩：按顺序取出全部未压缩消息（包括之前的摘要）
+CONTEXT_ACTIVE_MESSAGES_QUERY: str = """
+SELECT am.id, am.conversation_id, am.sequence_number, am.role, am.content, am.is_summary,
+       CASE WHEN am.tokens > 0 THEN am.tokens
+            ELSE (octet_length(am.content) + 2) / 3 + 4 END AS tokens
+FROM ai_conversations ac
+JOIN ai_messages am ON am.conversation_id = ac.id
+WHERE ac.project_id = $1
+  AND ac.workspace_id = $2
+  AND ac.creator_id = $3
+  AND ac.deleted_at IS NULL
+  AND NOT am.compacted
+ORDER BY am.sequence_number
+"""
+
+# 摘要沿用被压缩的最后一条消息的顺序号（该消息已标记为压缩，不违反唯一索引），排在保留的对话之前
+CONTEXT_SUMMARY_INSERT_QUERY: str = """
+INSERT INTO ai_messages (conversation_id, role, content, tokens, sequence_number, is_summary)
+VALUES ($1, 'system', $2, $3, $4, TRUE)
+"""
+
+CONTEXT_COMPACT_MARK_QUERY: str = """
+UPDATE ai_messages SET compacted = TRUE
+WHERE id = ANY($1::uuid[]) AND NOT compacted
+"""
+
+# 批量任务建议：一次查询取出全部任务
+TASK_INFO_BATCH_QUERY: str = """
+SELECT id, title, description FROM tasks WHERE id = ANY($1::uuid[])
+"""
+
+# 单个任务建议的缓存键前缀。键由任务ID的规范形式与标题、描述的哈希组成：提示词中只有这三项，
+# 修改标题或描述后自然失效；修改优先级、截止时间等其他字段不影响建议，缓存仍然有效
+SUGGESTION_CACHE_PREFIX: str = "ai:suggest:task:"
+
+# 流式回答中保存的思考过程，压缩时不送入摘要
+_THINKING_PATTERN: "re.Pattern[str]" = re.compile(r"<<<THINKING>>>.*?(<<<THINK_END>>>|$)", re.S)
+
+# 重建缓存窗口时不按预算截断，只受扫描条数限制
+CONTEXT_UNBOUNDED_BUDGET: int = 2 ** 31 - 1
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    """私有函数：时间列可能已由连接上的编解码器解码为ISO格式的字符串。"""
+    if value is None:
+        return None
+    return value if isinstance(value, str) else value.isoformat()
+
 
 class AITaskService:
     """AI任务分解服务类，处理基于AI的任务分解逻辑（流式收集JSON后解析）。"""
 
-    def __init__(self, db_manager: DatabaseManager, llm_fetcher: LLMFetcher):
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        llm_fetcher: LLMFetcher,
+        redis_manager: Optional[RedisManager] = None,
+        single_flight: Optional[SingleFlight] = None
+    ):
         self.db_manager = db_manager
         self.llm_fetcher = llm_fetcher
+        # 合并相同的并发AI请求；为None时不合并
+        self.single_flight: Optional[SingleFlight] = single_flight
         prompts = get_settings().prompts
         # 提取提示词对象。
         self.prompt_task_decompose: str = prompts.task_decompose
         self.prompt_task_suggestion: str = prompts.task_suggestion
+        self.prompt_task_outline: str = prompts.task_outline
+        self.prompt_task_expand: str = prompts.task_expand
+        self.prompt_task_suggestion_batch: str = prompts.task_suggestion_batch
+        self.prompt_context_summary: str = prompts.context_summary
+        # 上下文加载限制
+        ai_settings = get_settings().ai
+        self.context_token_budget: int = ai_settings.context_token_budget
+        self.context_max_messages: int = ai_settings.context_max_messages
+        # 并行展开式分解的限制
+        self.fanout_concurrency: int = ai_settings.decompose_fanout_concurrency
+        self.fanout_max_branches: int = ai_settings.decompose_fanout_max_branches
+        # 批量任务建议的打包限制与单任务结果缓存；未提供Redis时不缓存
+        self.redis_manager: Optional[RedisManager] = redis_manager
+        self.suggestion_batch_token_budget: int = ai_settings.suggestion_batch_token_budget
+        self.suggestion_batch_max_tasks: int = ai_settings.suggestion_batch_max_tasks
+        self.suggestion_tokens_per_task: int = ai_settings.suggestion_tokens_per_task
+        self.suggestion_cache_ttl: int = ai_settings.suggestion_cache_ttl
+        # 对话压缩的阈值与保留量
+        self.context_compact_threshold: int = ai_settings.context_compact_threshold
+        self.context_compact_keep_tokens: int = ai_settings.context_compact_keep_tokens
+        self.context_summary_max_tokens: int = ai_settings.context_summary_max_tokens
+        self.context_compact_max_input_tokens: int = ai_settings.context_compact_max_input_tokens
+        # 对话窗口缓存；未提供Redis或过期时间为0时不启用
+        self.context_cache: Optional[ConversationWindowCache] = None
+        if redis_manager is not None and ai_settings.context_cache_ttl > 0:
+            self.context_cache = ConversationWindowCache(
+                redis_manager, self.context_max_messages, ai_settings.context_cache_ttl
+            )
 
     async def decompose_task(
         self,
         user_id: str,
         goal: str,
         workspace_id: str,
-        project_id: str
+        project_id: str,
+        mode: str = "single"
     ) -> Dict[str, Any]:
         """
         使用AI将大目标分解为具体任务；流式拉取直到完整JSON生成后再解析。
@@ -36,59 +213,378 @@ class AITaskService:
             goal (str): 用户目标。
             workspace_id (str): 目标工作空间ID。
             project_id (str): 目标工程ID。
+            mode (str): "single"为一次生成整棵任务树；"fanout"为先生成阶段再并行展开，
+                见`_generate_fanout_decomposition`。
         """
-        system_prompt = self.prompt_task_decompose
-
-        user_message = f"请将以下目标分解为具体任务：{goal}"
+        if self.single_flight is None:
+            return await self._decompose_task(user_id, goal, workspace_id, project_id, mode)
+        # 同一用户在同一项目下对同一目标的并发请求（双击、前端重试）只执行一次。
+        goal_hash: str = hashlib.sha256(goal.encode("utf-8")).hexdigest()
+        return await self.single_flight.do(
+            f"ai:decompose:{mode}:{user_id}:{workspace_id}:{project_id}:{goal_hash}",
+            lambda: self._decompose_task(user_id, goal, workspace_id, project_id, mode)
+        )
 
+    async def _decompose_task(
+        self,
+        user_id: str,
+        goal: str,
+        workspace_id: str,
+        project_id: str,
+        mode: str = "single"
+    ) -> Dict[str, Any]:
+        """私有函数：`decompose_task`的实际执行过程。"""
         full_text: str = ""
         try:
-            db = await self.db_manager.get_connection(5.0)
+            # 注意：LLM生成期间不持有任何数据库连接，否则并发分解会耗尽连接池。
+            full_text, json_text, task_structure = await self._generate_by_mode(goal, mode)
+
+            # LLM输出完毕后，在同一个连接上用一个短事务保存请求记录和分解结果。
+            conn = await self.db_manager.get_connection(5.0)
+            try:
+                async with conn.transaction():
+                    ai_request_id = await self._save_ai_request(user_id, goal, json_text, conn=conn)
+                    await self._save_task_decomposition(
+                        ai_request_id, user_id, task_structure, workspace_id, project_id, conn=conn
+                    )
+            finally:
+                await self.db_manager.release_connection(conn)
+
+            return {
+                "success": True,
+                "data": task_structure,
+                "message": "任务分解成功",
+                "timestamp": datetime.now().isoformat()
+            }
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
+        except LLMRateLimitedError:
+            raise
+        except json.JSONDecodeError as exc:
+            raise Exception(f"AI返回结果解析失败: {str(exc)} | 片段: {full_text[:200]}")
+        except Exception as exc:
+            raise Exception(f"任务分解失败: {str(exc)}")
 
-            # 获取当前模型上下文。
-            # 然后，将模型上下文内容拼接. 
+    async def _generate_decomposition(self, goal: str) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        私有函数：流式拉取LLM输出并解析出任务分解JSON，期间不访问数据库。
 
-            chunks: List[str] = []
+        Args:
+            goal (str): 用户目标。
+
+        Returns:
+            (Tuple[str, str, Dict[str, Any]]): LLM输出全文、JSON字符串、解析后的任务结构。
+
+        Raises:
+            ValueError: 输出中找不到JSON。
+            json.JSONDecodeError: JSON解析失败。
+        """
+        user_message = f"请将以下目标分解为具体任务：{goal}"
+
+        chunks: List[str] = []
+        async for chunk in self.llm_fetcher.fetch_stream(
+            msg=user_message,
+            system_prompt=self.prompt_task_decompose,
+            temperature=0.5,
+            max_tokens=4096,
+            use_cache=True
+        ):
+            if chunk:
+                chunks.append(chunk)
+
+        full_text = "".join(chunks)
+        json_text: Optional[str] = self._extract_json_block(full_text)
+        if not json_text:
+            raise ValueError("JSON分解失败：未产生任务。")
+        return full_text, json_text, json.loads(json_text)
+
+    async def _generate_by_mode(self, goal: str, mode: str) -> Tuple[str, str, Dict[str, Any]]:
+        """私有函数：按分解模式生成任务结构，返回值同`_generate_decomposition`。"""
+        if mode == "fanout":
+            return await self._generate_fanout_decomposition(goal)
+        return await self._generate_decomposition(goal)
+
+    async def _generate_fanout_decomposition(self, goal: str) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        私有函数：并行展开式任务分解，期间不访问数据库。
+        - 第一次调用只生成主任务及其直接子任务（阶段），随后每个阶段各用一次调用展开，
+            合并为一个`TaskListInfo`，结构与`_generate_decomposition`的结果一致。
+        - 阶段在大纲的流式输出中一读完就开始展开（见`TaskStreamParser`），不等大纲结束；
+            同时展开的阶段数受`fanout_concurrency`限制，所有调用仍经过LLM并发控制器。
+            总耗时约为大纲加上最慢的一个阶段，而不是所有阶段之和。
+        - 单个阶段展开失败时保留为叶子任务，不影响其他阶段。
+
+        Args:
+            goal (str): 用户目标。
+
+        Returns:
+            (Tuple[str, str, Dict[str, Any]]): 大纲的LLM输出全文、合并后的JSON字符串与任务结构。
+
+        Raises:
+            ValueError: 大纲中找不到JSON或没有主任务。
+            json.JSONDecodeError: 大纲JSON解析失败。
+        """
+        parser: TaskStreamParser = TaskStreamParser()
+        root_id: Optional[str] = None
+        main_title: str = ""
+        branches: List["asyncio.Task[Optional[List[TaskInfo]]]"] = []
+        sem: asyncio.Semaphore = asyncio.Semaphore(self.fanout_concurrency)
+        chunks: List[str] = []
+
+        try:
             async for chunk in self.llm_fetcher.fetch_stream(
-                msg=user_message,
-                system_prompt=system_prompt,
+                msg=f"请将以下目标分解为主任务与若干阶段：{goal}",
+                system_prompt=self.prompt_task_outline,
                 temperature=0.5,
-                max_tokens=4096
+                max_tokens=2048,
+                use_cache=True
             ):
-                if chunk:
-                    chunks.append(chunk)
+                if not chunk:
+                    continue
+                chunks.append(chunk)
+                for record in parser.feed(chunk):
+                    if record["parent_task_id"] is None:
+                        if root_id is None:
+                            root_id = record["id"]
+                            main_title = str(record.get("title", ""))
+                    elif record["parent_task_id"] == root_id and len(branches) < self.fanout_max_branches:
+                        branches.append(asyncio.create_task(self._expand_branch(goal, main_title, record, sem)))
 
-            full_text = "".join(chunks)
+            full_text: str = "".join(chunks)
             json_text: Optional[str] = self._extract_json_block(full_text)
             if not json_text:
                 raise ValueError("JSON分解失败：未产生任务。")
-            task_structure = json.loads(json_text)
+            outline: Dict[str, Any] = json.loads(json_text)
+            tasks: List[TaskInfo] = [TaskService.parse_task_info(t) for t in outline.get("tasks") or []]
+            if not tasks:
+                raise ValueError("JSON分解失败：未产生任务。")
 
-            ai_request_id = await self._save_ai_request(user_id, goal, json_text)
-            
-            # 保存任务分解结果和上下文
-            await self._save_task_decomposition(ai_request_id, user_id, task_structure, workspace_id, project_id)
+            phases: List[TaskInfo] = tasks[0].subtasks[:self.fanout_max_branches]
+            # 流式解析没有读到的阶段（例如大纲没有开始标记）在这里补上
+            for phase in phases[len(branches):]:
+                branches.append(asyncio.create_task(
+                    self._expand_branch(goal, tasks[0].title, asdict(phase), sem)
+                ))
+            expanded: List[Optional[List[TaskInfo]]] = await asyncio.gather(*branches)
+        finally:
+            for branch in branches:
+                if not branch.done():
+                    branch.cancel()
 
-            # 随后保存当前上下文
-            await self.db_manager.release_connection(db)
+        for phase, subtasks in zip(phases, expanded):
+            if subtasks and not phase.subtasks:
+                phase.subtasks = subtasks
 
-            return {
-                "success": True,
-                "data": task_structure,
-                "message": "任务分解成功",
-                "timestamp": datetime.now().isoformat()
-            }
-        except json.JSONDecodeError as exc:
-            raise Exception(f"AI返回结果解析失败: {str(exc)} | 片段: {full_text[:200]}")
+        merged: TaskListInfo = TaskListInfo(
+            main_goal=str(outline.get("main_goal", goal)),
+            summary=str(outline.get("summary", "")),
+            tasks=tasks
+        )
+        task_structure: Dict[str, Any] = asdict(merged)
+        return full_text, json.dumps(task_structure, ensure_ascii=False), task_structure
+
+    async def _expand_branch(
+        self,
+        goal: str,
+        main_title: str,
+        phase: Dict[str, Any],
+        sem: asyncio.Semaphore
+    ) -> Optional[List[TaskInfo]]:
+        """
+        私有函数：展开一个阶段的子任务；失败时返回None，由调用方保留为叶子任务。
+        """
+        message: str = (
+            f"总目标：{goal}\n主任务：{main_title}\n"
+            f"需要展开的阶段：{phase.get('title', '')}\n阶段说明：{phase.get('description', '')}\n"
+            f"阶段预估耗时：{phase.get('estimated_time', '')} {phase.get('estimated_time_unit', '')}"
+        )
+        async with sem:
+            try:
+                chunks: List[str] = []
+                async for chunk in self.llm_fetcher.fetch_stream(
+                    msg=message,
+                    system_prompt=self.prompt_task_expand,
+                    temperature=0.5,
+                    max_tokens=4096,
+                    use_cache=True
+                ):
+                    if chunk:
+                        chunks.append(chunk)
+                json_text: Optional[str] = self._extract_json_block("".join(chunks))
+                if not json_text:
+                    raise ValueError("未产生子任务")
+                payload: Dict[str, Any] = json.loads(json_text)
+                return [TaskService.parse_task_info(item) for item in payload.get("subtasks") or []]
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"Warning: 阶段展开失败，保留为叶子任务: {phase.get('title', '')}: {exc}")
+                return None
+
+    async def submit_decompose_job(
+        self,
+        user_id: str,
+        goal: str,
+        workspace_id: str,
+        project_id: str,
+        runner: JobRunner,
+        mode: str = "single"
+    ) -> Dict[str, Any]:
+        """
+        以后台任务模式提交任务分解：先写入状态为`queued`的请求记录，再交给执行器运行。
+        - 调用方随后可通过`get_decompose_job`轮询状态（queued/running/done/failed）与结果。
+
+        Args:
+            user_id (str): 用户ID。
+            goal (str): 用户目标。
+            workspace_id (str): 目标工作空间ID。
+            project_id (str): 目标工程ID。
+            runner (JobRunner): 后台任务执行器。
+            mode (str): 分解模式，见`decompose_task`。
+
+        Returns:
+            Dict[str, Any]: 包含`ai_request_id`与`status`。
+
+        Raises:
+            JobQueueFullError: 排队任务数已达上限，此时请求记录会被标记为failed。
+        """
+        try:
+            conn = await self.db_manager.get_connection(5.0)
+            try:
+                ai_request_id = await self._save_ai_request(user_id, goal, "", status="queued", conn=conn)
+            finally:
+                await self.db_manager.release_connection(conn)
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
+
+        try:
+            runner.submit(lambda: self._run_decompose_job(
+                ai_request_id, user_id, goal, workspace_id, project_id, mode
+            ))
+        except JobQueueFullError as exc:
+            await self._set_ai_request_status(ai_request_id, "failed", str(exc))
+            raise
+
+        return {"ai_request_id": ai_request_id, "status": "queued"}
+
+    async def _run_decompose_job(
+        self,
+        ai_request_id: str,
+        user_id: str,
+        goal: str,
+        workspace_id: str,
+        project_id: str,
+        mode: str = "single"
+    ) -> None:
+        """
+        私有函数：后台执行一次任务分解，并把状态写回`ai_requests`。
+        """
+        await self._set_ai_request_status(ai_request_id, "running")
+        try:
+            _, json_text, task_structure = await self._generate_by_mode(goal, mode)
+
+            conn = await self.db_manager.get_connection(5.0)
+            try:
+                async with conn.transaction():
+                    await conn.execute(
+                        AI_REQUEST_STATUS_UPDATE_QUERY, ai_request_id, "done", json_text
+                    )
+                    await self._save_task_decomposition(
+                        ai_request_id, user_id, task_structure, workspace_id, project_id, conn=conn
+                    )
+            finally:
+                await self.db_manager.release_connection(conn)
+        except asyncio.CancelledError:
+            await self._set_ai_request_status(ai_request_id, "failed", "任务被取消")
+            raise
         except Exception as exc:
-            raise Exception(f"任务分解失败: {str(exc)}")
+            await self._set_ai_request_status(ai_request_id, "failed", f"任务分解失败: {str(exc)}")
+
+    async def _set_ai_request_status(
+        self,
+        ai_request_id: str,
+        status: str,
+        response: Optional[str] = None
+    ) -> None:
+        """
+        私有函数：更新AI请求记录的状态；`response`为None时保留原有的回答内容。
+        """
+        try:
+            conn = await self.db_manager.get_connection(5.0)
+            try:
+                await conn.execute(AI_REQUEST_STATUS_UPDATE_QUERY, ai_request_id, status, response)
+            finally:
+                await self.db_manager.release_connection(conn)
+        except Exception as exc:
+            # 记录日志但不中断主流程
+            print(f"更新AI请求状态失败: {str(exc)}")
+
+    async def get_decompose_job(
+        self,
+        user_id: str,
+        ai_request_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        获取任务分解请求的状态，完成时一并返回分解结果。
+
+        Args:
+            user_id (str): 用户ID。
+            ai_request_id (str): AI请求ID。
+
+        Returns:
+            Optional[Dict[str, Any]]: 包含`status`、`result`与`error`；找不到时返回None。
+        """
+        try:
+            conn = await self.db_manager.get_connection(5.0)
+            try:
+                row = await conn.fetchrow(
+                    """
+                    SELECT r.id, r.status, r.response_text,
+                           s.id AS suggestion_id, s.suggestion, s.metadata, s.created_at
+                    FROM ai_requests r
+                    LEFT JOIN ai_task_suggestions s ON s.ai_request_id = r.id
+                    WHERE r.id = $1 AND r.user_id = $2
+                    """,
+                    ai_request_id, user_id
+                )
+            finally:
+                await self.db_manager.release_connection(conn)
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
+
+        if not row:
+            return None
+
+        result: Optional[Dict[str, Any]] = None
+        if row["suggestion_id"] is not None:
+            result = {
+                "id": row["suggestion_id"],
+                "ai_request_id": row["id"],
+                # jsonb由连接上的编解码器直接解码（见`install_codecs`）
+                "suggestion": row["suggestion"],
+                "metadata": row["metadata"],
+                "created_at": _isoformat(row["created_at"])
+            }
+        return {
+            "ai_request_id": str(row["id"]),
+            "status": row["status"],
+            "result": result,
+            "error": row["response_text"] if row["status"] == "failed" else None
+        }
 
     async def _save_ai_request(
         self,
         user_id: str,
         prompt: str,
         response: str,
-        status: str = "done"
+        status: str = "done",
+        conn: Optional[Connection] = None
     ) -> str:
         """
         保存AI请求记录到数据库。
@@ -97,21 +593,21 @@ class AITaskService:
             prompt (str): 用户输入的提示词。
             response (str): 来自LLM的回答。
             status (str): 请求状态，默认为'done'
+            conn (Optional[Connection]): 调用方持有的连接（通常处于事务中）；
+                传入时直接在该连接上执行，出错时向上抛出以便事务回滚。
         
         Returns:
             str: 生成的ai_request_id
         """
+        ai_request_id = str(uuid.uuid4())
+        if conn is not None:
+            await conn.execute(AI_REQUEST_INSERT_QUERY, ai_request_id, user_id, prompt, response, status)
+            return ai_request_id
+
         try:
-            ai_request_id = str(uuid.uuid4())
             conn = await self.db_manager.get_connection(5.0)
             try:
-                await conn.execute(
-                    """
-                    INSERT INTO ai_requests (id, user_id, prompt, response_text, status)
-                    VALUES ($1, $2, $3, $4, $5)
-                    """,
-                    ai_request_id, user_id, prompt, response, status
-                )
+                await conn.execute(AI_REQUEST_INSERT_QUERY, ai_request_id, user_id, prompt, response, status)
                 return ai_request_id
             finally:
                 await self.db_manager.release_connection(conn)
@@ -126,7 +622,8 @@ class AITaskService:
         user_id: str,
         task_structure: Dict[str, Any],
         workspace_id: str,
-        project_id: str
+        project_id: str,
+        conn: Optional[Connection] = None
     ) -> None:
         """
         保存任务分解结果到数据库。
@@ -136,23 +633,24 @@ class AITaskService:
             task_structure (Dict[str, Any]): 任务分解结构。
             workspace_id (str): 工作空间ID。
             project_id (str): 项目ID。
+            conn (Optional[Connection]): 调用方持有的连接，语义同`_save_ai_request`。
         """
+        args = (
+            ai_request_id, user_id, task_structure,
+            {
+                "workspace_id": workspace_id,
+                "project_id": project_id
+            }
+        )
+        if conn is not None:
+            await conn.execute(AI_TASK_SUGGESTION_INSERT_QUERY, *args)
+            return
+
         try:
             conn = await self.db_manager.get_connection(5.0)
             try:
                 # 保存任务分解结果
-                await conn.execute(
-                    """
-                    INSERT INTO ai_task_suggestions 
-                    (ai_request_id, user_id, suggestion, metadata)
-                    VALUES ($1, $2, $3, $4)
-                    """,
-                    ai_request_id, user_id, json.dumps(task_structure), 
-                    json.dumps({
-                        "workspace_id": workspace_id,
-                        "project_id": project_id
-                    })
-                )
+                await conn.execute(AI_TASK_SUGGESTION_INSERT_QUERY, *args)
             finally:
                 await self.db_manager.release_connection(conn)
         except Exception as exc:
@@ -189,9 +687,9 @@ class AITaskService:
                     return {
                         "id": row["id"],
                         "ai_request_id": row["ai_request_id"],
-                        "suggestion": json.loads(row["suggestion"]) if isinstance(row["suggestion"], str) else row["suggestion"],
-                        "metadata": json.loads(row["metadata"]) if isinstance(row["metadata"], str) else row["metadata"],
-                        "created_at": row["created_at"].isoformat() if row["created_at"] else None
+                        "suggestion": row["suggestion"],
+                        "metadata": row["metadata"],
+                        "created_at": _isoformat(row["created_at"])
                     }
                 return None
             finally:
@@ -207,19 +705,30 @@ class AITaskService:
     ) -> Dict[str, Any]:
         """
         获取特定任务的AI建议。
+        - 同一用户对同一任务的并发请求只执行一次，共享结果。
         
         """
+        if self.single_flight is None:
+            return await self._get_task_suggestions(user_id, task_id)
+        return await self.single_flight.do(
+            f"ai:suggest:{user_id}:{task_id}",
+            lambda: self._get_task_suggestions(user_id, task_id)
+        )
+
+    async def _get_task_suggestions(self, user_id: str, task_id: str) -> Dict[str, Any]:
+        """私有函数：`get_task_suggestions`的实际执行过程。"""
         try:
             task_info = await self._get_task_info(task_id)
             system_prompt = self.prompt_task_suggestion
 
             user_message = f"请为以下任务提供完成建议：{task_info['title']} - {task_info['description']}"
 
-            response = self.llm_fetcher.fetch(
+            response = await self.llm_fetcher.fetch(
                 msg=user_message,
                 system_prompt=system_prompt,
                 temperature=0.3,
-                max_tokens=2048
+                max_tokens=2048,
+                use_cache=True
             )
 
             ai_response_content = response.choices[0].message.content
@@ -237,6 +746,8 @@ class AITaskService:
                 "timestamp": datetime.now().isoformat()
             }
 
+        except LLMRateLimitedError:
+            raise
         except Exception as exc:
             raise Exception(f"获取任务建议失败: {str(exc)}")
 
@@ -261,44 +772,196 @@ class AITaskService:
         except Exception as exc:
             raise Exception(f"获取任务信息失败: {str(exc)}")
 
-    def _extract_json_block(self, text: str) -> Optional[str]:
+    async def get_task_suggestions_batch(self, user_id: str, task_ids: List[str]) -> Dict[str, Any]:
         """
-        提取出JSON任务块内容，优先使用标记，否则回退到大括号匹配。
-        返回原始JSON字符串；若找不到有效JSON则返回None。
+        批量获取多个任务的AI建议。
+        - 用一条`WHERE id = ANY($1)`查询取出全部任务，先查单任务缓存，
+            未命中的任务按token预算打包进一个或几个提示词，各包并行请求（仍经过LLM并发控制器）。
+        - 结构化回答按`task_id`拆回到各个任务，并逐个写入缓存；每个建议的结构与`get_task_suggestions`相同。
+        - 某一包失败时只影响该包中的任务，它们会出现在`failed`中，其余结果照常返回。
+
+        Args:
+            user_id (str): 用户ID。
+            task_ids (List[str]): 任务ID列表，重复的ID只处理一次。
+
+        Returns:
+            (Dict[str, Any]): `data`中包含`suggestions`（任务ID -> 建议）、`missing`（不存在的任务ID）、
+                `failed`（未得到建议的任务ID）与`cached`（命中缓存的任务数）。
         """
-        begin = "<<<JSON_BEGIN>>>"
-        end = "<<<JSON_END>>>"
+        ordered_ids: List[str] = list(dict.fromkeys(task_ids))
+        try:
+            tasks: Dict[str, Dict[str, str]] = await self._get_task_infos(ordered_ids)
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
 
-        b = text.find(begin)
-        if b != -1:
-            e = text.find(end, b + len(begin))
-            if e != -1:
-                candidate = text[b + len(begin): e].strip()
-                if candidate:
-                    return candidate
+        missing: List[str] = [task_id for task_id in ordered_ids if task_id not in tasks]
+        # 同一任务的不同写法（大小写、连字符）只处理一次，建议按规范形式的ID记录
+        found: List[Dict[str, str]] = list(
+            {tasks[task_id]["id"]: tasks[task_id] for task_id in ordered_ids if task_id in tasks}.values()
+        )
 
-        # 回退：尝试寻找第一个左大括号到匹配的右大括号组成的合法JSON
-        content = text.strip()
-        if "{" not in content or "}" not in content:
-            return None
+        suggestions: Dict[str, Any] = {}
+        cached: List[Optional[Any]] = await asyncio.gather(*(self._get_cached_suggestion(t) for t in found))
+        pending: List[Dict[str, str]] = []
+        for task, suggestion in zip(found, cached):
+            if suggestion is not None:
+                suggestions[task["id"]] = suggestion
+            else:
+                pending.append(task)
+
+        batches: List[List[Dict[str, str]]] = self._pack_suggestion_batches(pending)
+        results: List[Dict[str, Any]] = await asyncio.gather(*(
+            self._suggest_batch(user_id, batch) for batch in batches
+        ))
+        for result in results:
+            suggestions.update(result)
+
+        return {
+            "success": True,
+            "data": {
+                "suggestions": {
+                    task_id: suggestions[tasks[task_id]["id"]]
+                    for task_id in ordered_ids if task_id in tasks and tasks[task_id]["id"] in suggestions
+                },
+                "missing": missing,
+                "failed": [
+                    task_id for task_id in ordered_ids if task_id in tasks and tasks[task_id]["id"] not in suggestions
+                ],
+                "cached": len(found) - len(pending),
+            },
+            "message": "建议获取成功",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def _get_task_infos(self, task_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        私有函数：一次查询取出多个任务的标题与描述；不是合法UUID的ID直接视为不存在。
+
+        Returns:
+            (Dict[str, Dict[str, str]]): 调用方传入的ID -> 任务信息，任务信息中的`id`为数据库中的规范形式。
+        """
+        # 调用方传入的ID可能是大写或不带连字符的形式
+        canonical: Dict[str, str] = {}
+        for task_id in task_ids:
+            try:
+                canonical[task_id] = str(uuid.UUID(task_id))
+            except ValueError:
+                continue
+        if not canonical:
+            return {}
+
+        conn = await self.db_manager.get_connection(5.0)
+        try:
+            rows = await conn.fetch(TASK_INFO_BATCH_QUERY, list(set(canonical.values())))
+        finally:
+            await self.db_manager.release_connection(conn)
+
+        by_id: Dict[str, Any] = {str(row["id"]): row for row in rows}
+        return {
+            task_id: {
+                "id": str(by_id[uuid_str]["id"]),
+                "title": by_id[uuid_str]["title"] or "",
+                "description": by_id[uuid_str]["description"] or "",
+            }
+            for task_id, uuid_str in canonical.items()
+            if uuid_str in by_id
+        }
+
+    def _pack_suggestion_batches(self, tasks: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """
+        私有函数：按顺序把任务贪心地装进若干包，每包的任务信息不超过token预算与任务数上限。
+        - 单个任务超过预算时单独成包。
+        """
+        batches: List[List[Dict[str, str]]] = []
+        current: List[Dict[str, str]] = []
+        used: int = 0
+        for task in tasks:
+            cost: int = estimate_tokens(json.dumps(task, ensure_ascii=False))
+            if current and (used + cost > self.suggestion_batch_token_budget
+                            or len(current) >= self.suggestion_batch_max_tasks):
+                batches.append(current)
+                current, used = [], 0
+            current.append(task)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _suggest_batch(self, user_id: str, batch: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        私有函数：用一次LLM调用获取一包任务的建议，按`task_id`拆分并写入缓存。
+        - 回答无法解析时返回空结果，该包的任务由调用方记入`failed`；限流错误向上抛出。
+        """
+        user_message: str = json.dumps({"tasks": batch}, ensure_ascii=False)
+        try:
+            response = await self.llm_fetcher.fetch(
+                msg=user_message,
+                system_prompt=self.prompt_task_suggestion_batch,
+                temperature=0.3,
+                max_tokens=min(8192, self.suggestion_tokens_per_task * len(batch)),
+                use_cache=True
+            )
+            content: Optional[str] = response.choices[0].message.content
+            json_text: Optional[str] = self._extract_json_block(content or "")
+            if not json_text:
+                raise ValueError("AI返回内容中没有JSON")
+            items: Any = json.loads(json_text).get("results")
+            if not isinstance(items, list):
+                raise ValueError("AI返回内容缺少results数组")
+        except LLMRateLimitedError:
+            raise
+        except Exception as exc:
+            print(f"Warning: 批量获取任务建议失败（{len(batch)}个任务）: {str(exc)}")
+            return {}
+
+        by_id: Dict[str, Dict[str, str]] = {t["id"]: t for t in batch}
+        result: Dict[str, Any] = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            task_id: str = str(item.pop("task_id", ""))
+            if task_id in by_id and task_id not in result:
+                result[task_id] = item
+        await asyncio.gather(*(self._set_cached_suggestion(by_id[i], s) for i, s in result.items()))
+        await self._save_ai_request(user_id, user_message, content or "")
+        return result
 
-        # 粗暴地寻找一个可解析的JSON片段
-        opens: List[int] = [i for i, ch in enumerate(content) if ch == "{"]
-        closes: List[int] = [i for i, ch in enumerate(content) if ch == "}"]
-        if not opens or not closes:
+    @staticmethod
+    def _suggestion_cache_key(task: Dict[str, str]) -> str:
+        """私有函数：单任务建议的缓存键，`task["id"]`为规范形式的任务ID。"""
+        digest: str = hashlib.sha256(
+            f"{task['title']}\0{task['description']}".encode("utf-8")
+        ).hexdigest()[:16]
+        return f"{SUGGESTION_CACHE_PREFIX}{task['id']}:{digest}"
+
+    async def _get_cached_suggestion(self, task: Dict[str, str]) -> Optional[Any]:
+        """私有函数：读取单任务建议缓存，Redis不可用时视为未命中。"""
+        if self.redis_manager is None or self.suggestion_cache_ttl <= 0:
+            return None
+        try:
+            return await self.redis_manager.get(self._suggestion_cache_key(task))
+        except Exception:
             return None
 
-        for start in opens:
-            for end_idx in reversed(closes):
-                if end_idx <= start:
-                    continue
-                candidate = content[start:end_idx + 1].strip()
-                try:
-                    json.loads(candidate)
-                    return candidate
-                except Exception:
-                    continue
-        return None
+    async def _set_cached_suggestion(self, task: Dict[str, str], suggestion: Any) -> None:
+        """私有函数：写入单任务建议缓存，失败时忽略。"""
+        if self.redis_manager is None or self.suggestion_cache_ttl <= 0:
+            return
+        try:
+            await self.redis_manager.set(
+                self._suggestion_cache_key(task), suggestion, expire=self.suggestion_cache_ttl
+            )
+        except Exception:
+            return
+
+    def _extract_json_block(self, text: str) -> Optional[str]:
+        """
+        提取出JSON任务块内容，优先使用标记，否则回退到大括号匹配。
+        返回原始JSON字符串；若找不到有效JSON则返回None。
+        """
+        return extract_json_block(text)
     
     async def save_context(
         self,
@@ -306,107 +969,303 @@ class AITaskService:
         project_id: str,
         user_id: str,
         context_msg: Tuple[LLMContext, LLMContext],  # 用户消息和AI回复
-        previous_msg_id: Optional[str] = None
+        token_counts: Optional[Tuple[Optional[int], Optional[int]]] = None
     ) -> Optional[str]:
         """
         储存特定工作空间、特定项目、特定用户的AI LLM上下文。
+        - 每个(工作空间, 项目, 用户)只有一个对话线程，本轮消息按递增的顺序号追加到线程末尾；
+            线程不存在时创建，整个过程只有一条SQL。
         Args:
             workspace_id: 工作空间ID。
             project_id: 项目ID。
             user_id: 用户ID。
             context_msg: 本片段内容。这个Tuple的长度为2，为保存用户输入和LLM输出。
-            previous_msg_id: 上一段对话的ID。
+            token_counts: 用户消息与AI回复的实际token数（例如平台返回的用量）；
+                为None或其中某项为None时使用`estimate_tokens`估算。
         Returns:
-            str: 返回新创建的对话ID
+            str: 返回对话线程的ID
         """
+        user_msg, ai_msg = context_msg
+        user_tokens, ai_tokens = token_counts or (None, None)
+        if not user_tokens:
+            user_tokens = estimate_tokens(user_msg.content)
+        if not ai_tokens:
+            ai_tokens = estimate_tokens(ai_msg.content)
+
         try:
-            conn = await self.db_manager.get_connection(5.0)
+            conn = await self.db_manager.get_connection(5.0, pin_key=user_id)
             try:
-                # 创建对话记录
-                conversation_row = await conn.fetchrow(
-                    """
-                    INSERT INTO ai_conversations 
-                    (project_id, workspace_id, creator_id, previous_conversation_id, model_name) 
-                    VALUES ($1, $2, $3, $4, $5)
-                    RETURNING id
-                    """,
-                    project_id, workspace_id, user_id, previous_msg_id, self.llm_fetcher.model
+                conversation_id = await conn.fetchval(
+                    CONTEXT_APPEND_QUERY,
+                    project_id, workspace_id, user_id, self.llm_fetcher.model,
+                    [user_msg.role, ai_msg.role],
+                    [user_msg.content, ai_msg.content],
+                    [user_tokens, ai_tokens]
                 )
-                
-                if not conversation_row:
+                if not conversation_id:
                     raise Exception("创建对话记录失败")
-
-                # 保存对话ID内容，用于创建子内容。
-                conversation_id = conversation_row['id']
-                
-                # 保存用户消息 - 暂时将token写为0，作为占位符。
-                user_msg = context_msg[0]
-                await conn.execute(
-                    """
-                    INSERT INTO ai_messages 
-                    (conversation_id, role, content, tokens, sequence_number) 
-                    VALUES ($1, $2, $3, $4, $5)
-                    """,
-                    conversation_id, user_msg.role, user_msg.content, 0, 1
-                )
-                
-                # 保存AI回复
-                ai_msg = context_msg[1]
-                await conn.execute(
-                    """
-                    INSERT INTO ai_messages 
-                    (conversation_id, role, content, tokens, sequence_number) 
-                    VALUES ($1, $2, $3, $4, $5)
-                    """,
-                    conversation_id, ai_msg.role, ai_msg.content, 0, 2
-                )
-                
-                return str(conversation_id)
-
             finally:
                 await self.db_manager.release_connection(conn)
         except Exception as exc:
             raise Exception(f"存储AI对话上下文失败: {str(exc)}")
 
+        # 数据库提交后再追加到缓存窗口；追加失败时窗口会缺少这一轮，直到过期后从数据库重建。
+        if self.context_cache is not None:
+            try:
+                await self.context_cache.append(workspace_id, project_id, user_id, [
+                    {"role": user_msg.role, "content": user_msg.content, "tokens": user_tokens},
+                    {"role": ai_msg.role, "content": ai_msg.content, "tokens": ai_tokens},
+                ])
+            except Exception as exc:
+                print(f"更新对话窗口缓存失败: {str(exc)}")
+
+        return str(conversation_id)
+
     async def get_context(
         self,
         workspace_id: str,
         project_id: str,
-        user_id: str
+        user_id: str,
+        token_budget: Optional[int] = None,
+        max_messages: Optional[int] = None
     ) -> List[LLMContext]:
         """
-        获取特定工作空间、特定项目、特定用户的AI LLM上下文全文内容。
+        获取特定工作空间、特定项目、特定用户最近的AI LLM上下文。
+        - 在对话线程中按顺序号倒序累加`ai_messages.tokens`（为0的旧数据按内容长度估算），
+            只返回累计不超过`token_budget`的最新消息，按时间正序排列。
+        - 启用Redis缓存时先读取缓存的对话窗口，在内存中按同样的规则截取；未命中时从数据库读取并懒重建。
+
+        Args:
+            workspace_id: 工作空间ID。
+            project_id: 项目ID。
+            user_id: 用户ID。
+            token_budget: 上下文的token预算，为None时使用配置中的`context_token_budget`。
+            max_messages: 最多扫描的最新消息条数，为None时使用配置中的`context_max_messages`。
+
+        Returns:
+            List[LLMContext]: 在预算内的最新消息。
         """
+        if token_budget is None:
+            token_budget = self.context_token_budget
+        if max_messages is None:
+            max_messages = self.context_max_messages
+
+        # 优先读取Redis中的对话窗口；窗口与数据库扫描的条数一致时才可直接使用。
+        if self.context_cache is not None and max_messages == self.context_max_messages:
+            try:
+                return await self._get_cached_context(workspace_id, project_id, user_id, token_budget)
+            except Exception as exc:
+                print(f"读取对话窗口缓存失败，回退到数据库: {str(exc)}")
+
+        rows = await self._fetch_context_rows(workspace_id, project_id, user_id, token_budget, max_messages)
+        return [LLMContext(role=row['role'], content=row['content']) for row in rows]
+
+    async def _get_cached_context(
+        self,
+        workspace_id: str,
+        project_id: str,
+        user_id: str,
+        token_budget: int
+    ) -> List[LLMContext]:
+        """
+        私有函数：从缓存窗口中取出预算内的消息；未命中时从数据库读取完整窗口并重建缓存。
+        """
+        assert self.context_cache is not None
+        messages: Optional[List[Dict[str, Any]]] = await self.context_cache.get(workspace_id, project_id, user_id)
+        if messages is None:
+            version: str = await self.context_cache.version(workspace_id, project_id, user_id)
+            # 缓存窗口会保留到过期，重建时从主库读取，避免缓存副本上落后的对话
+            rows = await self._fetch_context_rows(
+                workspace_id, project_id, user_id, CONTEXT_UNBOUNDED_BUDGET, self.context_max_messages,
+                readonly=False
+            )
+            messages = [{"role": r["role"], "content": r["content"], "tokens": r["tokens"]} for r in rows]
+            await self.context_cache.rebuild(workspace_id, project_id, user_id, messages, version)
+
+        # 与SQL中的窗口求和一致：从最新的消息开始累加，超出预算即停止。
+        selected: List[LLMContext] = []
+        used: int = 0
+        for message in reversed(messages):
+            used += message["tokens"] or estimate_tokens(message["content"])
+            if used > token_budget:
+                break
+            selected.append(LLMContext(role=message["role"], content=message["content"]))
+        selected.reverse()
+        return selected
+
+    async def _fetch_context_rows(
+        self,
+        workspace_id: str,
+        project_id: str,
+        user_id: str,
+        token_budget: int,
+        max_messages: int,
+        readonly: bool = True
+    ) -> List[Any]:
+        """私有函数：在数据库中按token预算读取最新的消息，默认可以读取只读副本。"""
         try:
-            conn = await self.db_manager.get_connection(5.0)
+            conn = await self.db_manager.get_connection(5.0, readonly=readonly, pin_key=user_id)
             try:
-                # 获取与指定用户、项目和工作空间相关的所有对话及消息
-                rows = await conn.fetch(
-                    """
-                    SELECT am.role, am.content, am.tokens
-                    FROM ai_messages am
-                    JOIN ai_conversations ac ON am.conversation_id = ac.id
-                    WHERE ac.project_id = $1 
-                      AND ac.workspace_id = $2 
-                      AND ac.creator_id = $3
-                      AND ac.deleted_at IS NULL
-                    ORDER BY ac.created_at, am.sequence_number
-                    """,
-                    project_id, workspace_id, user_id
+                return await conn.fetch(
+                    CONTEXT_WINDOW_QUERY,
+                    project_id, workspace_id, user_id, token_budget, max_messages
                 )
-                
-                # 将查询结果转换为 LLMContext 列表
-                context_list: List[LLMContext] = []
-                for row in rows:
-                    context_list.append(LLMContext(
-                        role=row['role'],
-                        content=row['content'],
-                    ))
-                
-                return context_list
-
             finally:
                 await self.db_manager.release_connection(conn)
         except Exception as exc:
             raise Exception(f"读取AI对话上下文失败: {str(exc)}")
 
+    def schedule_context_compaction(
+        self,
+        workspace_id: str,
+        project_id: str,
+        user_id: str,
+        runner: JobRunner
+    ) -> None:
+        """
+        在后台检查并压缩对话，不阻塞当前请求；队列已满时跳过，下一轮对话结束后会再次检查。
+
+        Args:
+            workspace_id: 工作空间ID。
+            project_id: 项目ID。
+            user_id: 用户ID。
+            runner (JobRunner): 后台任务执行器。
+        """
+        if self.context_compact_threshold <= 0:
+            return
+        try:
+            runner.submit(lambda: self.compact_context(workspace_id, project_id, user_id))
+        except JobQueueFullError:
+            pass
+
+    async def compact_context(self, workspace_id: str, project_id: str, user_id: str) -> bool:
+        """
+        未压缩消息的token总数超过`context_compact_threshold`时，把较早的对话（连同之前的摘要）
+        摘要为一条system消息，并把这些消息标记为已压缩；之后`get_context`返回摘要加最近的对话。
+        - 按轮次（一问一答）为单位保留最近`context_compact_keep_tokens`个token的原始消息，最新一轮总会保留。
+        - 送入摘要的旧对话最多`context_compact_max_input_tokens`个token，更早的直接标记为已压缩。
+        - 写入摘要与标记在同一个事务中；期间有其他压缩已完成时回滚，不会重复摘要。
+        - 在后台运行，出错时只记录日志，下一轮对话结束后会再次尝试。
+
+        Args:
+            workspace_id: 工作空间ID。
+            project_id: 项目ID。
+            user_id: 用户ID。
+
+        Returns:
+            bool: 是否进行了压缩。
+        """
+        if self.context_compact_threshold <= 0:
+            return False
+        try:
+            if self.single_flight is None:
+                return await self._compact_context(workspace_id, project_id, user_id)
+            return await self.single_flight.do(
+                f"ai:compact:{workspace_id}:{project_id}:{user_id}",
+                lambda: self._compact_context(workspace_id, project_id, user_id)
+            )
+        except Exception as exc:
+            print(f"压缩AI对话上下文失败: {str(exc)}")
+            return False
+
+    async def _compact_context(self, workspace_id: str, project_id: str, user_id: str) -> bool:
+        """私有函数：检查阈值、生成摘要并写入。"""
+        conn = await self.db_manager.get_connection(5.0)
+        try:
+            total: int = await conn.fetchval(CONTEXT_ACTIVE_TOKENS_QUERY, project_id, workspace_id, user_id)
+            if total <= self.context_compact_threshold:
+                return False
+            rows = await conn.fetch(CONTEXT_ACTIVE_MESSAGES_QUERY, project_id, workspace_id, user_id)
+        finally:
+            await self.db_manager.release_connection(conn)
+
+        older: List[Any] = self._split_for_compaction(rows, self.context_compact_keep_tokens)
+        if all(row["is_summary"] for row in older):
+            # 只剩之前的摘要可压缩，重新摘要没有意义
+            return False
+
+        # 生成摘要时不占用数据库连接
+        response = await self.llm_fetcher.fetch(
+            msg=self._format_compaction_transcript(older, self.context_compact_max_input_tokens),
+            system_prompt=self.prompt_context_summary,
+            temperature=0.3,
+            max_tokens=self.context_summary_max_tokens
+        )
+        summary: str = (response.choices[0].message.content or "").strip()
+        if not summary:
+            return False
+        usage = getattr(response, "usage", None)
+        summary_tokens: int = (getattr(usage, "completion_tokens", None) if usage else None) \
+            or estimate_tokens(summary)
+
+        ids: List[str] = [str(row["id"]) for row in older]
+        conn = await self.db_manager.get_connection(5.0, pin_key=user_id)
+        try:
+            async with conn.transaction():
+                status: str = await conn.execute(CONTEXT_COMPACT_MARK_QUERY, ids)
+                if int(status.split()[-1]) != len(ids):
+                    # 这些消息已被其他压缩覆盖，回滚以免重复摘要
+                    raise RuntimeError("对话已被并发压缩")
+                await conn.execute(
+                    CONTEXT_SUMMARY_INSERT_QUERY,
+                    older[-1]["conversation_id"], summary, summary_tokens, older[-1]["sequence_number"]
+                )
+        finally:
+            await self.db_manager.release_connection(conn)
+
+        if self.context_cache is not None:
+            try:
+                await self.context_cache.invalidate(workspace_id, project_id, user_id)
+            except Exception as exc:
+                print(f"清除对话窗口缓存失败: {str(exc)}")
+        return True
+
+    @staticmethod
+    def _split_for_compaction(rows: List[Any], keep_tokens: int) -> List[Any]:
+        """
+        私有函数：按轮次（从用户消息开始的一问一答）切分未压缩的消息，返回需要压缩的较早部分（按顺序）。
+        从最新的一轮开始保留，累计超过`keep_tokens`时停止；最新一轮总会保留。
+        """
+        groups: List[List[Any]] = []
+        for row in rows:
+            if groups and row["role"] != "user" and not row["is_summary"]:
+                groups[-1].append(row)
+            else:
+                groups.append([row])
+
+        kept: int = 1
+        used: int = sum(r["tokens"] for r in groups[-1]) if groups else 0
+        while kept < len(groups):
+            size: int = sum(r["tokens"] for r in groups[-1 - kept])
+            if used + size > keep_tokens:
+                break
+            used += size
+            kept += 1
+        return [row for group in groups[:len(groups) - kept] for row in group]
+
+    @staticmethod
+    def _format_compaction_transcript(older: List[Any], max_tokens: int) -> str:
+        """
+        私有函数：把待压缩的消息整理为摘要输入。
+        - 之前的摘要总会放在开头；其余对话从最新开始取，超过`max_tokens`后更早的不再送入。
+        - 回答中的思考过程不送入摘要。
+        """
+        summaries: List[str] = [row["content"] for row in older if row["is_summary"]]
+        lines: List[str] = []
+        used: int = sum(estimate_tokens(s) for s in summaries[-1:])
+        for row in reversed(older):
+            if row["is_summary"]:
+                continue
+            content: str = _THINKING_PATTERN.sub("", row["content"]).strip()
+            used += row["tokens"]
+            if used > max_tokens and lines:
+                break
+            speaker: str = "用户" if row["role"] == "user" else "助手"
+            lines.append(f"{speaker}：{content}")
+        lines.reverse()
+
+        parts: List[str] = []
+        if summaries:
+            parts.append("更早的摘要：\n" + summaries[-1])
+        parts.append("对话：\n" + "\n\n".join(lines))
+        return "\n\n".join(parts)
@@ -0,0 +1,157 @@
+from typing import Any, Dict, List, Optional
+import json
+
+from modules.redisman import RedisManager
+
+
+# 追加一轮对话：递增版本号；只有窗口已存在时才追加并截断，不存在时等待下次读取时重建。
+# KEYS[1]: 窗口列表  KEYS[2]: 版本号
+# ARGV[1]: 最大条数  ARGV[2]: 过期时间（秒）  ARGV[3...]: 消息
+_APPEND_SCRIPT: str = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+    redis.call('LTRIM', KEYS[1], -tonumber(ARGV[1]), -1)
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# 重建窗口：仅当读取数据库前后版本号未变化时写入，避免覆盖掉期间新追加的对话。
+# KEYS[1]: 窗口列表  KEYS[2]: 版本号
+# ARGV[1]: 读取数据库前的版本号（不存在时为空串）  ARGV[2]: 过期时间（秒）  ARGV[3...]: 消息
+_REBUILD_SCRIPT: str = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 2 then
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# 清除窗口：递增版本号使进行中的重建失效，并删除窗口，下次读取时从数据库重建。
+# KEYS[1]: 窗口列表  KEYS[2]: 版本号
+# ARGV[1]: 过期时间（秒）
+_INVALIDATE_SCRIPT: str = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+class ConversationWindowCache:
+    """
+    按(工作空间, 项目, 用户)在Redis中缓存最近的对话消息窗口。
+    - 窗口是一个定长列表，元素为`{"role", "content", "tokens"}`的JSON，按时间正序排列。
+    - 每轮对话结束后追加到末尾并截断；窗口不存在时不追加，由下一次读取从数据库懒重建。
+    - 窗口长度与`get_context`在数据库中扫描的最新消息条数一致，因此两条路径的结果相同。
+    - Redis出错时各方法直接抛出异常，由调用方降级到数据库。
+    """
+    def __init__(self, redis_manager: RedisManager, max_messages: int, ttl: int) -> None:
+        """
+        初始化缓存。
+
+        Args:
+            redis_manager (RedisManager): Redis管理器。
+            max_messages (int): 窗口保留的最大消息条数。
+            ttl (int): 窗口的过期时间（秒），对话不活跃时自动清理。
+        """
+        self.redis_manager: RedisManager = redis_manager
+        self.max_messages: int = max_messages
+        self.ttl: int = ttl
+
+    @staticmethod
+    def _keys(workspace_id: str, project_id: str, user_id: str) -> List[str]:
+        """私有函数：窗口列表与版本号的键。"""
+        base: str = f"ai:ctx:{workspace_id}:{project_id}:{user_id}"
+        return [base, f"{base}:ver"]
+
+    async def get(self, workspace_id: str, project_id: str, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取缓存的窗口。
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 按时间正序的消息；未缓存时返回None。
+        """
+        key, _ = self._keys(workspace_id, project_id, user_id)
+        items: List[str] = await self.redis_manager.list_range(key)
+        if not items:
+            return None
+        return [json.loads(item) for item in items]
+
+    async def version(self, workspace_id: str, project_id: str, user_id: str) -> str:
+        """
+        读取窗口的版本号，重建前调用，用于`rebuild`的并发检查。
+
+        Returns:
+            str: 版本号，不存在时为空串。
+        """
+        _, version_key = self._keys(workspace_id, project_id, user_id)
+        value = await self.redis_manager.get(version_key)
+        return "" if value is None else str(value)
+
+    async def rebuild(
+        self,
+        workspace_id: str,
+        project_id: str,
+        user_id: str,
+        messages: List[Dict[str, Any]],
+        version: str
+    ) -> bool:
+        """
+        用数据库中读出的消息重建窗口。
+
+        Args:
+            messages (List[Dict[str, Any]]): 按时间正序的消息。
+            version (str): 读取数据库前通过`version`取得的版本号。
+
+        Returns:
+            bool: 是否写入；期间有新对话追加时放弃写入。
+        """
+        encoded: List[str] = [
+            json.dumps(m, ensure_ascii=False) for m in messages[-self.max_messages:]
+        ]
+        written = await self.redis_manager.eval_script(
+            _REBUILD_SCRIPT,
+            self._keys(workspace_id, project_id, user_id),
+            [version, self.ttl, *encoded]
+        )
+        return bool(written)
+
+    async def append(
+        self,
+        workspace_id: str,
+        project_id: str,
+        user_id: str,
+        messages: List[Dict[str, Any]]
+    ) -> None:
+        """
+        追加一轮对话的消息，并使进行中的重建失效。
+
+        Args:
+            messages (List[Dict[str, Any]]): 按时间正序的新消息。
+        """
+        if not messages:
+            return
+        encoded: List[str] = [json.dumps(m, ensure_ascii=False) for m in messages]
+        await self.redis_manager.eval_script(
+            _APPEND_SCRIPT,
+            self._keys(workspace_id, project_id, user_id),
+            [self.max_messages, self.ttl, *encoded]
+        )
+
+    async def invalidate(self, workspace_id: str, project_id: str, user_id: str) -> None:
+        """
+        清除窗口，用于数据库中的历史消息被改写之后（例如对话压缩）。
+        """
+        await self.redis_manager.eval_script(
+            _INVALIDATE_SCRIPT,
+            self._keys(workspace_id, project_id, user_id),
+            [self.ttl]
+        )
@@ -1,6 +1,11 @@
-from typing import Any, Dict, List, Optional
-from modules.databaseman import DatabaseManager, DBTimeoutError
+from typing import Any, Dict, List, Optional, Union
+from modules.databaseman import DatabaseManager, DBTimeoutError, NamedQuery
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError, ResourceNotFoundError
+from .queries import (
+    PROJECTS_GET_BY_ID, PROJECTS_LIST_BY_WORKSPACE, PROJECTS_SOFT_DELETE,
+    TASKS_SOFT_DELETE, TASKS_SUMMARY_BY_ID,
+    WORKSPACES_GET_BY_ID, WORKSPACES_SOFT_DELETE
+)
 
 
 class ManagementService:
@@ -9,29 +14,38 @@ class ManagementService:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
 
-    async def _fetchrow(self, query: str, *params: Any) -> Optional[Dict[str, Any]]:
+    # 命名查询通过`db_manager.queries`执行（预编译并计入统计），其余按SQL文本执行
+    async def _fetchrow(self, query: Union[str, NamedQuery], *params: Any) -> Optional[Dict[str, Any]]:
         try:
             async with self.db_manager.acquire() as conn:
-                row = await conn.fetchrow(query, *params)
+                if isinstance(query, NamedQuery):
+                    row = await self.db_manager.queries.fetchrow(conn, query, *params)
+                else:
+                    row = await conn.fetchrow(query, *params)
                 return dict(row) if row else None
         except ConnectionError as exc:
             raise DatabaseConnectionError(str(exc))
         except DBTimeoutError as exc:
             raise DatabaseTimeoutError(str(exc))
 
-    async def _fetch(self, query: str, *params: Any) -> List[Dict[str, Any]]:
+    async def _fetch(self, query: Union[str, NamedQuery], *params: Any) -> List[Dict[str, Any]]:
         try:
             async with self.db_manager.acquire() as conn:
-                rows = await conn.fetch(query, *params)
+                if isinstance(query, NamedQuery):
+                    rows = await self.db_manager.queries.fetch(conn, query, *params)
+                else:
+                    rows = await conn.fetch(query, *params)
                 return [dict(row) for row in rows]
         except ConnectionError as exc:
             raise DatabaseConnectionError(str(exc))
         except DBTimeoutError as exc:
             raise DatabaseTimeoutError(str(exc))
 
-    async def _execute(self, query: str, *params: Any) -> str:
+    async def _execute(self, query: Union[str, NamedQuery], *params: Any) -> str:
         try:
             async with self.db_manager.acquire() as conn:
+                if isinstance(query, NamedQuery):
+                    return await self.db_manager.queries.execute(conn, query, *params)
                 return await conn.execute(query, *params)
         except ConnectionError as exc:
             raise DatabaseConnectionError(str(exc))
@@ -67,14 +81,7 @@ class ManagementService:
         )
 
     async def get_workspace(self, workspace_id: str) -> Dict[str, Any]:
-        row = await self._fetchrow(
-            """
-            SELECT id, organization_id, owner_user_id, name, description, settings, created_at, updated_at
-            FROM workspaces
-            WHERE id = $1 AND deleted_at IS NULL
-            """,
-            workspace_id,
-        )
+        row = await self._fetchrow(WORKSPACES_GET_BY_ID, workspace_id)
         if row is None:
             raise ResourceNotFoundError("Workspace not found")
         return row
@@ -103,12 +110,7 @@ class ManagementService:
         return row
 
     async def delete_workspace(self, workspace_id: str) -> str:
-        result = await self._execute(
-            """
-            UPDATE workspaces SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
-            """,
-            workspace_id,
-        )
+        result = await self._execute(WORKSPACES_SOFT_DELETE, workspace_id)
         return result
 
     # Project operations
@@ -133,15 +135,7 @@ class ManagementService:
 
     async def list_projects(self, workspace_id: Optional[str] = None) -> List[Dict[str, Any]]:
         if workspace_id:
-            return await self._fetch(
-                """
-                SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, metadata, created_at, updated_at
-                FROM projects
-                WHERE deleted_at IS NULL AND workspace_id = $1
-                ORDER BY created_at DESC
-                """,
-                workspace_id,
-            )
+            return await self._fetch(PROJECTS_LIST_BY_WORKSPACE, workspace_id)
         return await self._fetch(
             """
             SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, metadata, created_at, updated_at
@@ -152,14 +146,7 @@ class ManagementService:
         )
 
     async def get_project(self, project_id: str) -> Dict[str, Any]:
-        row = await self._fetchrow(
-            """
-            SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, metadata, created_at, updated_at
-            FROM projects
-            WHERE id = $1 AND deleted_at IS NULL
-            """,
-            project_id,
-        )
+        row = await self._fetchrow(PROJECTS_GET_BY_ID, project_id)
         if row is None:
             raise ResourceNotFoundError("Project not found")
         return row
@@ -188,12 +175,7 @@ class ManagementService:
         return row
 
     async def delete_project(self, project_id: str) -> str:
-        return await self._execute(
-            """
-            UPDATE projects SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
-            """,
-            project_id,
-        )
+        return await self._execute(PROJECTS_SOFT_DELETE, project_id)
 
     # Task operations
     async def create_task(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -246,14 +228,7 @@ class ManagementService:
         return await self._fetch(query, *values)
 
     async def get_task(self, task_id: str) -> Dict[str, Any]:
-        row = await self._fetchrow(
-            """
-            SELECT id, project_id, workspace_id, creator_id, assignee_id, title, description, status, priority, estimated_minutes, due_at, created_at, updated_at
-            FROM tasks
-            WHERE id = $1 AND deleted_at IS NULL
-            """,
-            task_id,
-        )
+        row = await self._fetchrow(TASKS_SUMMARY_BY_ID, task_id)
         if row is None:
             raise ResourceNotFoundError("Task not found")
         return row
@@ -290,10 +265,5 @@ class ManagementService:
         return row
 
     async def delete_task(self, task_id: str) -> str:
-        return await self._execute(
-            """
-            UPDATE tasks SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
-            """,
-            task_id,
-        )
+        return await self._execute(TASKS_SOFT_DELETE, task_id)
 
@@ -1,4 +1,4 @@
-from typing import Literal, List, Optional
+from typing import Any, Dict, Literal, List, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
 
@@ -52,10 +52,10 @@ class Task:
     started_at: Optional[str]
     completed_at: Optional[str]
     is_recurring: Optional[str] | Optional[bool]
-    recurrence_rule: Optional[str]
+    recurrence_rule: Optional[Dict[str, Any]]  # jsonb列由连接上的编解码器解码为对象
     recurrence_frequency: Optional[str]
-    recurrence_meta: Optional[str]
-    metadata: Optional[str]
+    recurrence_meta: Optional[Dict[str, Any]]
+    metadata: Optional[Dict[str, Any]]
     created_at: Optional[str]
     updated_at: Optional[str]
     deleted_at: Optional[str]
@@ -1,6 +1,7 @@
 from typing import Any, Dict, List, Optional
 from modules.databaseman import DatabaseManager, DBTimeoutError
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
+from .queries import PROJECTS_BRIEF_BY_ID, PROJECTS_BRIEF_BY_WORKSPACE, PROJECTS_SOFT_DELETE
 
 class ProjectService:
     def __init__(self, db: DatabaseManager):
@@ -16,7 +17,7 @@ class ProjectService:
             due_date: Optional[str]
         ) -> Dict[str, Any]:
         try:
-            conn = await self.db.get_connection(5.0)
+            conn = await self.db.get_connection(5.0, pin_key=workspace_id)
             try:
                 row = await conn.fetchrow(
                     """
@@ -40,12 +41,9 @@ class ProjectService:
             self, 
             workspace_id: str
         ) -> List[Dict[str, Any]]:
-        conn = await self.db.get_connection(5.0)
+        conn = await self.db.get_connection(5.0, readonly=True, pin_key=workspace_id)
         try:
-            rows = await conn.fetch(
-                "SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, created_at, updated_at FROM projects WHERE workspace_id=$1 AND deleted_at IS NULL",
-                workspace_id
-            )
+            rows = await self.db.queries.fetch(conn, PROJECTS_BRIEF_BY_WORKSPACE, workspace_id)
             return [dict(r) for r in rows]
         finally:
             await self.db.release_connection(conn)
@@ -56,10 +54,7 @@ class ProjectService:
         ) -> Optional[Dict[str, Any]]:
         conn = await self.db.get_connection(5.0)
         try:
-            row = await conn.fetchrow(
-                "SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, created_at, updated_at FROM projects WHERE id=$1 AND deleted_at IS NULL",
-                project_id
-            )
+            row = await self.db.queries.fetchrow(conn, PROJECTS_BRIEF_BY_ID, project_id)
             return dict(row) if row else None
         finally:
             await self.db.release_connection(conn)
@@ -82,14 +77,20 @@ class ProjectService:
                 f"UPDATE projects SET {', '.join(updates)} WHERE id=$1 AND deleted_at IS NULL RETURNING id, workspace_id, owner_id, title, description, start_date, due_date, archived, created_at, updated_at",
                 *params
             )
-            return dict(row) if row else None
+            if row is None:
+                return None
+            await self.db.pin_to_primary(row["workspace_id"])
+            return dict(row)
         finally:
             await self.db.release_connection(conn)
 
     async def delete_project(self, project_id: str) -> bool:
         conn = await self.db.get_connection(5.0)
         try:
-            result = await conn.execute("UPDATE projects SET deleted_at=now() WHERE id=$1 AND deleted_at IS NULL", project_id)
-            return result.startswith("UPDATE 1")
+            workspace_id = await self.db.queries.fetchval(conn, PROJECTS_SOFT_DELETE, project_id)
+            if workspace_id is None:
+                return False
+            await self.db.pin_to_primary(workspace_id)
+            return True
         finally:
             await self.db.release_connection(conn)
@@ -0,0 +1,160 @@
+"""
+服务层的常用命名查询，通过`DatabaseManager.queries`执行，在每条连接上只预编译一次。
+- 名称格式为`<表>.<操作>`，同时用于调用统计（`db.queries.stats()`）。
+- 多个服务共用的语句只在这里定义一次；按字段动态拼接的UPDATE等语句仍在各服务内构造。
+"""
+
+from modules.databaseman import NamedQuery
+
+
+# ---------- tasks ----------
+
+TASKS_GET_BY_ID: NamedQuery = NamedQuery("tasks.get_by_id", """
+    SELECT * FROM tasks WHERE id = $1 AND deleted_at IS NULL
+""")
+
+# 管理接口（api/v1）返回的字段
+TASKS_SUMMARY_BY_ID: NamedQuery = NamedQuery("tasks.summary_by_id", """
+    SELECT id, project_id, workspace_id, creator_id, assignee_id, title, description, status, priority, estimated_minutes, due_at, created_at, updated_at
+    FROM tasks
+    WHERE id = $1 AND deleted_at IS NULL
+""")
+
+TASKS_CHILDREN: NamedQuery = NamedQuery("tasks.children", """
+    SELECT id FROM tasks WHERE parent_task_id = $1 AND deleted_at IS NULL
+""")
+
+TASKS_LIST_BY_PROJECT: NamedQuery = NamedQuery("tasks.list_by_project", """
+    SELECT * FROM tasks WHERE project_id = $1 AND deleted_at IS NULL ORDER BY created_at DESC
+""")
+
+TASKS_LIST_BY_WORKSPACE: NamedQuery = NamedQuery("tasks.list_by_workspace", """
+    SELECT * FROM tasks WHERE workspace_id = $1 AND deleted_at IS NULL ORDER BY created_at DESC
+""")
+
+TASKS_ROOTS_BY_PROJECT: NamedQuery = NamedQuery("tasks.roots_by_project", """
+    SELECT * FROM tasks
+    WHERE project_id = $1 AND deleted_at IS NULL AND parent_task_id IS NULL
+    ORDER BY created_at DESC
+""")
+
+TASKS_ROOTS_BY_WORKSPACE: NamedQuery = NamedQuery("tasks.roots_by_workspace", """
+    SELECT * FROM tasks
+    WHERE workspace_id = $1 AND deleted_at IS NULL AND parent_task_id IS NULL
+    ORDER BY created_at DESC
+""")
+
+# 一次取回整棵子树，depth为节点相对根任务的深度。
+# LIMIT写在外层查询上时，PostgreSQL会在取够行数后停止递归。
+TASKS_SUBTREE: NamedQuery = NamedQuery("tasks.subtree", """
+    WITH RECURSIVE subtree AS (
+        SELECT t.*, 0 AS depth
+        FROM tasks t
+        WHERE t.id = $1 AND t.deleted_at IS NULL
+        UNION ALL
+        SELECT c.*, s.depth + 1
+        FROM tasks c
+        JOIN subtree s ON c.parent_task_id = s.id
+        WHERE c.deleted_at IS NULL AND s.depth < $2
+    )
+    SELECT * FROM subtree
+    LIMIT $3
+""")
+
+TASKS_INSERT: NamedQuery = NamedQuery("tasks.insert", """
+    INSERT INTO tasks
+    (project_id, workspace_id, creator_id, assignee_id, title, description, priority, estimated_minutes, due_at, parent_task_id)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+    RETURNING
+    id, project_id, workspace_id, creator_id, assignee_id,
+    title, description, status, priority, estimated_minutes,
+    due_at, created_at, updated_at
+""")
+
+# 一次写入整棵任务树，各任务的ID及上级任务ID均由客户端预先生成。
+TASKS_BULK_INSERT: NamedQuery = NamedQuery("tasks.bulk_insert", """
+    INSERT INTO tasks
+    (id, project_id, workspace_id, creator_id, title, description, priority, estimated_minutes, parent_task_id)
+    SELECT
+        t.id, $1, $2, $3, t.title, t.description, t.priority::priority_level, t.estimated_minutes, t.parent_task_id
+    FROM unnest($4::uuid[], $5::uuid[], $6::text[], $7::text[], $8::text[], $9::int[])
+        AS t(id, parent_task_id, title, description, priority, estimated_minutes)
+    RETURNING
+    id, project_id, workspace_id, creator_id, assignee_id, parent_task_id,
+    title, description, status, priority, estimated_minutes,
+    due_at, created_at, updated_at
+""")
+
+# 返回所属的工作空间，用于读写一致性（见`DatabaseManager.pin_to_primary`）
+TASKS_SOFT_DELETE: NamedQuery = NamedQuery("tasks.soft_delete", """
+    UPDATE tasks SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
+    RETURNING workspace_id
+""")
+
+# 子任务通过parent_task_id的ON DELETE CASCADE一并删除。
+TASKS_HARD_DELETE: NamedQuery = NamedQuery("tasks.hard_delete", """
+    DELETE FROM tasks WHERE id = $1
+""")
+
+
+# ---------- projects ----------
+
+# 管理接口（api/v1）返回完整字段；ProjectService返回不含metadata的精简字段
+PROJECTS_GET_BY_ID: NamedQuery = NamedQuery("projects.get_by_id", """
+    SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, metadata, created_at, updated_at
+    FROM projects
+    WHERE id = $1 AND deleted_at IS NULL
+""")
+
+PROJECTS_LIST_BY_WORKSPACE: NamedQuery = NamedQuery("projects.list_by_workspace", """
+    SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, metadata, created_at, updated_at
+    FROM projects
+    WHERE deleted_at IS NULL AND workspace_id = $1
+    ORDER BY created_at DESC
+""")
+
+PROJECTS_BRIEF_BY_ID: NamedQuery = NamedQuery("projects.brief_by_id", """
+    SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, created_at, updated_at
+    FROM projects
+    WHERE id = $1 AND deleted_at IS NULL
+""")
+
+PROJECTS_BRIEF_BY_WORKSPACE: NamedQuery = NamedQuery("projects.brief_by_workspace", """
+    SELECT id, workspace_id, owner_id, title, description, start_date, due_date, archived, created_at, updated_at
+    FROM projects
+    WHERE workspace_id = $1 AND deleted_at IS NULL
+""")
+
+# 返回所属的工作空间
+PROJECTS_SOFT_DELETE: NamedQuery = NamedQuery("projects.soft_delete", """
+    UPDATE projects SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
+    RETURNING workspace_id
+""")
+
+
+# ---------- workspaces ----------
+
+# 管理接口（api/v1）返回完整字段；WorkspaceService返回精简字段
+WORKSPACES_GET_BY_ID: NamedQuery = NamedQuery("workspaces.get_by_id", """
+    SELECT id, organization_id, owner_user_id, name, description, settings, created_at, updated_at
+    FROM workspaces
+    WHERE id = $1 AND deleted_at IS NULL
+""")
+
+WORKSPACES_BRIEF_BY_ID: NamedQuery = NamedQuery("workspaces.brief_by_id", """
+    SELECT id, name, description, owner_user_id, created_at, updated_at
+    FROM workspaces
+    WHERE id = $1 AND deleted_at IS NULL
+""")
+
+WORKSPACES_BRIEF_BY_OWNER: NamedQuery = NamedQuery("workspaces.brief_by_owner", """
+    SELECT id, name, description, owner_user_id, created_at, updated_at
+    FROM workspaces
+    WHERE owner_user_id = $1 AND deleted_at IS NULL
+""")
+
+# 返回所有者，其工作空间列表需读到这次删除
+WORKSPACES_SOFT_DELETE: NamedQuery = NamedQuery("workspaces.soft_delete", """
+    UPDATE workspaces SET deleted_at = now() WHERE id = $1 AND deleted_at IS NULL
+    RETURNING owner_user_id
+""")
@@ -0,0 +1,119 @@
+from typing import Any, Dict, List, Optional
+
+from modules.json_extractor import TaskStreamParser
+from .task_service import TaskService
+from .models.task_data_model import Task
+
+
+class StreamingTaskCreator:
+    """
+    边读取LLM的流式回答边创建任务。
+    - 每输入一块回答，把其中新读完的任务（见`TaskStreamParser`）作为一批写入数据库并返回，
+        因此第一个任务可以在回答生成的最初几秒内出现，而不是等到整个回答结束。
+    - 任务ID在解析时预先生成，上级任务总是先于子任务写入。
+    - 出现第二个主任务、字段不合法或JSON语法错误时停止创建；`finish`/`abort`会删除已创建的部分，
+        由调用方按原来的整段解析方式处理。
+    - 不在两块之间占用数据库连接，每批写入时才获取。
+    """
+    def __init__(
+        self,
+        task_service: TaskService,
+        project_id: str,
+        workspace_id: str,
+        creator_id: str
+    ) -> None:
+        """
+        初始化。
+
+        Args:
+            task_service (TaskService): 任务服务。
+            project_id (str): 目标项目ID。
+            workspace_id (str): 目标工作空间ID。
+            creator_id (str): 任务创建者ID。
+        """
+        self.task_service: TaskService = task_service
+        self.project_id: str = project_id
+        self.workspace_id: str = workspace_id
+        self.creator_id: str = creator_id
+
+        self.parser: TaskStreamParser = TaskStreamParser()
+        self.created: List[Task] = []
+        # 已撤销的任务ID，调用方应通知已收到这些任务的客户端（见`take_discarded`）
+        self.discarded: List[str] = []
+        self.root_task_id: Optional[str] = None
+        self.error: Optional[str] = None
+
+    async def feed(self, chunk: str) -> List[Task]:
+        """
+        输入一块回答内容（不含思考内容）。
+
+        Args:
+            chunk (str): 回答内容。
+
+        Returns:
+            (List[Task]): 本次新创建的任务。
+        """
+        if self.error is not None:
+            return []
+        records: List[Dict[str, Any]] = self.parser.feed(chunk)
+        if self.parser.error is not None:
+            self.error = self.parser.error
+        if not records:
+            return []
+
+        rows: List[Dict[str, Any]] = []
+        try:
+            for record in records:
+                if record["parent_task_id"] is None:
+                    if self.root_task_id is not None:
+                        raise ValueError("Invalid task information format: Only ONE main task expected.")
+                    self.root_task_id = record["id"]
+                info = self.task_service.parse_task_info({**record, "subtasks": []})
+                rows.append(self.task_service._task_row(info, record["id"], record["parent_task_id"]))
+        except ValueError as exc:
+            self.error = str(exc)
+        if not rows:
+            return []
+
+        try:
+            tasks: List[Task] = await self.task_service.insert_task_rows(
+                rows, self.project_id, self.workspace_id, self.creator_id
+            )
+        except Exception as exc:
+            self.error = f"Failed to create streamed tasks: {exc}"
+            return []
+        self.created.extend(tasks)
+        return tasks
+
+    async def finish(self) -> bool:
+        """
+        回答结束时调用。
+
+        Returns:
+            (bool): 是否已经通过流式解析完整地创建了任务树；为False时调用方应回退到整段解析。
+        """
+        self.parser.close()
+        if self.error is None and self.parser.error is not None:
+            self.error = self.parser.error
+        if self.error is not None:
+            print(f"Warning: Streamed task creation failed: {self.error}")
+            await self.abort()
+            return False
+        return self.parser.done and self.root_task_id is not None
+
+    async def abort(self) -> None:
+        """
+        撤销已经创建的任务，例如客户端中途断开时。
+        """
+        if self.root_task_id is not None and self.created:
+            await self.task_service.discard_task_tree(self.root_task_id)
+        self.discarded.extend(task.id for task in self.created)
+        self.created = []
+        self.root_task_id = None
+
+    def take_discarded(self) -> List[str]:
+        """
+        取出上次调用以来撤销的任务ID。
+        """
+        discarded, self.discarded = self.discarded, []
+        return discarded
@@ -2,17 +2,44 @@ from typing import Any, Dict, List, Optional, Literal
 from datetime import datetime
 from uuid import UUID
 from modules.databaseman import DatabaseManager, DBTimeoutError
+from modules.json_extractor import extract_json_block
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError
 
 from dataclasses import asdict
 from asyncpg import Record
 import json
+import uuid
 
 from .models.task_data_model import *
+from .queries import (
+    TASKS_BULK_INSERT, TASKS_CHILDREN, TASKS_GET_BY_ID, TASKS_HARD_DELETE, TASKS_INSERT,
+    TASKS_LIST_BY_PROJECT, TASKS_LIST_BY_WORKSPACE, TASKS_ROOTS_BY_PROJECT, TASKS_ROOTS_BY_WORKSPACE,
+    TASKS_SOFT_DELETE, TASKS_SUBTREE
+)
+
+# 任务树的默认深度及节点上限。
+TASK_TREE_MAX_DEPTH: int = 64
+TASK_TREE_MAX_NODES: int = 10000
+
+# 查询结果中可能缺少的Task字段
+TASK_FIELD_DEFAULTS: Dict[str, Any] = {
+    "actual_minutes": None,
+    "started_at": None,
+    "completed_at": None,
+    "is_recurring": None,
+    "recurrence_rule": None,
+    "recurrence_frequency": None,
+    "recurrence_meta": None,
+    "metadata": None,
+    "deleted_at": None,
+}
 
 class TaskService:
     def __init__(self, db: DatabaseManager):
         self.db = db
+        # 连接上安装了UUID与ISO时间的编解码器（见`install_codecs`）时，查询结果已是字符串，
+        # 构造Task时不再逐字段转换；测试中的假数据库管理器没有该属性。
+        self._rows_are_text: bool = getattr(db, "iso_timestamps", False) is True
 
     async def create_task(
             self, 
@@ -42,17 +69,10 @@ class TaskService:
             due_at: 结束时间。
         """
         try:
-            conn = await self.db.get_connection(5.0)
+            conn = await self.db.get_connection(5.0, pin_key=workspace_id)
             try:
-                row = await conn.fetchrow(
-                    """
-                    INSERT INTO tasks 
-                    (project_id, workspace_id, creator_id, assignee_id, title, description, priority, estimated_minutes, due_at, parent_task_id)
-                    VALUES 
-                    ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10)
-                    RETURNING 
-                    id, project_id, workspace_id, creator_id, assignee_id, title, description, status, priority, estimated_minutes, due_at, created_at, updated_at
-                    """,
+                row = await self.db.queries.fetchrow(
+                    conn, TASKS_INSERT,
                     project_id, workspace_id, creator_id, assignee_id, title, description, priority, estimated_minutes, due_at, parent_task_id
                 )
                 if row is None:
@@ -70,7 +90,8 @@ class TaskService:
             project_id: str, 
             workspace_id: str, 
             creator_id: str,
-            json_message: str
+            json_message: str,
+            bulk: bool = True
     ) -> Optional[Task]:
         """
         基于JSON创建任务。
@@ -81,6 +102,7 @@ class TaskService:
             workspace_id (str): 当前工作空间ID
             creator_id (str): 任务创建者ID
             json_message (str): 创建JSON任务。
+            bulk (bool): 是否使用单条SQL批量写入整棵任务树。为False时逐条写入。
 
         Notes:
             输入的JSON格式见提示词部分。
@@ -116,7 +138,7 @@ class TaskService:
         if not isinstance(tasks_block, list) or not tasks_block:
             raise ValueError("Invalid task information format: 'tasks' must be a non-empty list.")
 
-        tasks: List[TaskInfo] = [self._parse_task_info(item) for item in tasks_block]
+        tasks: List[TaskInfo] = [self.parse_task_info(item) for item in tasks_block]
         if len(tasks) != 1:
             # 只能有1个主任务。
             raise ValueError("Invalid task information format: Only ONE main task expected.")
@@ -124,17 +146,27 @@ class TaskService:
         maintask: TaskInfo = tasks[0]
 
         try:
-            conn = await self.db.get_connection(5.0)
+            conn = await self.db.get_connection(5.0, pin_key=workspace_id)
             try:
                 async with conn.transaction():
-                    created_tree: Optional[TaskTree] = await self._recursive_create_tasks(
-                        task_info=maintask,
-                        project_id=project_id,
-                        workspace_id=workspace_id,
-                        creator_id=creator_id,
-                        parent_task_id=None,
-                        conn=conn
-                    )
+                    created_tree: Optional[TaskTree]
+                    if bulk:
+                        created_tree = await self._bulk_create_tasks(
+                            task_info=maintask,
+                            project_id=project_id,
+                            workspace_id=workspace_id,
+                            creator_id=creator_id,
+                            conn=conn
+                        )
+                    else:
+                        created_tree = await self._recursive_create_tasks(
+                            task_info=maintask,
+                            project_id=project_id,
+                            workspace_id=workspace_id,
+                            creator_id=creator_id,
+                            parent_task_id=None,
+                            conn=conn
+                        )
                 return created_tree.task if created_tree else None  # 返回TaskTree中的Task对象
             
             finally:
@@ -145,29 +177,13 @@ class TaskService:
             raise DatabaseTimeoutError(str(exc))
 
     def _normalize_json_message(self, json_message: Any) -> Optional[str]:
+        """
+        从消息中取出JSON块，见`modules.json_extractor`。
+        - 找不到JSON块时原样返回内容，由调用者在解析时报错。
+        """
         if json_message is None:
             return None
-        content = str(json_message).strip()
-        if not content:
-            return None
-
-        begin = "<<<JSON_BEGIN>>>"
-        end = "<<<JSON_END>>>"
-        if begin in content and end in content:
-            start = content.find(begin)
-            finish = content.find(end, start + len(begin))
-            if finish != -1:
-                content = content[start + len(begin):finish].strip()
-
-        if content.startswith("```"):
-            lines = content.splitlines()
-            if lines and lines[0].strip().startswith("```"):
-                lines = lines[1:]
-            if lines and lines[-1].strip().startswith("```"):
-                lines = lines[:-1]
-            content = "\n".join(lines).strip()
-
-        content = content.lstrip("\ufeff").strip()
+        content = str(json_message).lstrip("\ufeff").strip()
         if not content:
             return None
 
@@ -177,25 +193,169 @@ class TaskService:
         except json.JSONDecodeError:
             pass
 
-        if "{" not in content or "}" not in content:
-            return content
+        block: Optional[str] = extract_json_block(content)
+        return block if block is not None else content
 
-        opens = [i for i, ch in enumerate(content) if ch == "{"]
-        closes = [i for i, ch in enumerate(content) if ch == "}"]
-        for start in opens:
-            for end_idx in reversed(closes):
-                if end_idx <= start:
-                    continue
-                candidate = content[start:end_idx + 1].strip()
-                try:
-                    json.loads(candidate)
-                    return candidate
-                except Exception:
-                    continue
-
-        return content
+    def _flatten_task_info(
+            self,
+            task_info: TaskInfo,
+            parent_task_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        私有函数：按先序遍历将任务信息树展开为列表，并为每个任务预先生成UUID。
+        - 上级任务总是排在其子任务之前。
+
+        Args:
+            task_info (TaskInfo): 来自JSON的任务信息。
+            parent_task_id (Optional[str]): 上级任务ID。
+
+        Returns:
+            (List[Dict[str, Any]]): 展开后的任务，每项包含写入数据库所需的字段。
+        """
+        flattened: List[Dict[str, Any]] = []
+        stack: List[Dict[str, Any]] = [{"info": task_info, "parent_task_id": parent_task_id}]
+        while stack:
+            item: Dict[str, Any] = stack.pop()
+            info: TaskInfo = item["info"]
+            if not info.title:
+                raise ValueError("Task title is required.")
+
+            task_id: str = str(uuid.uuid4())
+            flattened.append(self._task_row(info, task_id, item["parent_task_id"]))
+            # 逆序压栈，保证子任务按原顺序出栈。
+            for subtask in reversed(info.subtasks):
+                stack.append({"info": subtask, "parent_task_id": task_id})
+        return flattened
+
+    def _task_row(self, info: TaskInfo, task_id: str, parent_task_id: Optional[str]) -> Dict[str, Any]:
+        """
+        私有函数：把一条任务信息转换为写入数据库所需的字段。
+        """
+        if not info.title:
+            raise ValueError("Task title is required.")
+        return {
+            "id": task_id,
+            "parent_task_id": parent_task_id,
+            "title": info.title,
+            "description": info.description,
+            "priority": info.priority,
+            "estimated_minutes": self._convert_to_minutes(info.estimated_time, info.estimated_time_unit),
+        }
+
+    async def _insert_task_rows(
+            self,
+            rows: List[Dict[str, Any]],
+            project_id: str,
+            workspace_id: str,
+            creator_id: str,
+            conn: Any
+    ) -> List[Record]:
+        """
+        私有函数：通过一条`INSERT ... SELECT FROM unnest(...)`写入若干条预先生成了ID的任务。
+        - 每条任务的上级任务必须已经存在，或者在同一批中。
+        """
+        return await self.db.queries.fetch(
+            conn, TASKS_BULK_INSERT,
+            project_id, workspace_id, creator_id,
+            [t["id"] for t in rows],
+            [t["parent_task_id"] for t in rows],
+            [t["title"] for t in rows],
+            [t["description"] for t in rows],
+            [t["priority"] for t in rows],
+            [t["estimated_minutes"] for t in rows],
+        )
+
+    async def insert_task_rows(
+            self,
+            rows: List[Dict[str, Any]],
+            project_id: str,
+            workspace_id: str,
+            creator_id: str
+    ) -> List[Task]:
+        """
+        写入一批预先生成了ID的任务（见`_task_row`），用于边读取LLM输出边创建任务。
+
+        Args:
+            rows (List[Dict[str, Any]]): 按先序排列的任务字段。
+            project_id (str): 目标项目ID。
+            workspace_id (str): 目标工作空间ID。
+            creator_id (str): 任务创建者ID。
+
+        Returns:
+            (List[Task]): 创建的任务，顺序与`rows`一致。
+        """
+        try:
+            conn = await self.db.get_connection(5.0, pin_key=workspace_id)
+            try:
+                records: List[Record] = await self._insert_task_rows(
+                    rows, project_id, workspace_id, creator_id, conn
+                )
+            finally:
+                await self.db.release_connection(conn)
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
+
+        position: Dict[str, int] = {t["id"]: i for i, t in enumerate(rows)}
+        ordered: List[Record] = sorted(records, key=lambda r: position[str(r["id"])])
+        return [self._build_task_from_row(r) for r in ordered]
+
+    async def discard_task_tree(self, task_id: str) -> None:
+        """
+        彻底删除一棵任务树（子任务随外键级联删除），用于撤销未完成的流式创建。
+
+        Args:
+            task_id (str): 根任务ID。
+        """
+        try:
+            conn = await self.db.get_connection(5.0)
+            try:
+                await self.db.queries.execute(conn, TASKS_HARD_DELETE, task_id)
+            finally:
+                await self.db.release_connection(conn)
+        except ConnectionError as exc:
+            raise DatabaseConnectionError(str(exc))
+        except DBTimeoutError as exc:
+            raise DatabaseTimeoutError(str(exc))
+
+    async def _bulk_create_tasks(
+            self,
+            task_info: TaskInfo,
+            project_id: str,
+            workspace_id: str,
+            creator_id: str,
+            conn: Any   # <- 必须有一个被创建了的连接实例
+    ) -> TaskTree:
+        """
+        输入任务信息，通过一条`INSERT ... SELECT FROM unnest(...)`写入整棵任务树。
+        - 各任务的UUID在客户端预先生成，因此上级任务ID在写入前即可确定。
+        - 返回的任务树结构与`_recursive_create_tasks`一致。
+
+        Args:
+            task_info (TaskInfo): 来自JSON的任务信息。
+            project_id (str): 目标项目ID。
+            workspace_id (str): 目标工作空间ID。
+            creator_id (str): 任务创建者ID。
+            conn (any): 来自外界的、被创建的连接实例。
+        """
+        flattened: List[Dict[str, Any]] = self._flatten_task_info(task_info)
+
+        rows: List[Record] = await self._insert_task_rows(
+            flattened, project_id, workspace_id, creator_id, conn
+        )
+        if len(rows) != len(flattened):
+            raise DatabaseConnectionError("Failed to create task from decomposition result.")
+
+        # RETURNING的顺序不做保证，按先序位置重新排列，以保持子任务顺序。
+        position: Dict[str, int] = {t["id"]: i for i, t in enumerate(flattened)}
+        ordered: List[Any] = sorted(rows, key=lambda r: position[str(r["id"])])
+
+        tree: Optional[TaskTree] = self._assemble_task_tree(ordered, flattened[0]["id"])
+        if tree is None:
+            raise DatabaseConnectionError("Failed to create task from decomposition result.")
+        return tree
 
-    
     async def _recursive_create_tasks(
             self,
             task_info: TaskInfo,
@@ -208,6 +368,7 @@ class TaskService:
         """
         输入任务信息，然后递归解析子任务。通过多条SQL创建任务并合并发送。
         - 该内容必须要引入来自外界的链接实例——递归解析子任务时不能创建更多的连接实例。
+        - 每个任务一次往返，仅作为`_bulk_create_tasks`的后备路径保留。
         - 返回任务树结构。
         
         Args:
@@ -247,15 +408,8 @@ class TaskService:
             # title, description, status, priority, estimated_minutes, 
             # due_at, created_at, updated_at
             # 共计13条属性
-            row = await conn.fetchrow(
-                """
-                INSERT INTO tasks (project_id, workspace_id, creator_id, assignee_id, title, description, priority, estimated_minutes, due_at, parent_task_id)
-                VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10)
-                RETURNING 
-                id, project_id, workspace_id, creator_id, assignee_id,
-                title, description, status, priority, estimated_minutes, 
-                due_at, created_at, updated_at
-                """,
+            row = await self.db.queries.fetchrow(
+                conn, TASKS_INSERT,
                 project_id, workspace_id, creator_id, None, task_info.title, task_info.description,
                 task_info.priority, estimated_minutes, None, parent_task_id
             )
@@ -281,9 +435,11 @@ class TaskService:
         # 返回任务树结构
         return TaskTree(created, children)
 
-    def _parse_task_info(self, payload: TaskInfo) -> TaskInfo:
+    @staticmethod
+    def parse_task_info(payload: TaskInfo) -> TaskInfo:
         """
         将原始字典转换为 TaskInfo，顺便做一些基本校验。
+        - 不访问数据库，AI任务服务与流式任务创建也直接使用。
         """
         if not isinstance(payload, dict):
             raise ValueError("Task item must be an object.")
@@ -314,7 +470,7 @@ class TaskService:
             estimated_time=estimated_time_val,
             estimated_time_unit=unit,
             priority=priority,
-            subtasks=[self._parse_task_info(item) for item in subtasks_raw]
+            subtasks=[TaskService.parse_task_info(item) for item in subtasks_raw]
         )
 
     def _build_task_from_row(
@@ -322,24 +478,15 @@ class TaskService:
             row: Any,
             parent_task_id: Optional[str] = None
     ) -> Task:
-        data = {key: self._normalize_db_value(value) for key, value in dict(row).items()}
-        if "parent_task_id" not in data:
+        if self._rows_are_text:
+            data: Dict[str, Any] = {**TASK_FIELD_DEFAULTS, **row}
+        else:
+            data = {**TASK_FIELD_DEFAULTS}
+            for key, value in row.items():
+                data[key] = self._normalize_db_value(value)
+        if "parent_task_id" not in row:
             data["parent_task_id"] = self._normalize_db_value(parent_task_id)
 
-        defaults = {
-            "actual_minutes": None,
-            "started_at": None,
-            "completed_at": None,
-            "is_recurring": None,
-            "recurrence_rule": None,
-            "recurrence_frequency": None,
-            "recurrence_meta": None,
-            "metadata": None,
-            "deleted_at": None,
-        }
-        for key, val in defaults.items():
-            data.setdefault(key, val)
-
         return Task(**data)
 
     def _normalize_db_value(self, value: Any) -> Any:
@@ -423,18 +570,12 @@ class TaskService:
             
         TODO: 我需要将这个地方改为列出全部的子任务的版本，参考ai_task_service.py。
         """
-        conn = await self.db.get_connection(5.0)
+        conn = await self.db.get_connection(5.0, readonly=True, pin_key=workspace_id)
         try:
             if project_id:
-                rows = await conn.fetch(
-                    "SELECT * FROM tasks WHERE project_id=$1 AND deleted_at IS NULL ORDER BY created_at DESC",
-                    project_id
-                )
+                rows = await self.db.queries.fetch(conn, TASKS_LIST_BY_PROJECT, project_id)
             else:
-                rows = await conn.fetch(
-                    "SELECT * FROM tasks WHERE workspace_id=$1 AND deleted_at IS NULL ORDER BY created_at DESC",
-                    workspace_id
-                )
+                rows = await self.db.queries.fetch(conn, TASKS_LIST_BY_WORKSPACE, workspace_id)
             return [self._build_task_from_row(r) for r in rows]
         finally:
             await self.db.release_connection(conn)
@@ -451,26 +592,12 @@ class TaskService:
         Returns:
             (List[Task]): 任务列表。
         """
-        conn = await self.db.get_connection(5.0)
+        conn = await self.db.get_connection(5.0, readonly=True, pin_key=workspace_id)
         try:
             if project_id:
-                rows = await conn.fetch(
-                    """
-                    SELECT * FROM tasks 
-                    WHERE project_id=$1 AND deleted_at IS NULL AND parent_task_id IS NULL
-                    ORDER BY created_at DESC
-                    """,
-                    project_id
-                )
+                rows = await self.db.queries.fetch(conn, TASKS_ROOTS_BY_PROJECT, project_id)
             else:
-                rows = await conn.fetch(
-                    """
-                    SELECT * FROM tasks 
-                    WHERE workspace_id=$1 AND deleted_at IS NULL AND parent_task_id IS NULL
-                    ORDER BY created_at DESC
-                    """,
-                    workspace_id
-                )
+                rows = await self.db.queries.fetch(conn, TASKS_ROOTS_BY_WORKSPACE, workspace_id)
             return [self._build_task_from_row(r) for r in rows]
         finally:
             await self.db.release_connection(conn)
@@ -484,28 +611,80 @@ class TaskService:
         """
         conn = await self.db.get_connection(5.0)
         try:
-            row = await conn.fetchrow("SELECT * FROM tasks WHERE id=$1 AND deleted_at IS NULL", task_id)
+            row = await self.db.queries.fetchrow(conn, TASKS_GET_BY_ID, task_id)
             return self._build_task_from_row(row) if row else None
         finally:
             await self.db.release_connection(conn)
     
     async def get_task_tree(
             self,
-            task_id: str
+            task_id: str,
+            max_depth: int = TASK_TREE_MAX_DEPTH,
+            max_nodes: int = TASK_TREE_MAX_NODES,
+            pin_key: Optional[str] = None
     ) -> Optional[TaskTree]:
         """
         根据任务ID，获取任务，及其所有的子任务。
-        - 该过程是一个递归过程，并会返回任务树结构。
+        - 使用一条`WITH RECURSIVE`查询取回整棵子树，随后在内存中按上级任务ID组装任务树。
+        - 深度超过`max_depth`的节点不会被取回；节点数超过`max_nodes`时抛出`ValueError`。
+
+        Args:
+            task_id (str): 根任务ID。
+            max_depth (int): 最大深度，根任务深度为0。
+            max_nodes (int): 最大节点数。
+            pin_key (Optional[str]): 提供时（通常为工作空间ID）从只读副本读取，该键最近写入过时仍读主库。
 
         Returns:
             (Optional[TaskTree]): 任务树。
         """
-        conn = await self.db.get_connection(5.0)
+        conn = await self.db.get_connection(5.0, readonly=pin_key is not None, pin_key=pin_key)
         try:
-            now_task = await self._task_tree_getter(task_id, conn)
-            return now_task
+            # 多取一行，用于判断是否超出节点上限。
+            rows: List[Record] = await self.db.queries.fetch(conn, TASKS_SUBTREE, task_id, max_depth, max_nodes + 1)
         finally:
             await self.db.release_connection(conn)
+
+        if len(rows) > max_nodes:
+            raise ValueError(f"Task tree of {task_id} exceeds {max_nodes} nodes.")
+        return self._assemble_task_tree(rows, task_id)
+
+    def _assemble_task_tree(
+            self,
+            rows: List[Any],
+            root_id: str
+    ) -> Optional[TaskTree]:
+        """
+        私有函数：将子树查询的结果行组装为任务树，时间复杂度为O(n)。
+        - 先为每一行建立节点，再通过上级任务ID索引把节点挂到父节点下。
+        - 子任务的顺序与结果行的顺序一致。
+
+        Args:
+            rows (List[Any]): 子树的全部行，可以带有`depth`列。
+            root_id (str): 根任务ID。
+
+        Returns:
+            (Optional[TaskTree]): 任务树；如果根任务不存在则返回None。
+        """
+        nodes: Dict[str, TaskTree] = {}
+        order: List[TaskTree] = []
+        for row in rows:
+            data: Dict[str, Any] = dict(row)
+            data.pop("depth", None)
+            node: TaskTree = TaskTree(self._build_task_from_row(data), [])
+            nodes[node.task.id] = node
+            order.append(node)
+
+        root: Optional[TaskTree] = nodes.get(str(root_id))
+        if root is None:
+            return None
+
+        for node in order:
+            if node is root:
+                continue
+            parent: Optional[TaskTree] = nodes.get(node.task.parent_task_id) if node.task.parent_task_id else None
+            if parent is not None:
+                parent.subtasks.append(node)
+        return root
     
     async def _task_tree_getter(
             self,
@@ -514,8 +693,10 @@ class TaskService:
     ) -> Optional[TaskTree]:
         """
         私有函数：递归获取任务和其他所有子任务。
+        - 每个节点需要两次查询，仅保留用于对比测试（见`benchmarks/bench_task_tree.py`）。
+        - 请使用`get_task_tree`。
         """
-        row: Record = await conn.fetchrow("SELECT * FROM tasks WHERE id=$1 AND deleted_at IS NULL", task_id)
+        row: Record = await self.db.queries.fetchrow(conn, TASKS_GET_BY_ID, task_id)
 
         now_task: Task = self._build_task_from_row(row)
 
@@ -523,9 +704,7 @@ class TaskService:
         now_tree: TaskTree = TaskTree(now_task, [])
         
         # 用这个获取子任务数量
-        else_ids: List[Record] = await conn.fetch(
-            "SELECT id FROM tasks WHERE parent_task_id=$1 AND deleted_at IS NULL", now_task.id
-        )
+        else_ids: List[Record] = await self.db.queries.fetch(conn, TASKS_CHILDREN, now_task.id)
 
         # 如果还有子任务
         if else_ids is not None:
@@ -557,7 +736,11 @@ class TaskService:
                 f"UPDATE tasks SET {', '.join(updates)} WHERE id=$1 AND deleted_at IS NULL RETURNING *",
                 *params
             )
-            return self._build_task_from_row(row) if row else None
+            if row is None:
+                return None
+            # 更新后才知道所属的工作空间
+            await self.db.pin_to_primary(row["workspace_id"])
+            return self._build_task_from_row(row)
         finally:
             await self.db.release_connection(conn)
 
@@ -567,8 +750,11 @@ class TaskService:
         ) -> bool:
         conn = await self.db.get_connection(5.0)
         try:
-            result = await conn.execute("UPDATE tasks SET deleted_at=now() WHERE id=$1 AND deleted_at IS NULL", task_id)
-            return result.startswith("UPDATE 1")
+            workspace_id = await self.db.queries.fetchval(conn, TASKS_SOFT_DELETE, task_id)
+            if workspace_id is None:
+                return False
+            await self.db.pin_to_primary(workspace_id)
+            return True
         finally:
             await self.db.release_connection(conn)
 
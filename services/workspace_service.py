@@ -1,6 +1,7 @@
 from typing import Dict, List, Optional, Any
 from modules.databaseman import DatabaseManager, DBTimeoutError
 from core.exceptions import DatabaseConnectionError, DatabaseTimeoutError, ResourceNotFoundError
+from .queries import WORKSPACES_BRIEF_BY_ID, WORKSPACES_BRIEF_BY_OWNER, WORKSPACES_SOFT_DELETE
 
 class WorkspaceService:
     """工作空间服务类，处理工作空间相关的业务逻辑"""
@@ -31,7 +32,7 @@ class WorkspaceService:
             DatabaseTimeoutError: 数据库操作超时
         """
         try:
-            conn = await self.db_manager.get_connection(5.0)
+            conn = await self.db_manager.get_connection(5.0, pin_key=owner_user_id)
             try:
                 row = await conn.fetchrow(
                     """
@@ -66,7 +67,7 @@ class WorkspaceService:
             DatabaseTimeoutError: 数据库操作超时
         """
         try:
-            conn = await self.db_manager.get_connection(5.0)
+            conn = await self.db_manager.get_connection(5.0, readonly=True)
             try:
                 rows = await conn.fetch(
                     """
@@ -102,15 +103,7 @@ class WorkspaceService:
         try:
             conn = await self.db_manager.get_connection(5.0)
             try:
-                row = await conn.fetchrow(
-                    """
-                    SELECT id, name, description, owner_user_id, created_at, updated_at
-                    FROM workspaces
-                    WHERE id = $1
-                    AND deleted_at IS NULL
-                    """,
-                    workspace_id
-                )
+                row = await self.db_manager.queries.fetchrow(conn, WORKSPACES_BRIEF_BY_ID, workspace_id)
                 if row:
                     return dict(row)
                 return None
@@ -138,18 +131,10 @@ class WorkspaceService:
             DatabaseTimeoutError: 数据库操作超时
         """
         try:
-            conn = await self.db_manager.get_connection(5.0)
+            conn = await self.db_manager.get_connection(5.0, readonly=True, pin_key=user_id)
             try:
 
-                rows = await conn.fetch(
-                    """
-                    SELECT id, name, description, owner_user_id, created_at, updated_at
-                    FROM workspaces
-                    WHERE owner_user_id = $1
-                    AND deleted_at IS NULL
-                    """,
-                    user_id
-                )
+                rows = await self.db_manager.queries.fetch(conn, WORKSPACES_BRIEF_BY_OWNER, user_id)
                 if rows:
                     return [dict(row) for row in rows]
                 return None
@@ -204,13 +189,11 @@ class WorkspaceService:
                     
                     row = await conn.fetchrow(update_query, *params)
                     if row:
+                        await self.db_manager.pin_to_primary(row["owner_user_id"])
                         return dict(row)
                 else:
                     # 如果没有要更新的字段，直接返回当前工作空间信息
-                    row = await conn.fetchrow(
-                        "SELECT id, name, description, owner_user_id, created_at, updated_at FROM workspaces WHERE id = $1 AND deleted_at IS NULL",
-                        workspace_id
-                    )
+                    row = await self.db_manager.queries.fetchrow(conn, WORKSPACES_BRIEF_BY_ID, workspace_id)
                     if row:
                         return dict(row)
                 return None
@@ -240,18 +223,12 @@ class WorkspaceService:
         try:
             conn = await self.db_manager.get_connection(5.0)
             try:
-                result = await conn.execute(
-                    """
-                    UPDATE workspaces 
-                    SET deleted_at = now()
-                    WHERE id = $1 AND deleted_at IS NULL
-                    """,
-                    workspace_id
-                )
+                owner_user_id = await self.db_manager.queries.fetchval(conn, WORKSPACES_SOFT_DELETE, workspace_id)
                 # 检查是否实际删除了记录
-                if result.startswith("UPDATE 1"):
-                    return True
-                return False
+                if owner_user_id is None:
+                    return False
+                await self.db_manager.pin_to_primary(owner_user_id)
+                return True
             finally:
                 await self.db_manager.release_connection(conn)
         except ConnectionError as e:
@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 
 import io
+import os
 
 @dataclass(frozen=True)
 class ServerSettings:
@@ -26,6 +27,23 @@ class DatabaseSettings:
     db_port: int
     minconn: int
     maxconn: int
+    # 在每条连接上预编译常用的命名查询；经过PgBouncer等事务级连接池代理时需关闭
+    prepare_statements: bool = True
+    # 连接持有超过该秒数时打印借出时的调用栈（为0时不检查），以及检查间隔（秒）
+    leak_threshold: float = 30.0
+    leak_check_interval: float = 5.0
+    # 每次借出连接时记录完整的调用栈，泄漏报告中附带；有额外开销，排查泄漏时开启
+    leak_stacks: bool = False
+    # 只读副本地址（host或host:port），为空时所有查询使用主库；写入后该秒数内同一用户/工作空间的读取仍使用主库
+    # （固定记录保存在Redis中，各worker共享，按秒向上取整），
+    # 以及副本出错后暂停使用的秒数
+    replica_hosts: Tuple[str, ...] = ()
+    read_your_writes_window: float = 2.0
+    replica_retry_interval: float = 10.0
+    # 查询结果中的时间直接解码为ISO格式的字符串（json/jsonb与uuid的编解码器总是安装）。
+    # 默认关闭：开启后所有服务、管理接口与api/v1读到的timestamp/timestamptz列都是str而不是datetime；
+    # 通过DB_ISO_TIMESTAMPS=1开启，TaskService构造Task时随之跳过逐字段转换
+    iso_timestamps: bool = False
 
 
 @dataclass(frozen=True)
@@ -41,12 +59,78 @@ class LLMSettings:
     api_url: str
     api_key: str
     model: str
+    # HTTP连接池与超时（秒）
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+
+
+@dataclass(frozen=True)
+class AISettings:
+    # 后台任务（如/ai/decompose/的任务模式）同时运行的最大数量
+    job_concurrency: int = 4
+    # 排队与运行中的后台任务数上限
+    job_max_pending: int = 100
+    # 对话上下文的token预算，以及最多扫描的最新消息条数
+    context_token_budget: int = 8192
+    context_max_messages: int = 200
+    # Redis中对话窗口缓存的过期时间（秒），为0时不启用缓存
+    context_cache_ttl: int = 3600
+    # LLM回答缓存：过期时间（秒，为0时不启用）、单条最大字节数、最大条目数
+    llm_cache_ttl: int = 0
+    llm_cache_max_entry_bytes: int = 256 * 1024
+    llm_cache_max_entries: int = 10000
+    # 相同AI请求合并：跨worker锁的过期时间（秒），以及结果保留时间（秒）
+    singleflight_lock_ttl: int = 300
+    singleflight_result_ttl: int = 30
+    # LLM调用控制：每个worker的最大并发数，集群每秒请求数（为0时不限制）与突发量，
+    # 排队等待名额的最长时间（秒），以及上游限流或出错时的最大重试次数
+    llm_max_concurrency: int = 8
+    llm_rate_per_second: float = 0.0
+    llm_burst: int = 10
+    llm_max_wait: float = 30.0
+    llm_max_retries: int = 3
+    # 流式对话：SSE心跳间隔（秒），以及服务端为一次回答最多保留的字符数
+    stream_heartbeat_interval: float = 15.0
+    stream_max_response_chars: int = 256 * 1024
+    # 流式块合并：累计达到该字节数或缓存超过该时间（秒）时输出一次，时间为0时不合并
+    stream_coalesce_bytes: int = 512
+    stream_coalesce_delay: float = 0.05
+    # LLM录制/重放磁带（见modules/llm_fetcher/cassette.py）：文件路径（为空时不启用）、
+    # 模式（record/replay/auto）与重放加速倍数（为0时不等待）
+    llm_cassette_path: str = ""
+    llm_cassette_mode: str = "replay"
+    llm_cassette_speed: float = 1.0
+    # 并行展开式任务分解：单次分解同时展开的阶段数，以及最多展开的阶段数（其余阶段保留为叶子任务）
+    decompose_fanout_concurrency: int = 4
+    decompose_fanout_max_branches: int = 8
+    # 批量任务建议：单个提示词中任务信息的token预算与最多任务数、每个任务预留的回答token数、
+    # 单次请求最多的任务数，以及单个任务建议的缓存时间（秒，为0时不缓存）
+    suggestion_batch_token_budget: int = 3000
+    suggestion_batch_max_tasks: int = 8
+    suggestion_tokens_per_task: int = 700
+    suggestion_batch_max_request: int = 50
+    suggestion_cache_ttl: int = 3600
+    # 对话压缩：未压缩消息的token数超过阈值时（为0时不压缩），在后台把较早的对话摘要为一条system消息，
+    # 保留最近这么多token的原始对话；摘要的最大token数，以及送入摘要的旧对话的最大token数（更早的直接丢弃）
+    context_compact_threshold: int = 6000
+    context_compact_keep_tokens: int = 2000
+    context_summary_max_tokens: int = 800
+    context_compact_max_input_tokens: int = 24000
 
 
 @dataclass(frozen=True)
 class PromptsSettings:
     task_decompose: str
     task_suggestion: str
+    # 并行展开模式：先生成第一层阶段，再逐个展开
+    task_outline: str
+    task_expand: str
+    # 批量任务建议：单任务规则之后附加批量输入输出的说明
+    task_suggestion_batch: str
+    # 对话压缩：把较早的对话摘要为一条system消息
+    context_summary: str
 
 
 @dataclass(frozen=True)
@@ -57,11 +141,16 @@ class AppSettings:
     redis: RedisSettings
     llm: LLMSettings
     prompts: PromptsSettings
+    ai: AISettings
 
 
 # 以文件形式载入提示词内容。
 task_sug_msg: str
 task_comp_ms: str
+task_outline_msg: str
+task_expand_msg: str
+task_sug_batch_msg: str
+context_summary_msg: str
 
 with open("./llm_prompts/task_composer.txt", 'r', encoding="utf-8") as composer:
     task_comp_msg = composer.read()
@@ -69,6 +158,18 @@ with open("./llm_prompts/task_composer.txt", 'r', encoding="utf-8") as composer:
 with open("./llm_prompts/task_suggestor.txt", 'r', encoding="utf-8") as sug:
     task_sug_msg = sug.read()
 
+with open("./llm_prompts/task_outline.txt", 'r', encoding="utf-8") as outline:
+    task_outline_msg = outline.read()
+
+with open("./llm_prompts/task_expander.txt", 'r', encoding="utf-8") as expander:
+    task_expand_msg = expander.read()
+
+with open("./llm_prompts/task_suggestor_batch.txt", 'r', encoding="utf-8") as sug_batch:
+    task_sug_batch_msg = task_sug_msg + "\n\n" + sug_batch.read()
+
+with open("./llm_prompts/context_summarizer.txt", 'r', encoding="utf-8") as summarizer:
+    context_summary_msg = summarizer.read()
+
 
 # 直接使用 Python 字面量承载配置内容（与 config.json 对应）
 settings = AppSettings(
@@ -90,6 +191,15 @@ settings = AppSettings(
         db_port=1980,
         minconn=1,
         maxconn=20,
+        prepare_statements=os.getenv("DB_PREPARE_STATEMENTS", "1") != "0",
+        leak_threshold=30.0,
+        leak_check_interval=5.0,
+        leak_stacks=os.getenv("DB_LEAK_STACKS", "0") != "0",
+        # 以逗号分隔，例如DB_REPLICA_HOSTS=10.0.0.2:1980,10.0.0.3:1980
+        replica_hosts=tuple(h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()),
+        read_your_writes_window=2.0,
+        replica_retry_interval=10.0,
+        iso_timestamps=os.getenv("DB_ISO_TIMESTAMPS", "0") != "0",
     ),
     redis=RedisSettings(
         host="localhost",
@@ -98,14 +208,59 @@ settings = AppSettings(
         password=None,
     ),
     llm=LLMSettings(
-        api_url="https://api.deepseek.com",
-        api_key="sk-e8b4315f80e24843825ca39cd880e214",
-        model="deepseek-reasoner",
+        # 可通过环境变量指向其他OpenAI兼容服务，例如离线压测时的scripts/mock_llm_server.py
+        api_url=os.getenv("LLM_API_URL", "https://api.deepseek.com"),
+        api_key=os.getenv("LLM_API_KEY", "sk-e8b4315f80e24843825ca39cd880e214"),
+        model=os.getenv("LLM_MODEL", "deepseek-reasoner"),
+        connect_timeout=10.0,
+        read_timeout=120.0,
+        max_connections=100,
+        max_keepalive_connections=20,
     ),
     prompts=PromptsSettings(
         # 提示词
         task_decompose=task_comp_msg,
         task_suggestion=task_sug_msg,
+        task_outline=task_outline_msg,
+        task_expand=task_expand_msg,
+        task_suggestion_batch=task_sug_batch_msg,
+        context_summary=context_summary_msg,
+    ),
+    ai=AISettings(
+        job_concurrency=4,
+        job_max_pending=100,
+        context_token_budget=8192,
+        context_max_messages=200,
+        context_cache_ttl=3600,
+        llm_cache_ttl=0,
+        llm_cache_max_entry_bytes=256 * 1024,
+        llm_cache_max_entries=10000,
+        singleflight_lock_ttl=300,
+        singleflight_result_ttl=30,
+        llm_max_concurrency=8,
+        llm_rate_per_second=0.0,
+        llm_burst=10,
+        llm_max_wait=30.0,
+        llm_max_retries=3,
+        stream_heartbeat_interval=15.0,
+        stream_max_response_chars=256 * 1024,
+        stream_coalesce_bytes=512,
+        stream_coalesce_delay=0.05,
+        # 基准测试或复现线上延迟时通过环境变量开启
+        llm_cassette_path=os.getenv("LLM_CASSETTE_PATH", ""),
+        llm_cassette_mode=os.getenv("LLM_CASSETTE_MODE", "replay"),
+        llm_cassette_speed=float(os.getenv("LLM_CASSETTE_SPEED", "1.0")),
+        decompose_fanout_concurrency=4,
+        decompose_fanout_max_branches=8,
+        suggestion_batch_token_budget=3000,
+        suggestion_batch_max_tasks=8,
+        suggestion_tokens_per_task=700,
+        suggestion_batch_max_request=50,
+        suggestion_cache_ttl=3600,
+        context_compact_threshold=6000,
+        context_compact_keep_tokens=2000,
+        context_summary_max_tokens=800,
+        context_compact_max_input_tokens=24000,
     ),
 )
 
@@ -1,23 +1,125 @@
--- AI对话元数据表
-CREATE TABLE ai_conversations (
+-- AI对话元数据表：每个(用户, 工作空间, 项目)只有一个未删除的对话线程
+CREATE TABLE IF NOT EXISTS ai_conversations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     project_id UUID REFERENCES projects(id) ON DELETE SET NULL,
     workspace_id UUID REFERENCES workspaces(id) ON DELETE SET NULL,
     creator_id UUID REFERENCES users(id) ON DELETE SET NULL,
     previous_conversation_id UUID REFERENCES ai_conversations(id) ON DELETE SET NULL,
     model_name VARCHAR(100),  -- 使用的大模型名称，如 "qwen-max"。
+    last_sequence_number INT NOT NULL DEFAULT 0,  -- 线程中已分配的最大消息顺序号
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
     deleted_at TIMESTAMP WITH TIME ZONE NULL
 );
 
--- 每一轮对话的内容
-CREATE TABLE ai_messages (
+-- 每一轮对话的内容，按sequence_number追加到所属线程
+CREATE TABLE IF NOT EXISTS ai_messages (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     conversation_id UUID NOT NULL REFERENCES ai_conversations(id) ON DELETE CASCADE,
     role VARCHAR(20) NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
     content TEXT NOT NULL,
     tokens INT DEFAULT 0,                -- 可选：用于计费或上下文长度控制
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-    sequence_number INT                  -- 可选：显式顺序号，避免依赖时间戳排序
-);
\ No newline at end of file
+    sequence_number INT,                 -- 可选：显式顺序号，避免依赖时间戳排序
+    compacted BOOLEAN NOT NULL DEFAULT FALSE,   -- 已被摘要覆盖的旧消息，不再进入上下文
+    is_summary BOOLEAN NOT NULL DEFAULT FALSE   -- 对话压缩生成的摘要（role为system）
+);
+
+-- 已有数据库的升级：对话压缩与线程所需的列（新建的表已包含，重复执行无影响）
+ALTER TABLE ai_messages ADD COLUMN IF NOT EXISTS compacted BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE ai_messages ADD COLUMN IF NOT EXISTS is_summary BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE ai_conversations ADD COLUMN IF NOT EXISTS last_sequence_number INT NOT NULL DEFAULT 0;
+
+-- 已有数据库的升级：旧版本每轮对话一条ai_conversations记录，合并到每个(用户, 工作空间, 项目)最早的一条，
+-- 消息按原顺序重新编号。只处理尚未合并（有多条记录或缺少顺序号）的线程，重复执行时不修改任何行，
+-- 也不会改动压缩摘要沿用的顺序号
+WITH threads AS (
+    SELECT id, created_at,
+           FIRST_VALUE(id) OVER (
+               PARTITION BY creator_id, workspace_id, project_id ORDER BY created_at, id
+           ) AS thread_id,
+           COUNT(*) OVER (PARTITION BY creator_id, workspace_id, project_id) AS records
+    FROM ai_conversations
+    WHERE deleted_at IS NULL
+), legacy AS (
+    SELECT t.* FROM threads t
+    WHERE t.records > 1
+       OR EXISTS (
+           SELECT 1 FROM ai_messages am
+           WHERE am.conversation_id = t.id AND am.sequence_number IS NULL
+       )
+), renumbered AS (
+    SELECT am.id, l.thread_id,
+           ROW_NUMBER() OVER (
+               PARTITION BY l.thread_id ORDER BY l.created_at, am.sequence_number, am.is_summary, am.id
+           ) AS sequence_number
+    FROM ai_messages am
+    JOIN legacy l ON am.conversation_id = l.id
+)
+UPDATE ai_messages am
+SET conversation_id = r.thread_id, sequence_number = r.sequence_number
+FROM renumbered r
+WHERE am.id = r.id;
+
+UPDATE ai_conversations ac
+SET last_sequence_number = m.max_sequence
+FROM (
+    SELECT c.id, COALESCE(MAX(am.sequence_number), 0) AS max_sequence
+    FROM ai_conversations c
+    LEFT JOIN ai_messages am ON am.conversation_id = c.id
+    WHERE c.deleted_at IS NULL
+    GROUP BY c.id
+) m
+WHERE ac.id = m.id AND ac.last_sequence_number < m.max_sequence;
+
+-- 消息已全部移到线程的第一条记录，其余记录可以删除
+DELETE FROM ai_conversations ac
+USING (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY creator_id, workspace_id, project_id ORDER BY created_at, id
+    ) AS rn
+    FROM ai_conversations
+    WHERE deleted_at IS NULL
+) merged
+WHERE ac.id = merged.id AND merged.rn > 1;
+
+-- 按用户/工作空间/项目定位唯一的对话线程（AITaskService.save_context的upsert与get_context）
+DROP INDEX IF EXISTS idx_ai_conversations_context;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_conversations_thread
+    ON ai_conversations(creator_id, workspace_id, project_id)
+    WHERE deleted_at IS NULL;
+-- 上下文按顺序号倒序读取未压缩的消息；线程内未压缩消息的顺序号唯一，
+-- 压缩生成的摘要沿用被压缩的最后一条消息的顺序号，因此排在保留的对话之前。
+-- 旧版本的(conversation_id, sequence_number)普通索引与该唯一索引的前导列相同，不再需要
+DROP INDEX IF EXISTS idx_ai_messages_conversation;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_messages_unique_active
+    ON ai_messages(conversation_id, sequence_number)
+    WHERE NOT compacted;
+-- 旧版本的idx_ai_messages_active是非唯一的同列索引，已由上面的唯一索引取代
+DROP INDEX IF EXISTS idx_ai_messages_active;
+
+-- AI请求记录（任务分解、任务建议等）
+-- status: queued（已提交）/ running（生成中）/ done（完成）/ failed（失败，response_text内为错误信息）
+CREATE TABLE IF NOT EXISTS ai_requests (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+    prompt TEXT NOT NULL,
+    response_text TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'done',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+-- AI任务分解/建议结果
+CREATE TABLE IF NOT EXISTS ai_task_suggestions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    ai_request_id UUID REFERENCES ai_requests(id) ON DELETE CASCADE,
+    user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+    task_id UUID REFERENCES tasks(id) ON DELETE SET NULL,
+    suggestion JSONB NOT NULL,
+    metadata JSONB,
+    accepted BOOLEAN DEFAULT FALSE,
+    rejected BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_task_suggestions_request ON ai_task_suggestions(ai_request_id);
@@ -47,5 +47,387 @@ def test_save_ai_request(mock_uuid, ai_task_service):
     mock_conn.execute.assert_called_once()
     ai_task_service.db_manager.release_connection.assert_called_once_with(mock_conn)
 
+class _FakeConn:
+    """记录执行的语句及事务使用情况的假连接。"""
+    def __init__(self):
+        self.executed = []
+        self.args = []
+        self.transactions = 0
+
+    def transaction(self):
+        conn = self
+
+        class _Tx:
+            async def __aenter__(self):
+                conn.transactions += 1
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Tx()
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(0)
+        self.executed.append(query)
+        self.args.append(args)
+
+
+class _FakePool:
+    """容量有限的假连接池，记录峰值占用。"""
+    def __init__(self, size):
+        self._sem = asyncio.Semaphore(size)
+        self.in_use = 0
+        self.peak = 0
+        self.acquired = 0
+        self.conns = []
+        self.holders = set()
+
+    async def get_connection(self, timeout=5.0):
+        await asyncio.wait_for(self._sem.acquire(), timeout)
+        self.holders.add(asyncio.current_task())
+        self.in_use += 1
+        self.acquired += 1
+        self.peak = max(self.peak, self.in_use)
+        conn = _FakeConn()
+        self.conns.append(conn)
+        return conn
+
+    async def release_connection(self, conn):
+        self.holders.discard(asyncio.current_task())
+        self.in_use -= 1
+        self._sem.release()
+
+
+@pytest.mark.asyncio
+async def test_decompose_task_does_not_hold_connection_during_llm():
+    """并发分解时，LLM生成期间不占用连接，每次分解只用一个连接和一个事务。"""
+    pool = _FakePool(size=2)
+    held_during_llm = []
+
+    class _SlowLLM:
+        async def fetch_stream(self, **kwargs):
+            for part in ['<<<JSON_BEGIN>>>{"main_goal": "g", ', '"tasks": [], "summary": "s"}<<<JSON_END>>>']:
+                await asyncio.sleep(0.01)
+                held_during_llm.append(asyncio.current_task() in pool.holders)
+                yield part
+
+    service = AITaskService(pool, _SlowLLM())
+    results = await asyncio.wait_for(asyncio.gather(*(
+        service.decompose_task(f"u{i}", "goal", "w", "p") for i in range(20)
+    )), timeout=5.0)
+
+    assert all(r["success"] for r in results)
+    assert pool.acquired == 20
+    assert pool.peak <= 2
+    assert pool.in_use == 0
+    # 等待LLM输出时，当前请求不持有任何连接
+    assert not any(held_during_llm)
+    for conn in pool.conns:
+        assert conn.transactions == 1
+        assert len(conn.executed) == 2
+
+def _statuses(pool):
+    """按时间顺序取出写入ai_requests的状态。"""
+    statuses = []
+    for conn in pool.conns:
+        for query, args in zip(conn.executed, conn.args):
+            if "INSERT INTO ai_requests" in query:
+                statuses.append(args[4])
+            elif "UPDATE ai_requests" in query:
+                statuses.append(args[1])
+    return statuses
+
+
+@pytest.mark.asyncio
+async def test_decompose_job_runs_in_background():
+    """后台任务模式：立即返回queued，随后依次变为running和done。"""
+    from modules.job_runner import JobRunner
+
+    pool = _FakePool(size=2)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    class _LLM:
+        async def fetch_stream(self, **kwargs):
+            started.set()
+            await release.wait()
+            yield '{"main_goal": "g", "tasks": [], "summary": "s"}'
+
+    runner = JobRunner(concurrency=1)
+    service = AITaskService(pool, _LLM())
+    job = await service.submit_decompose_job("u", "goal", "w", "p", runner)
+
+    assert job["status"] == "queued" and job["ai_request_id"]
+    await started.wait()
+    # 生成期间不占用连接
+    assert pool.in_use == 0
+    release.set()
+    await runner.shutdown(timeout=1.0)
+
+    assert _statuses(pool) == ["queued", "running", "done"]
+    assert any("INSERT INTO ai_task_suggestions" in q for c in pool.conns for q in c.executed)
+
+
+@pytest.mark.asyncio
+async def test_decompose_job_marks_failed():
+    """LLM没有产生JSON时，请求被标记为failed并记录错误信息。"""
+    from modules.job_runner import JobRunner
+
+    pool = _FakePool(size=2)
+
+    class _LLM:
+        async def fetch_stream(self, **kwargs):
+            yield "我需要更多信息。"
+
+    runner = JobRunner(concurrency=1)
+    service = AITaskService(pool, _LLM())
+    await service.submit_decompose_job("u", "goal", "w", "p", runner)
+    await runner.shutdown(timeout=1.0)
+
+    assert _statuses(pool) == ["queued", "running", "failed"]
+    assert "未产生任务" in pool.conns[-1].args[-1][2]
+
+@pytest.mark.asyncio
+async def test_get_context_applies_token_budget_in_sql():
+    """get_context把token预算和扫描上限交给SQL，只查询一次。"""
+    from unittest.mock import AsyncMock
+    from services.ai_task_service import CONTEXT_WINDOW_QUERY
+
+    conn = AsyncMock()
+    conn.fetch.return_value = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    db = AsyncMock()
+    db.get_connection.return_value = conn
+
+    service = AITaskService(db, Mock())
+    context = await service.get_context("w", "p", "u", token_budget=1000, max_messages=50)
+
+    conn.fetch.assert_awaited_once_with(CONTEXT_WINDOW_QUERY, "p", "w", "u", 1000, 50)
+    assert "SUM(tokens) OVER" in CONTEXT_WINDOW_QUERY
+    assert [(c.role, c.content) for c in context] == [("user", "hi"), ("assistant", "hello")]
+    db.release_connection.assert_awaited_once_with(conn)
+
+
+@pytest.mark.asyncio
+async def test_save_context_records_token_counts():
+    """save_context写入实际或估算的token数，而不是0。"""
+    from unittest.mock import AsyncMock, MagicMock
+    from modules.llm_fetcher import estimate_tokens
+    from routes.models.ai_llm_models import LLMContext
+    from services.ai_task_service import CONTEXT_APPEND_QUERY
+
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value="conv-1")
+    db = AsyncMock()
+    db.get_connection.return_value = conn
+    llm = MagicMock()
+    llm.model = "test-model"
+
+    service = AITaskService(db, llm)
+    user_msg = LLMContext("user", "请帮我规划学习计划")
+    ai_msg = LLMContext("assistant", "好的" * 100)
+    conversation_id = await service.save_context("w", "p", "u", (user_msg, ai_msg), token_counts=(None, 321))
+
+    assert conversation_id == "conv-1"
+    # 线程upsert与两条消息在同一条SQL中写入
+    conn.fetchval.assert_awaited_once()
+    query, *args = conn.fetchval.await_args.args
+    assert query == CONTEXT_APPEND_QUERY
+    assert args[:4] == ["p", "w", "u", "test-model"]
+    assert args[4] == ["user", "assistant"]
+    assert args[6] == [estimate_tokens(user_msg.content), 321]
+    assert args[6][0] > 0
+
+@pytest.mark.asyncio
+async def test_decompose_task_coalesces_identical_requests():
+    """相同的并发分解请求只调用一次LLM、只写一次数据库。"""
+    from modules.singleflight import SingleFlight
+
+    pool = _FakePool(size=4)
+    llm_calls = 0
+
+    class _LLM:
+        async def fetch_stream(self, **kwargs):
+            nonlocal llm_calls
+            llm_calls += 1
+            await asyncio.sleep(0.01)
+            yield '{"main_goal": "g", "tasks": [], "summary": "s"}'
+
+    flight = SingleFlight()
+    results = await asyncio.gather(*(
+        AITaskService(pool, _LLM(), single_flight=flight).decompose_task("u", "goal", "w", "p")
+        for _ in range(5)
+    ))
+    other = await AITaskService(pool, _LLM(), single_flight=flight).decompose_task("u", "other goal", "w", "p")
+
+    assert llm_calls == 2
+    assert pool.acquired == 2
+    assert all(r == results[0] for r in results) and other["success"]
+
+
+def _wrap(payload):
+    import json
+    return "<<<JSON_BEGIN>>>" + json.dumps(payload, ensure_ascii=False) + "<<<JSON_END>>>"
+
+
+class _FanoutLLM:
+    """大纲逐块输出；每个阶段的展开耗时相同，记录同时进行的展开数。"""
+    def __init__(self, phases, delay, fail=()):
+        self.phases = phases
+        self.delay = delay
+        self.fail = set(fail)
+        self.active = 0
+        self.peak = 0
+        self.expanded = []
+
+    async def fetch_stream(self, msg, system_prompt, **kwargs):
+        if "阶段" in system_prompt and "只需要给出任务计划的「第一层」" in system_prompt:
+            text = _wrap({"main_goal": "g", "summary": "s", "tasks": [{
+                "title": "根", "subtasks": [{"title": p, "description": p, "subtasks": []} for p in self.phases],
+            }]})
+            for i in range(0, len(text), 16):
+                await asyncio.sleep(0)
+                yield text[i:i + 16]
+            return
+
+        title = msg.split("需要展开的阶段：")[1].split("\n")[0]
+        self.expanded.append(title)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if title in self.fail:
+            yield "无法展开"
+            return
+        yield _wrap({"subtasks": [{"title": f"{title}-1", "subtasks": []}, {"title": f"{title}-2", "subtasks": []}]})
+
+
+@pytest.mark.asyncio
+async def test_fanout_decomposition_expands_phases_in_parallel():
+    phases = [f"阶段{i}" for i in range(4)]
+    llm = _FanoutLLM(phases, delay=0.1)
+    service = AITaskService(_FakePool(size=2), llm)
+
+    start = asyncio.get_running_loop().time()
+    _, json_text, structure = await service._generate_fanout_decomposition("goal")
+    elapsed = asyncio.get_running_loop().time() - start
+
+    # 4个阶段并行展开：总耗时接近最慢的一个阶段，而不是4倍
+    assert elapsed < 0.25
+    assert llm.peak == 4 and sorted(llm.expanded) == phases
+    root = structure["tasks"][0]
+    assert [p["title"] for p in root["subtasks"]] == phases
+    assert [t["title"] for t in root["subtasks"][2]["subtasks"]] == ["阶段2-1", "阶段2-2"]
+    assert structure["main_goal"] == "g" and '"阶段3-2"' in json_text
+
+
+@pytest.mark.asyncio
+async def test_fanout_decomposition_limits_parallelism_and_keeps_failed_phase():
+    phases = [f"阶段{i}" for i in range(3)]
+    llm = _FanoutLLM(phases, delay=0.01, fail={"阶段1"})
+    service = AITaskService(_FakePool(size=2), llm)
+    service.fanout_concurrency = 2
+
+    _, _, structure = await service._generate_fanout_decomposition("goal")
+
+    assert llm.peak == 2
+    subtasks = structure["tasks"][0]["subtasks"]
+    assert subtasks[1]["subtasks"] == []
+    assert len(subtasks[0]["subtasks"]) == len(subtasks[2]["subtasks"]) == 2
+
+
+class _SuggestLLM:
+    """按输入的任务逐个回显建议；`drop`中的任务不出现在回答里。"""
+    def __init__(self, drop=()):
+        self.calls = []
+        self.drop = set(drop)
+
+    async def fetch(self, msg, system_prompt, **kwargs):
+        import json
+        from types import SimpleNamespace
+
+        tasks = json.loads(msg)["tasks"]
+        self.calls.append([t["id"] for t in tasks])
+        results = [
+            {"task_id": t["id"], "need_decompose": False, "reason": t["title"], "subtasks": [], "solution": {"algorithm": ["做"]}}
+            for t in tasks if t["id"] not in self.drop
+        ]
+        content = _wrap({"results": results})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _DictRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, expire=None):
+        self.data[key] = value
+        return True
+
+
+@pytest.mark.asyncio
+async def test_batch_suggestions_one_query_packed_prompts_and_cache():
+    import uuid as _uuid
+    from unittest.mock import AsyncMock
+
+    ids = [str(_uuid.uuid4()) for _ in range(5)]
+    conn = AsyncMock()
+    conn.fetch.return_value = [{"id": _uuid.UUID(i), "title": f"t{n}", "description": "d" * 30} for n, i in enumerate(ids)]
+    db = AsyncMock()
+    db.get_connection.return_value = conn
+
+    llm = _SuggestLLM(drop={ids[4]})
+    service = AITaskService(db, llm, redis_manager=_DictRedis())
+    service.suggestion_batch_max_tasks = 2
+    unknown = str(_uuid.uuid4())
+
+    result = await service.get_task_suggestions_batch("u", ids + [ids[0], unknown, "not-a-uuid"])
+    data = result["data"]
+
+    # 一次查询取出全部任务；5个任务按每包2个打成3包
+    conn.fetch.assert_awaited_once()
+    assert sorted(len(c) for c in llm.calls) == [1, 2, 2]
+    assert list(data["suggestions"]) == ids[:4]
+    assert data["suggestions"][ids[1]]["reason"] == "t1" and "task_id" not in data["suggestions"][ids[1]]
+    assert data["failed"] == [ids[4]]
+    assert sorted(data["missing"]) == sorted([unknown, "not-a-uuid"])
+
+    # 第二次请求：已有建议的任务命中缓存，只有失败的任务再次请求LLM
+    llm.drop = set()
+    llm.calls.clear()
+    data = (await service.get_task_suggestions_batch("u", ids))["data"]
+    assert llm.calls == [[ids[4]]]
+    assert data["cached"] == 4 and len(data["suggestions"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_batch_suggestions_key_cache_on_canonical_task_id():
+    import uuid as _uuid
+    from unittest.mock import AsyncMock
+
+    task_id = _uuid.uuid4()
+    conn = AsyncMock()
+    conn.fetch.return_value = [{"id": task_id, "title": "t", "description": "d"}]
+    db = AsyncMock()
+    db.get_connection.return_value = conn
+    llm = _SuggestLLM()
+    redis = _DictRedis()
+    service = AITaskService(db, llm, redis_manager=redis)
+
+    # 同一任务的两种写法只请求一次LLM，结果按调用方的写法返回
+    upper, plain = str(task_id).upper(), task_id.hex
+    data = (await service.get_task_suggestions_batch("u", [upper, plain]))["data"]
+    assert llm.calls == [[str(task_id)]]
+    assert list(data["suggestions"]) == [upper, plain] and data["failed"] == []
+    assert all(str(task_id) in key for key in redis.data)
+
+    llm.calls.clear()
+    data = (await service.get_task_suggestions_batch("u", [str(task_id)]))["data"]
+    assert llm.calls == [] and data["cached"] == 1
+
 # 运行测试的示例命令：
 # python -m pytest tests/test_ai_task_service.py -v
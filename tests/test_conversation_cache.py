@@ -0,0 +1,170 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+try:
+    import asyncpg  # type: ignore
+except ImportError:
+    pytest.skip("asyncpg not installed; skipping conversation cache tests", allow_module_level=True)
+
+from services import conversation_cache
+from services.ai_task_service import AITaskService
+from routes.models.ai_llm_models import LLMContext
+
+
+class _FakeRedis:
+    """按脚本语义模拟RedisManager中用到的方法。"""
+    def __init__(self):
+        self.data = {}
+
+    async def list_range(self, key, start=0, end=-1):
+        return list(self.data.get(key, []))
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def eval_script(self, script, keys, args):
+        key, version_key = keys
+        if script is conversation_cache._APPEND_SCRIPT:
+            self.data[version_key] = self.data.get(version_key, 0) + 1
+            if key in self.data:
+                self.data[key] = (self.data[key] + list(args[2:]))[-int(args[0]):]
+            return 1
+        if script is conversation_cache._REBUILD_SCRIPT:
+            current = self.data.get(version_key)
+            if ("" if current is None else str(current)) != args[0]:
+                return 0
+            self.data.pop(key, None)
+            if len(args) > 2:
+                self.data[key] = list(args[2:])
+            return 1
+        if script is conversation_cache._INVALIDATE_SCRIPT:
+            self.data[version_key] = self.data.get(version_key, 0) + 1
+            self.data.pop(key, None)
+            return 1
+        raise AssertionError("unexpected script")
+
+
+def _service(rows):
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=rows)
+    db = AsyncMock()
+    db.get_connection.return_value = conn
+    redis = _FakeRedis()
+    service = AITaskService(db, MagicMock(), redis)
+    return service, conn, redis
+
+
+@pytest.mark.asyncio
+async def test_get_context_rebuilds_cache_then_skips_db():
+    """首次未命中时从数据库读取并重建窗口，之后直接读取缓存。"""
+    rows = [
+        {"role": "user", "content": "a", "tokens": 10},
+        {"role": "assistant", "content": "b", "tokens": 20},
+        {"role": "user", "content": "c", "tokens": 30},
+    ]
+    service, conn, _ = _service(rows)
+
+    first = await service.get_context("w", "p", "u", token_budget=100)
+    second = await service.get_context("w", "p", "u", token_budget=50)
+
+    conn.fetch.assert_awaited_once()
+    assert [m.content for m in first] == ["a", "b", "c"]
+    # 预算在内存中按最新消息优先截取
+    assert [m.content for m in second] == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_save_context_appends_to_existing_window():
+    """保存对话后追加到已有窗口，下一次读取无需访问数据库。"""
+    service, conn, _ = _service([{"role": "user", "content": "old", "tokens": 5}])
+    await service.get_context("w", "p", "u")
+
+    conn.fetchval = AsyncMock(return_value="conv-1")
+    await service.save_context("w", "p", "u", (LLMContext("user", "q"), LLMContext("assistant", "r")))
+
+    context = await service.get_context("w", "p", "u")
+    assert conn.fetch.await_count == 1
+    assert [m.content for m in context] == ["old", "q", "r"]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_is_dropped_when_a_turn_was_appended_meanwhile():
+    """重建期间有新对话追加时放弃写入，避免缓存缺少最新一轮。"""
+    redis = _FakeRedis()
+    cache = conversation_cache.ConversationWindowCache(redis, max_messages=10, ttl=60)
+
+    version = await cache.version("w", "p", "u")
+    await cache.append("w", "p", "u", [{"role": "user", "content": "new", "tokens": 1}])
+    written = await cache.rebuild("w", "p", "u", [{"role": "user", "content": "old", "tokens": 1}], version)
+
+    assert written is False
+    assert await cache.get("w", "p", "u") is None
+
+
+@pytest.mark.asyncio
+async def test_get_context_falls_back_to_db_when_redis_fails():
+    service, conn, redis = _service([{"role": "user", "content": "a", "tokens": 1}])
+    redis.list_range = AsyncMock(side_effect=ConnectionError("redis down"))
+
+    context = await service.get_context("w", "p", "u", token_budget=100)
+
+    assert [m.content for m in context] == ["a"]
+    assert conn.fetch.await_args.args[4] == 100
+
+
+def _compaction_service(rows, total):
+    service, conn, redis = _service(rows)
+    conn.fetchval = AsyncMock(return_value=total)
+    conn.execute = AsyncMock(side_effect=lambda query, *args: f"UPDATE {len(args[0])}" if "UPDATE" in query else "INSERT 0 1")
+    conn.transaction = MagicMock()
+    conn.transaction.return_value.__aenter__ = AsyncMock()
+    conn.transaction.return_value.__aexit__ = AsyncMock(return_value=False)
+    service.llm_fetcher.fetch = AsyncMock(return_value=SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="用户在筹备活动"))],
+        usage=SimpleNamespace(completion_tokens=12),
+    ))
+    service.context_compact_threshold = 3000
+    service.context_compact_keep_tokens = 1000
+    service.context_compact_max_input_tokens = 10000
+    return service, conn, redis
+
+
+def _turns(count, tokens):
+    rows = []
+    for i in range(count):
+        rows.append({"id": f"u{i}", "conversation_id": "c", "sequence_number": 2 * i + 1, "role": "user",
+                     "content": f"问题{i}", "is_summary": False, "tokens": tokens})
+        rows.append({"id": f"a{i}", "conversation_id": "c", "sequence_number": 2 * i + 2, "role": "assistant",
+                     "content": f"<<<THINKING>>>想{i}<<<THINK_END>>>回答{i}", "is_summary": False, "tokens": tokens})
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_compact_context_summarizes_older_turns():
+    """超过阈值时把较早的对话摘要为一条system消息，只保留最近的对话，并清除缓存窗口。"""
+    rows = [{"id": "s0", "conversation_id": "c", "sequence_number": 2, "role": "system", "content": "旧摘要",
+             "is_summary": True, "tokens": 10}] + _turns(4, 500)[2:]
+    service, conn, redis = _compaction_service(rows, 3010)
+    redis.data["ai:ctx:w:p:u"] = ["cached"]
+
+    assert await service.compact_context("w", "p", "u")
+
+    mark, insert = conn.execute.await_args_list
+    # 最近一轮（1000 token）保留，其余连同旧摘要一起标记为已压缩
+    assert mark.args[1] == ["s0", "u1", "a1", "u2", "a2"]
+    # 摘要沿用被压缩的最后一条消息的顺序号，排在保留的一轮之前
+    assert insert.args[1:] == ("c", "用户在筹备活动", 12, 6)
+    transcript = service.llm_fetcher.fetch.await_args.kwargs["msg"]
+    assert transcript.startswith("更早的摘要：\n旧摘要")
+    assert "回答2" in transcript and "想2" not in transcript and "问题3" not in transcript
+    assert "ai:ctx:w:p:u" not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_compact_context_skips_below_threshold():
+    service, conn, _ = _compaction_service(_turns(2, 500), 2000)
+
+    assert not await service.compact_context("w", "p", "u")
+    conn.fetch.assert_not_awaited()
+    service.llm_fetcher.fetch.assert_not_awaited()
@@ -8,7 +8,7 @@ try:
 except ImportError:
     pytest.skip("asyncpg not installed; skipping database manager tests", allow_module_level=True)
 
-from modules.databaseman.database_manager import DatabaseManager
+from modules.databaseman.database_manager import DatabaseManager, DBTimeoutError
 
 
 TEST_DIR = os.path.join(os.path.dirname(__file__), "configs")
@@ -126,3 +126,337 @@ async def test_get_connection_without_init():
     )
     with pytest.raises(EOFError):
         await db.get_connection()
+
+
+def _dummy_manager(**kwargs) -> DatabaseManager:
+    return DatabaseManager(
+        db_url="127.0.0.1",
+        db_username="test",
+        db_password="test",
+        db_database_name="test",
+        db_port=5432,
+        **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_track_leases_by_connection(monkeypatch):
+    async def fake_create_pool(*args, **kwargs):
+        return DummyPool()
+
+    monkeypatch.setattr('asyncpg.create_pool', fake_create_pool)
+    db = _dummy_manager(leak_threshold=0)
+    await db.init_pool()
+
+    first = await db.get_connection()
+    second = await db.get_connection()
+    assert db.get_active_connections_count() == 2
+
+    await db.release_connection(first)
+    # 重复释放同一连接不会让计数变为负数或漂移
+    await db.release_connection(first)
+    assert db.get_active_connections_count() == 1
+
+    snapshot = db.pool_snapshot()
+    assert snapshot["acquired_total"] == 2
+    assert snapshot["wait_ms_histogram"]["+Inf"] == 2
+    assert snapshot["waiting"] == 0
+    # 持有时长按调用位置（本测试函数）统计
+    [site] = snapshot["hold_by_site"]
+    assert "test_pool_metrics_track_leases_by_connection" in site
+    assert snapshot["hold_by_site"][site]["count"] == 1
+    assert len(snapshot["held_now"]) == 1
+
+    await db.release_connection(second)
+    await db.close_all_connections()
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_report_held_connection(monkeypatch, capsys):
+    async def fake_create_pool(*args, **kwargs):
+        return DummyPool()
+
+    monkeypatch.setattr('asyncpg.create_pool', fake_create_pool)
+    db = _dummy_manager(leak_threshold=0)
+    await db.init_pool()
+
+    async with db.acquire() as conn:
+        leaks = db.metrics.find_leaks(0.0)
+        assert [lease.site for lease in leaks] == [db.metrics.snapshot()["held_now"][0]["site"]]
+        assert "test_pool_metrics_report_held_connection" in leaks[0].site
+        # 同一连接只报告一次
+        assert db.metrics.find_leaks(0.0) == []
+        assert conn is not None
+
+    out = capsys.readouterr().out
+    # 默认只记录借出位置，不遍历调用栈
+    assert "possibly leaked" in out and "DB_LEAK_STACKS" in out
+    assert leaks[0].stack is None
+    assert db.pool_snapshot()["leaks_total"] == 1
+    assert db.get_active_connections_count() == 0
+    await db.close_all_connections()
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_capture_stacks_when_enabled(monkeypatch, capsys):
+    async def fake_create_pool(*args, **kwargs):
+        return DummyPool()
+
+    monkeypatch.setattr('asyncpg.create_pool', fake_create_pool)
+    db = _dummy_manager(leak_threshold=0, leak_stacks=True)
+    await db.init_pool()
+
+    async with db.acquire():
+        [lease] = db.metrics.find_leaks(0.0)
+    assert lease.stack is not None
+    assert "Acquired at:" in capsys.readouterr().out
+    await db.close_all_connections()
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_count_timeouts():
+    class SlowPool(DummyPool):
+        async def acquire(self, timeout: float = 5.0):
+            raise asyncio.TimeoutError()
+
+    db = _dummy_manager()
+    db.connection_pool = SlowPool()    # type: ignore[assignment]
+    with pytest.raises(DBTimeoutError):
+        await db.get_connection(0.01)
+    snapshot = db.pool_snapshot()
+    assert snapshot["timeouts_total"] == 1
+    assert snapshot["in_use"] == 0 and snapshot["waiting"] == 0
+
+
+class _HostPool(DummyPool):
+    """按地址区分的假连接池，记录借出的连接。"""
+    def __init__(self, host: str):
+        super().__init__()
+        self.host = host
+        self.fail = False
+        self.released = []
+
+    async def acquire(self, timeout: float = 5.0):
+        if self.fail:
+            raise OSError(f"{self.host} is down")
+        conn = DummyConnection()
+        conn.host = self.host
+        return conn
+
+    async def release(self, connection):
+        self.released.append(connection)
+
+
+async def _replicated_manager(monkeypatch):
+    pools = {}
+
+    async def fake_create_pool(*args, **kwargs):
+        pools[kwargs["host"]] = _HostPool(kwargs["host"])
+        return pools[kwargs["host"]]
+
+    monkeypatch.setattr('asyncpg.create_pool', fake_create_pool)
+    db = _dummy_manager(leak_threshold=0, replica_hosts=("replica-a:5433", "replica-b"))
+    await db.init_pool()
+    return db, pools
+
+
+@pytest.mark.asyncio
+async def test_readonly_connections_use_replicas(monkeypatch):
+    db, pools = await _replicated_manager(monkeypatch)
+    assert [(r.host, r.port) for r in db.replicas] == [("replica-a", 5433), ("replica-b", 5432)]
+
+    hosts = []
+    for _ in range(4):
+        async with db.acquire(readonly=True) as conn:
+            hosts.append(conn.host)
+    assert hosts == ["replica-a", "replica-b", "replica-a", "replica-b"]
+    # 连接归还到借出它的连接池
+    assert len(pools["replica-a"].released) == 2 and not pools["127.0.0.1"].released
+
+    async with db.acquire() as conn:
+        assert conn.host == "127.0.0.1"
+    await db.close_all_connections()
+
+
+@pytest.mark.asyncio
+async def test_reads_after_write_are_pinned_to_primary(monkeypatch):
+    db, _ = await _replicated_manager(monkeypatch)
+
+    async with db.acquire(pin_key="user-1"):
+        pass
+    async with db.acquire(readonly=True, pin_key="user-1") as conn:
+        assert conn.host == "127.0.0.1"
+    # 其他用户不受影响
+    async with db.acquire(readonly=True, pin_key="user-2") as conn:
+        assert conn.host.startswith("replica")
+
+    db._pins["user-1"] = 0.0
+    async with db.acquire(readonly=True, pin_key="user-1") as conn:
+        assert conn.host.startswith("replica")
+    await db.close_all_connections()
+
+
+@pytest.mark.asyncio
+async def test_replica_errors_fall_back_to_primary(monkeypatch):
+    db, pools = await _replicated_manager(monkeypatch)
+    pools["replica-a"].fail = True
+    pools["replica-b"].fail = True
+
+    async with db.acquire(readonly=True) as conn:
+        assert conn.host == "127.0.0.1"
+    # 出错的副本暂停使用，下一次直接读主库
+    async with db.acquire(readonly=True) as conn:
+        assert conn.host == "127.0.0.1"
+
+    snapshot = db.pool_snapshot()
+    assert [r["errors"] for r in snapshot["replicas"]] == [1, 1]
+    assert not any(r["available"] for r in snapshot["replicas"])
+    assert snapshot["in_use"] == 0
+    await db.close_all_connections()
+
+
+class _TxConnection(DummyConnection):
+    """记录事务操作的假连接。"""
+    def __init__(self, log):
+        super().__init__()
+        self.log = log
+
+    def transaction(self):
+        log = self.log
+
+        class _Tx:
+            async def start(self):
+                log.append("begin")
+
+            async def commit(self):
+                log.append("commit")
+
+            async def rollback(self):
+                log.append("rollback")
+
+        return _Tx()
+
+
+class _CountingPool(DummyPool):
+    def __init__(self):
+        super().__init__()
+        self.log = []
+        self.acquired = 0
+        self.released = 0
+
+    async def acquire(self, timeout: float = 5.0):
+        self.acquired += 1
+        return _TxConnection(self.log)
+
+    async def release(self, connection):
+        self.released += 1
+
+
+def _pooled_manager() -> DatabaseManager:
+    db = _dummy_manager(leak_threshold=0)
+    db.connection_pool = _CountingPool()    # type: ignore[assignment]
+    return db
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_shares_one_connection():
+    db = _pooled_manager()
+    async with db.unit_of_work():
+        # 没有查询时不获取连接
+        assert db.connection_pool.acquired == 0
+        outer = await db.get_connection()
+        # 持有连接时嵌套获取不会再等待连接池
+        async with db.acquire(readonly=True) as inner:
+            assert inner is outer
+        await db.release_connection(outer)
+        again = await db.get_connection()
+        assert again is outer
+        await db.release_connection(again)
+        assert db.connection_pool.released == 0
+    assert (db.connection_pool.acquired, db.connection_pool.released) == (1, 1)
+    assert db.get_active_connections_count() == 0
+
+    # 工作单元结束后按普通方式获取连接
+    conn = await db.get_connection()
+    assert conn is not outer
+    await db.release_connection(conn)
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_concurrent_tasks_do_not_share_busy_connection():
+    db = _pooled_manager()
+    async with db.unit_of_work():
+        held = await db.get_connection()
+
+        async def sibling():
+            async with db.acquire() as conn:
+                return conn
+
+        other = await asyncio.create_task(sibling())
+        assert other is not held
+        await db.release_connection(held)
+    assert db.connection_pool.acquired == 2 and db.connection_pool.released == 2
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_transaction_commits_or_rolls_back():
+    db = _pooled_manager()
+    async with db.unit_of_work(transaction=True):
+        async with db.acquire():
+            pass
+    assert db.connection_pool.log == ["begin", "commit"]
+
+    db.connection_pool.log.clear()
+    with pytest.raises(RuntimeError):
+        async with db.unit_of_work(transaction=True):
+            async with db.acquire():
+                raise RuntimeError("boom")
+    assert db.connection_pool.log == ["begin", "rollback"]
+    assert db.connection_pool.released == 2
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_reads_before_write_use_replicas(monkeypatch):
+    db, pools = await _replicated_manager(monkeypatch)
+    async with db.unit_of_work():
+        async with db.acquire(readonly=True) as conn:
+            assert conn.host.startswith("replica")
+        async with db.acquire() as written:
+            assert written.host == "127.0.0.1"
+        # 写入之后的读取共用同一个主库连接，读到本单元的写入
+        async with db.acquire(readonly=True) as conn:
+            assert conn is written
+    await db.close_all_connections()
+
+
+class _SharedPins:
+    """模拟Redis：多个管理器实例（worker进程）共用的固定记录。"""
+    def __init__(self):
+        self.keys = {}
+
+    async def set(self, key, value, expire=None):
+        self.keys[key] = expire
+        return True
+
+    async def exists(self, *keys):
+        return sum(1 for key in keys if key in self.keys)
+
+
+@pytest.mark.asyncio
+async def test_pins_are_shared_between_workers(monkeypatch):
+    store = _SharedPins()
+    writer, _ = await _replicated_manager(monkeypatch)
+    reader, _ = await _replicated_manager(monkeypatch)
+    writer.pin_store = reader.pin_store = store
+
+    async with writer.acquire(pin_key="user-1"):
+        pass
+    assert store.keys == {"db:pin:user-1": 2}
+    # 另一个worker没有本地记录，从共享存储中看到固定
+    assert "user-1" not in reader._pins
+    async with reader.acquire(readonly=True, pin_key="user-1") as conn:
+        assert conn.host == "127.0.0.1"
+    async with reader.acquire(readonly=True, pin_key="user-2") as conn:
+        assert conn.host.startswith("replica")
+    await writer.close_all_connections()
+    await reader.close_all_connections()
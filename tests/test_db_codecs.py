@@ -0,0 +1,97 @@
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules.databaseman import codecs, install_codecs
+from services.task_service import TaskService
+
+
+def test_timestamp_codecs_match_asyncpg_isoformat():
+    moment = datetime(2024, 5, 17, 8, 30, 12, 345000, tzinfo=timezone.utc)
+    encoded = codecs.encode_timestamptz(moment)
+    assert codecs.decode_timestamptz(encoded) == moment.isoformat()
+    # 参数也可以是其他时区或ISO字符串
+    shifted = moment.astimezone(timezone(timedelta(hours=8)))
+    assert codecs.encode_timestamptz(shifted) == encoded
+    assert codecs.encode_timestamptz(shifted.isoformat()) == encoded
+    assert codecs.decode_timestamptz((codecs._PG_INFINITY,)) == "infinity"
+
+    naive = datetime(1999, 12, 31, 23, 59, 59)
+    assert codecs.decode_timestamp(codecs.encode_timestamp(naive)) == naive.isoformat()
+
+
+def test_json_codec_passes_serialized_strings_through():
+    assert codecs.encode_json('{"a": 1}') == '{"a": 1}'
+    assert codecs.decode_json(codecs.encode_json({"标题": [1, None]})) == {"标题": [1, None]}
+
+
+@pytest.mark.asyncio
+async def test_install_codecs_registers_types():
+    class _Conn:
+        def __init__(self):
+            self.codecs = {}
+
+        async def set_type_codec(self, name, **kwargs):
+            self.codecs[name] = kwargs
+
+    plain, iso = _Conn(), _Conn()
+    await install_codecs(plain)
+    await install_codecs(iso, iso_timestamps=True)
+    assert set(plain.codecs) == {"json", "jsonb", "uuid"}
+    assert set(iso.codecs) == {"json", "jsonb", "uuid", "timestamptz", "timestamp"}
+    assert iso.codecs["timestamptz"]["format"] == "tuple"
+
+
+def test_task_rows_skip_normalization_with_text_codecs():
+    class _TextDB:
+        iso_timestamps = True
+
+    class _BinaryDB:
+        iso_timestamps = False
+
+    task_id, now = uuid.uuid4(), datetime.now(timezone.utc)
+    row = {
+        "id": task_id, "project_id": None, "workspace_id": None, "creator_id": None,
+        "assignee_id": None, "title": "t", "description": None, "status": "backlog",
+        "priority": "medium", "estimated_minutes": 5, "due_at": None,
+        "created_at": now, "updated_at": now,
+    }
+    task = TaskService(_BinaryDB())._build_task_from_row(row)    # type: ignore[arg-type]
+    assert task.id == str(task_id) and task.created_at == now.isoformat()
+    assert task.parent_task_id is None and task.metadata is None
+
+    text_row = {**row, "id": str(task_id), "created_at": now.isoformat(), "updated_at": now.isoformat()}
+    task = TaskService(_TextDB())._build_task_from_row(text_row, str(task_id))    # type: ignore[arg-type]
+    assert task.id == str(task_id) and task.parent_task_id == str(task_id)
+
+
+def test_task_keeps_decoded_jsonb_objects():
+    from dataclasses import asdict
+    from pydantic import TypeAdapter
+    from services.models.task_data_model import TaskTree
+
+    class _TextDB:
+        iso_timestamps = True
+
+    row = {
+        "id": "t1", "project_id": "p1", "workspace_id": "w1", "creator_id": "u1",
+        "assignee_id": None, "parent_task_id": None, "title": "t", "description": None,
+        "status": "backlog", "priority": "medium", "estimated_minutes": 5, "due_at": None,
+        "created_at": "2024-05-17T08:30:12+00:00", "updated_at": "2024-05-17T08:30:12+00:00",
+        # jsonb列经过decode_json后是对象而不是JSON字符串
+        "metadata": codecs.decode_json('{"source": "ai", "tags": ["a"]}'),
+        "recurrence_rule": codecs.decode_json('{"freq": "weekly"}'),
+        "recurrence_meta": codecs.decode_json("{}"),
+    }
+    task = TaskService(_TextDB())._build_task_from_row(row)    # type: ignore[arg-type]
+    assert task.metadata == {"source": "ai", "tags": ["a"]} and task.recurrence_meta == {}
+
+    # 与响应模型一样按字段类型校验任务树
+    tree = TypeAdapter(TaskTree).validate_python(asdict(TaskTree(task, [])))
+    assert tree.task.recurrence_rule == {"freq": "weekly"}
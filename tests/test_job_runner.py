@@ -0,0 +1,58 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from modules.job_runner import JobRunner, JobQueueFullError
+
+
+@pytest.mark.asyncio
+async def test_job_runner_bounds_concurrency():
+    """同时运行的任务数不超过concurrency。"""
+    runner = JobRunner(concurrency=3, max_pending=50)
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    tasks = [runner.submit(job) for _ in range(20)]
+    await asyncio.gather(*tasks)
+
+    assert peak == 3
+    assert runner.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_job_runner_rejects_when_full_and_isolates_context():
+    """超过max_pending时拒绝提交；任务不继承提交方的上下文变量。"""
+    var: contextvars.ContextVar = contextvars.ContextVar("var", default="fresh")
+    var.set("request")
+    release = asyncio.Event()
+    seen = []
+
+    async def job():
+        seen.append(var.get())
+        await release.wait()
+
+    runner = JobRunner(concurrency=1, max_pending=2)
+    runner.submit(job)
+    runner.submit(job)
+    with pytest.raises(JobQueueFullError):
+        runner.submit(job)
+
+    release.set()
+    await runner.shutdown(timeout=1.0)
+    assert seen == ["fresh", "fresh"]
+
+
+@pytest.mark.asyncio
+async def test_job_runner_shutdown_cancels_stuck_jobs():
+    runner = JobRunner(concurrency=1)
+    task = runner.submit(lambda: asyncio.sleep(10))
+    await runner.shutdown(timeout=0.01)
+    assert task.cancelled()
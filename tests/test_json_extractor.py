@@ -0,0 +1,117 @@
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import json
+
+from modules.json_extractor import JSONBlockExtractor, extract_json_block
+
+
+SAMPLE: str = '{"main_goal": "g", "tasks": [{"title": "t {x}", "subtasks": []}], "summary": "s \\" }"}'
+
+
+def test_extract_prefers_markers_and_strips_fence():
+    text = "思考 {a} ...\n<<<JSON_BEGIN>>>\n```json\n" + SAMPLE + "\n```\n<<<JSON_END>>>\n结尾 {b}"
+    assert extract_json_block(text) == SAMPLE
+
+
+def test_extract_ignores_braces_inside_strings_and_prose():
+    text = "推理：用 {x} 表示集合，} 多余的括号 { 还有 {\"bad\": } 之后是结果：\n" + SAMPLE + "\n完毕"
+    result = extract_json_block(text)
+    assert result is not None
+    assert json.loads(result)["summary"] == 's " }'
+
+
+def test_extract_returns_none_without_json():
+    assert extract_json_block("没有任何JSON {不是json}") is None
+    assert extract_json_block("") is None
+
+
+def test_feed_incrementally_across_chunk_boundaries():
+    text = "前言 <<<JSON_" + "BEGIN>>>" + SAMPLE + "<<<JSON_END>>>"
+    extractor = JSONBlockExtractor()
+    emitted = []
+    for i in range(0, len(text), 3):
+        emitted.extend(extractor.feed(text[i:i + 3]))
+    assert emitted == [SAMPLE]
+    assert extractor.marker_block == SAMPLE
+    assert extractor.result() == SAMPLE
+
+
+def test_stray_open_brace_before_json():
+    text = "这里有一个孤立的 { 和一个引号 \" 然后：" + SAMPLE
+    assert extract_json_block(text) == SAMPLE
+
+
+def _feed_in_chunks(parser, text, size):
+    out = []
+    for i in range(0, len(text), size):
+        out += parser.feed(text[i:i + size])
+    parser.close()
+    return out
+
+
+def test_task_stream_parser_emits_tasks_before_json_closes():
+    from modules.json_extractor import TaskStreamParser
+
+    doc = {
+        "main_goal": "g",
+        "tasks": [{
+            "title": "根", "description": "d \"q\"", "estimated_time": 1.5, "estimated_time_unit": "hour",
+            "priority": "high",
+            "subtasks": [
+                {"title": "a", "priority": "low", "subtasks": [{"title": "a1", "subtasks": []}]},
+                # subtasks写在标题之前时，子任务要等上级任务读完后再输出
+                {"subtasks": [{"title": "b1"}], "title": "b", "tags": [{"title": "不是任务"}]},
+            ],
+        }],
+        "summary": "s",
+    }
+    text = "想一想 {x}\n<<<JSON_BEGIN>>>\n```json\n" + json.dumps(doc, ensure_ascii=False) + "\n```\n<<<JSON_END>>>"
+
+    for size in (1, 3, 7, len(text)):
+        parser = TaskStreamParser()
+        tasks = _feed_in_chunks(parser, text, size)
+        assert parser.done and parser.error is None
+        assert [t["title"] for t in tasks] == ["根", "a", "a1", "b", "b1"]
+        by_id = {t["id"]: t["title"] for t in tasks}
+        assert [by_id.get(t["parent_task_id"]) for t in tasks] == [None, "根", "a", "根", "b"]
+        assert tasks[0]["estimated_time"] == 1.5 and tasks[0]["description"] == 'd "q"'
+
+    # 根任务在子任务开始时就已经输出
+    parser = TaskStreamParser()
+    head = text[:text.index('"a"')]
+    assert [t["title"] for t in parser.feed(head)] == ["根"]
+
+
+def test_task_stream_parser_drops_owner_fields_after_subtasks():
+    from modules.json_extractor import TaskStreamParser
+
+    parser = TaskStreamParser()
+    tasks = parser.feed(
+        '{"tasks": [{"title": "根", "subtasks": [{"title": "a", "priority": "low"}], '
+        '"priority": "high", "estimated_time": 2}]}'
+    )
+    assert parser.done and parser.error is None
+    # 上级任务在subtasks开始时已输出，之后的字段不再补上
+    assert tasks[0]["title"] == "根" and "priority" not in tasks[0] and "estimated_time" not in tasks[0]
+    assert tasks[1]["priority"] == "low"
+
+
+def test_task_stream_parser_errors():
+    from modules.json_extractor import TaskStreamParser
+
+    parser = TaskStreamParser()
+    parser.feed('{"tasks": [{"title": "x",, }]}')
+    assert parser.error is not None
+
+    parser = TaskStreamParser()
+    assert [t["title"] for t in parser.feed('{"tasks": [{"title": "x", "subtasks": [')] == ["x"]
+    parser.close()
+    assert parser.error is not None
+
+    # 没有开始标记且回答不以JSON开头时不解析
+    parser = TaskStreamParser()
+    parser.feed('先说几句话 {"tasks": []}')
+    assert not parser.started
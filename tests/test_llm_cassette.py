@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+try:
+    import httpx  # type: ignore
+    import openai  # type: ignore
+except ImportError:
+    pytest.skip("httpx/openai not installed; skipping llm cassette tests", allow_module_level=True)
+
+from modules.llm_fetcher import LLMCassette, LLMCassetteMissError, LLMFetcher, LLMGovernor
+from scripts.mock_llm_server import MockLLMConfig, create_app
+
+
+def _fetcher(transport, governor=None):
+    client = httpx.AsyncClient(transport=transport)
+    return LLMFetcher("http://llm.test/v1", "sk-test", "mock-reasoner", http_client=client, governor=governor)
+
+
+@pytest.mark.asyncio
+async def test_recorded_stream_replays_without_network(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    upstream = httpx.ASGITransport(app=create_app(MockLLMConfig(tps=0, ttft=0, reasoning_tokens=5, seed=3)))
+
+    recorder = LLMCassette(path, mode="record")
+    fetcher = _fetcher(recorder.transport(upstream))
+    recorded = [c async for c in fetcher.fetch_stream("目标", output_reasoning=True)]
+    completion = await fetcher.fetch("目标")
+    assert recorder.recorded == 2
+
+    player = LLMCassette(path, mode="replay", speed=0)
+    fetcher = _fetcher(player.transport())
+    assert [c async for c in fetcher.fetch_stream("目标", output_reasoning=True)] == recorded
+    replayed = await fetcher.fetch("目标")
+    assert replayed.choices[0].message.content == completion.choices[0].message.content
+    assert player.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_follows_recorded_timeline(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    cassette = LLMCassette(path, mode="record")
+    key = LLMCassette.make_key("POST", "/v1/x", b'{"b": 1, "a": 2}')
+    cassette.add({
+        "key": key, "method": "POST", "path": "/v1/x", "status": 200, "headers": {"content-type": "text/plain"},
+        "headers_ms": 40.0, "chunks": [[40.0, "a"], [120.0, "b"]],
+    })
+
+    player = LLMCassette(path, mode="replay", speed=2.0)
+    async with httpx.AsyncClient(transport=player.transport()) as client:
+        start = time.perf_counter()
+        # 字段顺序不同的相同请求也能匹配
+        response = await client.post("http://other.host/v1/x", content=b'{"a":2,"b":1}')
+        assert response.text == "ab"
+        assert time.perf_counter() - start >= 0.055
+
+        with pytest.raises(LLMCassetteMissError):
+            await client.post("http://other.host/v1/x", content=b'{"a":3}')
+
+
+@pytest.mark.asyncio
+async def test_cassette_miss_is_not_retried(tmp_path):
+    governor = LLMGovernor(max_retries=3, base_backoff=0.0)
+    fetcher = _fetcher(LLMCassette(str(tmp_path / "empty.jsonl")).transport(), governor=governor)
+
+    with pytest.raises(LLMCassetteMissError):
+        await fetcher.fetch("hi")
+    assert governor.snapshot()["retries_total"] == 0
@@ -0,0 +1,225 @@
+import asyncio
+import json
+
+import pytest
+
+try:
+    import httpx  # type: ignore
+    import openai  # type: ignore
+except ImportError:
+    pytest.skip("httpx/openai not installed; skipping llm fetcher tests", allow_module_level=True)
+
+from modules.llm_fetcher import LLMFetcher
+
+
+def _sse_body(deltas, usage=None):
+    """把若干delta拼成OpenAI兼容的SSE响应体。"""
+    lines = []
+    for delta in deltas:
+        chunk = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "test-model",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        }
+        lines.append(f"data: {json.dumps(chunk)}\n\n")
+    # 用量统计块不带choices
+    tail = {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "test-model", "choices": []}
+    if usage is not None:
+        tail["usage"] = usage
+    lines.append(f"data: {json.dumps(tail)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode()
+
+
+def _make_fetcher(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LLMFetcher("http://llm.test/v1", "sk-test", "test-model", http_client=client)
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_reads_async_and_marks_reasoning():
+    """流式读取：推理内容带标记输出，空choices块被跳过。"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body([
+                {"role": "assistant", "reasoning_content": "想一想"},
+                {"content": "你好"},
+                {"content": "喵"},
+            ]),
+        )
+
+    fetcher = _make_fetcher(handler)
+    chunks = [c async for c in fetcher.fetch_stream("hi", output_reasoning=True)]
+    await fetcher.aclose()
+
+    assert "".join(chunks) == "\n<<<THINKING>>>\n想一想\n<<<THINK_END>>>\n你好喵"
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_plain_model_without_reasoning_field():
+    """非推理模型的delta不含reasoning_content，内容也要正常输出。"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body([{"content": "a"}, {"content": "b"}]),
+        )
+
+    fetcher = _make_fetcher(handler)
+    chunks = [c async for c in fetcher.fetch_stream("hi")]
+    await fetcher.aclose()
+
+    assert chunks == ["a", "b"]
+    # 不需要用量时不发送stream_options
+    assert "stream_options" not in requests[0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_captures_usage():
+    """传入usage字典时请求用量统计，并写入平台返回的token数。"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body(
+                [{"content": "ok"}],
+                usage={"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+            ),
+        )
+
+    fetcher = _make_fetcher(handler)
+    usage = {}
+    chunks = [c async for c in fetcher.fetch_stream("hi", usage=usage)]
+    await fetcher.aclose()
+
+    assert chunks == ["ok"]
+    assert requests[0]["stream_options"] == {"include_usage": True}
+    assert usage == {"prompt_tokens": 12, "completion_tokens": 3}
+
+
+@pytest.mark.asyncio
+async def test_fetch_is_awaitable_and_aclose_closes_client():
+    """非流式请求是协程，可以并发；aclose会关闭共享的HTTP客户端。"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": body["messages"][-1]["content"]},
+                "finish_reason": "stop",
+            }],
+        })
+
+    fetcher = _make_fetcher(handler)
+    responses = await asyncio.gather(*(fetcher.fetch(f"m{i}") for i in range(5)))
+    await fetcher.aclose()
+
+    assert [r.choices[0].message.content for r in responses] == [f"m{i}" for i in range(5)]
+    assert fetcher.http_client.is_closed
+
+
+class _FakeRedis:
+    """模拟LLMResponseCache用到的RedisManager方法（不模拟过期与淘汰）。"""
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else json.loads(value)
+
+    async def eval_script(self, script, keys, args):
+        self.data[keys[0]] = args[0]
+        return 1
+
+
+def _counting_stream_handler(calls, deltas):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body(deltas, usage={"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}),
+        )
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_cache_replays_chunks():
+    """命中缓存时逐块重放，不再请求平台；参数不同则不命中。"""
+    from modules.llm_fetcher import LLMResponseCache
+
+    calls = []
+    fetcher = _make_fetcher(_counting_stream_handler(calls, [{"content": "你"}, {"content": "好"}]))
+    fetcher.response_cache = LLMResponseCache(_FakeRedis(), ttl=60)
+
+    first = [c async for c in fetcher.fetch_stream("hi", use_cache=True)]
+    usage = {}
+    second = [c async for c in fetcher.fetch_stream("hi", use_cache=True, usage=usage)]
+    other = [c async for c in fetcher.fetch_stream("hi", use_cache=True, temperature=0.9)]
+    bypass = [c async for c in fetcher.fetch_stream("hi")]
+    await fetcher.aclose()
+
+    assert first == second == other == bypass == ["你", "好"]
+    assert usage == {"prompt_tokens": 5, "completion_tokens": 2}
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_cache_skips_aborted_and_oversized():
+    """提前中断的流以及超过单条大小上限的回答都不会被缓存。"""
+    from modules.llm_fetcher import LLMResponseCache
+
+    calls = []
+    fetcher = _make_fetcher(_counting_stream_handler(calls, [{"content": "a" * 100}, {"content": "b"}]))
+    redis = _FakeRedis()
+    fetcher.response_cache = LLMResponseCache(redis, ttl=60, max_entry_bytes=50)
+
+    stream = fetcher.fetch_stream("hi", use_cache=True)
+    async for _ in stream:
+        break
+    await stream.aclose()
+    assert redis.data == {}
+
+    [c async for c in fetcher.fetch_stream("hi", use_cache=True)]
+    await fetcher.aclose()
+    assert redis.data == {}
+
+
+@pytest.mark.asyncio
+async def test_fetch_completion_cache():
+    from modules.llm_fetcher import LLMResponseCache
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "test-model",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+        })
+
+    fetcher = _make_fetcher(handler)
+    fetcher.response_cache = LLMResponseCache(_FakeRedis(), ttl=60)
+    first = await fetcher.fetch("hi", system_prompt="sys", use_cache=True)
+    second = await fetcher.fetch("hi", system_prompt="sys", use_cache=True)
+    await fetcher.aclose()
+
+    assert first.choices[0].message.content == second.choices[0].message.content == "ok"
+    assert len(calls) == 1
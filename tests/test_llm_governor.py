@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+try:
+    import httpx  # type: ignore
+    import openai  # type: ignore
+except ImportError:
+    pytest.skip("httpx/openai not installed; skipping llm governor tests", allow_module_level=True)
+
+from modules.llm_fetcher import LLMFetcher, LLMGovernor, LLMRateLimitedError
+from modules.llm_fetcher.governor import _parse_retry_after
+from tests.test_llm_fetcher import _sse_body
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def _make_fetcher(handler, governor):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LLMFetcher("http://llm.test/v1", "sk-test", "test-model", http_client=client, governor=governor)
+
+
+@pytest.mark.asyncio
+async def test_governor_caps_concurrency_and_rejects_after_max_wait():
+    """同时进行的调用不超过上限；排队超过max_wait时抛出LLMRateLimitedError。"""
+    governor = LLMGovernor(max_concurrency=2, max_wait=0.05)
+    running = 0
+    peak = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal running, peak
+        async with governor.slot():
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+    holders = [asyncio.create_task(work()) for _ in range(2)]
+    try:
+        await asyncio.sleep(0.01)
+        assert governor.snapshot()["in_flight"] == 2
+
+        with pytest.raises(LLMRateLimitedError):
+            async with governor.slot():
+                pass
+    finally:
+        release.set()
+    await asyncio.gather(*holders)
+    snapshot = governor.snapshot()
+    assert peak == 2
+    assert snapshot["in_flight"] == 0 and snapshot["queue_depth"] == 0
+    assert snapshot["acquired_total"] == 2 and snapshot["rejected_total"] == 1
+
+
+class _BucketRedis:
+    """按顺序返回令牌桶脚本的等待秒数。"""
+    def __init__(self, waits):
+        self.waits = list(waits)
+        self.calls = 0
+
+    async def eval_script(self, script, keys, args):
+        self.calls += 1
+        return self.waits.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_governor_waits_for_cluster_token_and_fails_open():
+    redis = _BucketRedis(["0.01", "0"])
+    governor = LLMGovernor(redis_manager=redis, rate_per_second=5, max_wait=1.0)
+    async with governor.slot():
+        pass
+    assert redis.calls == 2
+
+    # 需要等待的时间超出max_wait时直接拒绝
+    governor = LLMGovernor(redis_manager=_BucketRedis(["5"]), rate_per_second=5, max_wait=1.0)
+    with pytest.raises(LLMRateLimitedError):
+        async with governor.slot():
+            pass
+    assert governor.snapshot()["in_flight"] == 0
+
+    class _Broken:
+        async def eval_script(self, script, keys, args):
+            raise ConnectionError("down")
+
+    governor = LLMGovernor(redis_manager=_Broken(), rate_per_second=5)
+    async with governor.slot():
+        pass
+
+
+@pytest.mark.asyncio
+async def test_fetch_retries_429_honouring_retry_after():
+    """429由控制器重试（SDK不再自行重试），非重试状态码直接抛出。"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": {"message": "slow down"}})
+        return httpx.Response(200, json=_completion("ok"))
+
+    governor = LLMGovernor(base_backoff=0.01)
+    fetcher = _make_fetcher(handler, governor)
+    response = await fetcher.fetch("hi")
+    assert response.choices[0].message.content == "ok"
+    assert len(calls) == 2
+    assert governor.snapshot()["retries_total"] == 1
+
+    calls.clear()
+    fetcher.http_client._transport = httpx.MockTransport(
+        lambda request: calls.append(request) or httpx.Response(400, json={"error": {"message": "bad"}})
+    )
+    with pytest.raises(openai.BadRequestError):
+        await fetcher.fetch("hi")
+    await fetcher.aclose()
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_holds_slot_and_retries_before_first_chunk():
+    calls = []
+    governor = LLMGovernor(max_concurrency=1, base_backoff=0.01)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"retry-after": "0"}, json={"error": {"message": "busy"}})
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body([{"content": "a"}, {"content": "b"}]),
+        )
+
+    fetcher = _make_fetcher(handler, governor)
+    chunks = []
+    async for chunk in fetcher.fetch_stream("hi"):
+        chunks.append(chunk)
+        assert governor.snapshot()["in_flight"] == 1
+    await fetcher.aclose()
+
+    assert chunks == ["a", "b"]
+    assert len(calls) == 2
+    assert governor.snapshot()["in_flight"] == 0
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after(httpx.Headers({"retry-after": "3"})) == 3.0
+    assert _parse_retry_after(httpx.Headers({"retry-after-ms": "250"})) == 0.25
+    assert _parse_retry_after(httpx.Headers({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert _parse_retry_after(httpx.Headers({})) is None
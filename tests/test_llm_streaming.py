@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+try:
+    import httpx  # type: ignore
+    import openai  # type: ignore
+except ImportError:
+    pytest.skip("httpx/openai not installed; skipping llm streaming tests", allow_module_level=True)
+
+from modules.llm_fetcher import BoundedTextBuffer, LLMStreamEvent, coalesce_chunks, with_heartbeat
+from tests.test_llm_fetcher import _make_fetcher, _sse_body
+
+
+def test_stream_event_encode_and_bounded_buffer():
+    assert LLMStreamEvent("content", "喵\n").encode() == 'event: content\ndata: "喵\\n"\n\n'
+
+    buffer = BoundedTextBuffer(5)
+    for part in ["ab", "cd", "ef", "gh"]:
+        buffer.append(part)
+    assert buffer.getvalue() == "abcde"
+    assert len(buffer) == 5 and buffer.truncated
+
+
+@pytest.mark.asyncio
+async def test_with_heartbeat_emits_none_when_idle():
+    async def slow():
+        yield "a"
+        await asyncio.sleep(0.12)
+        yield "b"
+
+    items = [item async for item in with_heartbeat(slow(), interval=0.05)]
+    assert items[0] == "a" and items[-1] == "b"
+    assert items.count(None) >= 1
+
+
+@pytest.mark.asyncio
+async def test_with_heartbeat_cancels_source_on_disconnect():
+    """客户端断开后立即停止，并在上游的等待点取消它。"""
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            yield "first"
+            await asyncio.sleep(3600)
+            yield "never"
+        finally:
+            closed.set()
+
+    disconnected = False
+
+    async def is_disconnected():
+        return disconnected
+
+    items = []
+    async for item in with_heartbeat(endless(), interval=10, is_disconnected=is_disconnected, poll_interval=0.01):
+        items.append(item)
+        disconnected = True
+
+    assert items == ["first"]
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_fetch_stream_events_types_deltas():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse_body([
+                {"role": "assistant", "reasoning_content": "想"},
+                {"content": "好"},
+            ], usage={"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}),
+        )
+
+    fetcher = _make_fetcher(handler)
+    usage = {}
+    events = [e async for e in fetcher.fetch_stream_events("hi", usage=usage)]
+    hidden = [e async for e in fetcher.fetch_stream_events("hi", output_reasoning=False)]
+    await fetcher.aclose()
+
+    assert events == [LLMStreamEvent("reasoning", "想"), LLMStreamEvent("content", "好")]
+    assert hidden == [LLMStreamEvent("content", "好")]
+    assert usage == {"prompt_tokens": 3, "completion_tokens": 1}
+
+
+async def _paced(items, gap=0.0):
+    for item in items:
+        if gap:
+            await asyncio.sleep(gap)
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_flushes_on_size_and_keeps_first_immediate():
+    out = [c async for c in coalesce_chunks(_paced(["a", "bb", "cc", "dd", "e"]), max_bytes=4, max_delay=10)]
+    assert out == ["a", "bbcc", "dde"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_flushes_on_time_window():
+    out = [c async for c in coalesce_chunks(_paced(["a", "b", "c", "d"], gap=0.03), max_bytes=1024, max_delay=0.045)]
+    assert "".join(out) == "abcd"
+    assert out[0] == "a" and len(out) >= 3
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_flushes_buffer_before_source_error():
+    async def failing():
+        for item in ["a", "b", "c"]:
+            yield item
+        raise RuntimeError("upstream closed")
+
+    out = []
+    with pytest.raises(RuntimeError):
+        async for chunk in coalesce_chunks(failing(), max_bytes=1024, max_delay=10):
+            out.append(chunk)
+    assert out == ["a", "bc"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_merges_only_same_event_type():
+    events = [
+        LLMStreamEvent("reasoning", "想"),
+        LLMStreamEvent("reasoning", "一"),
+        LLMStreamEvent("reasoning", "想"),
+        LLMStreamEvent("content", "好"),
+        LLMStreamEvent("content", "的"),
+        LLMStreamEvent("done", {"usage": {}}),
+    ]
+    out = [e async for e in coalesce_chunks(_paced(events), max_bytes=1024, max_delay=10)]
+    assert out == [
+        LLMStreamEvent("reasoning", "想"),
+        LLMStreamEvent("reasoning", "一想"),
+        LLMStreamEvent("content", "好的"),
+        LLMStreamEvent("done", {"usage": {}}),
+    ]
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+try:
+    import httpx  # type: ignore
+    import openai  # type: ignore
+except ImportError:
+    pytest.skip("httpx/openai not installed; skipping mock llm server tests", allow_module_level=True)
+
+from modules.json_extractor import TaskStreamParser
+from modules.llm_fetcher import LLMFetcher, LLMGovernor
+from scripts.mock_llm_server import DECOMPOSITION, MockLLMConfig, create_app
+
+
+def _fetcher(config, governor=None):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(config)))
+    return LLMFetcher("http://mock.test/v1", "sk-test", "mock-reasoner", http_client=client, governor=governor)
+
+
+@pytest.mark.asyncio
+async def test_mock_server_non_streaming_returns_decomposition():
+    fetcher = _fetcher(MockLLMConfig(tps=0, ttft=0, reasoning_tokens=5, seed=1))
+    response = await fetcher.fetch("帮我规划一次社团活动")
+
+    content = response.choices[0].message.content
+    begin = content.index("<<<JSON_BEGIN>>>") + len("<<<JSON_BEGIN>>>")
+    assert json.loads(content[begin:content.index("<<<JSON_END>>>")]) == DECOMPOSITION
+    assert response.usage.completion_tokens > 0
+
+
+@pytest.mark.asyncio
+async def test_mock_server_streams_reasoning_then_answer():
+    fetcher = _fetcher(MockLLMConfig(tps=0, ttft=0, reasoning_tokens=5, seed=1))
+    usage = {}
+    chunks = [c async for c in fetcher.fetch_stream("帮我规划一次社团活动", output_reasoning=True, usage=usage)]
+    text = "".join(chunks)
+
+    assert text.startswith("\n<<<THINKING>>>\n") and "<<<THINK_END>>>" in text
+    parser = TaskStreamParser()
+    titles = [t["title"] for c in chunks for t in parser.feed(c)]
+    assert parser.done and titles[0] == "筹备社团活动" and len(titles) == 6
+    assert usage["completion_tokens"] > 0
+
+
+@pytest.mark.asyncio
+async def test_mock_server_errors_are_retried_by_governor():
+    governor = LLMGovernor(max_concurrency=2, max_retries=1, base_backoff=0.0)
+    fetcher = _fetcher(MockLLMConfig(tps=0, ttft=0, error_rate=1.0, retry_after=0.01), governor=governor)
+
+    with pytest.raises(openai.RateLimitError):
+        await fetcher.fetch("hi")
+    assert governor.snapshot()["retries_total"] == 1
@@ -0,0 +1,111 @@
+import pytest
+
+try:
+    import asyncpg  # type: ignore
+except ImportError:
+    pytest.skip("asyncpg not installed; skipping query registry tests", allow_module_level=True)
+
+from asyncpg.connresource import ConnectionResource, guarded
+
+from modules.databaseman import NamedQuery, QueryRegistry, UnknownQueryError
+
+
+GET_TASK = NamedQuery("tasks.get_by_id", "SELECT * FROM tasks WHERE id = $1")
+
+
+class _Statement(ConnectionResource):
+    """与asyncpg的PreparedStatement一样，连接归还连接池后不能再使用。"""
+    __slots__ = ("sql",)
+
+    def __init__(self, conn, sql):
+        super().__init__(conn)
+        self.sql = sql
+
+    @guarded
+    async def fetchrow(self, *args, timeout=None):
+        self._connection.executed.append((self.sql, args))
+        return {"id": args[0]}
+
+
+class _PooledConn:
+    """模拟连接池中的PreparedConnection：按SQL缓存预编译结果，归还时使已取得的语句失效。"""
+    def __init__(self):
+        self.named_queries = set()
+        self.prepared = []
+        self.executed = []
+        self._pool_release_ctr = 0
+        self._plans = {}
+
+    def is_closed(self):
+        return False
+
+    def release(self):
+        self._pool_release_ctr += 1
+
+    async def fetchrow(self, sql, *args, timeout=None):
+        if sql not in self._plans:
+            self.prepared.append(sql)
+            self._plans[sql] = sql
+        return await _Statement(self, sql).fetchrow(*args, timeout=timeout)
+
+
+class _PlainConn:
+    def __init__(self):
+        self.executed = []
+
+    async def fetchrow(self, sql, *args):
+        self.executed.append((sql, args))
+        return {"id": args[0]}
+
+
+@pytest.mark.asyncio
+async def test_named_query_is_prepared_once_per_connection():
+    registry = QueryRegistry()
+    first, second = _PooledConn(), _PooledConn()
+
+    for conn in (first, second, first, first):
+        assert await registry.fetchrow(conn, GET_TASK, "t1") == {"id": "t1"}
+    # 也可以按名称调用已注册的查询
+    await registry.fetchrow(second, "tasks.get_by_id", "t2")
+
+    assert len(first.prepared) == 1 and len(second.prepared) == 1
+    stats = registry.stats()["tasks.get_by_id"]
+    assert stats["calls"] == 5 and stats["first_use_per_conn"] == 2 and stats["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_named_query_survives_release_and_reacquire():
+    registry = QueryRegistry()
+    conn = _PooledConn()
+    await registry.fetchrow(conn, GET_TASK, "t1")
+    stale = _Statement(conn, GET_TASK.sql)
+    conn.release()
+
+    # 保存下来的语句对象在归还后失效，注册表不能复用它
+    with pytest.raises(asyncpg.exceptions.InterfaceError):
+        await stale.fetchrow("t1")
+    assert await registry.fetchrow(conn, GET_TASK, "t2") == {"id": "t2"}
+    stats = registry.stats()["tasks.get_by_id"]
+    assert stats["errors"] == 0 and stats["first_use_per_conn"] == 1 and len(conn.prepared) == 1
+
+
+@pytest.mark.asyncio
+async def test_opt_out_sends_sql_text_and_still_counts():
+    registry = QueryRegistry(prepare=False)
+    conn = _PooledConn()
+
+    await registry.fetchrow(conn, GET_TASK, "t1")
+
+    assert conn.executed == [(GET_TASK.sql, ("t1",))] and conn.named_queries == set()
+    stats = registry.stats()["tasks.get_by_id"]
+    assert stats["calls"] == 1 and stats["first_use_per_conn"] == 0
+
+
+@pytest.mark.asyncio
+async def test_unknown_and_conflicting_names_are_rejected():
+    registry = QueryRegistry()
+    with pytest.raises(UnknownQueryError):
+        await registry.fetchrow(_PlainConn(), "tasks.missing", "t1")
+    registry.register(GET_TASK.name, GET_TASK.sql)
+    with pytest.raises(ValueError):
+        registry.register(GET_TASK.name, "SELECT 1")
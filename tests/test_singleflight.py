@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from modules.singleflight import SingleFlight
+
+
+class _FakeRedis:
+    """模拟SingleFlight用到的RedisManager方法（不模拟过期）。"""
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key, value, expire=None):
+        self.data[key] = json.dumps(value)
+        return True
+
+    async def set_nx(self, key, value, expire=None):
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def eval_script(self, script, keys, args):
+        if self.data.get(keys[0]) == args[0]:
+            del self.data[keys[0]]
+            return 1
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_singleflight_coalesces_within_worker():
+    """同一worker内的并发相同请求只执行一次。"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"n": calls}
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(10)))
+
+    assert calls == 1
+    assert results == [{"n": 1}] * 10
+    # 完成后不再合并
+    assert await flight.do("k", work) == {"n": 2}
+
+
+@pytest.mark.asyncio
+async def test_singleflight_shares_errors_and_survives_caller_cancel():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ValueError("boom")
+
+    first = asyncio.ensure_future(flight.do("k", failing))
+    second = asyncio.ensure_future(flight.do("k", failing))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    with pytest.raises(ValueError):
+        await second
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_singleflight_coalesces_across_workers():
+    """两个worker共享Redis时，只有持锁者执行，另一个读取结果键。"""
+    redis = _FakeRedis()
+    worker_a = SingleFlight(redis, poll_interval=0.005)
+    worker_b = SingleFlight(redis, poll_interval=0.005)
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.03)
+        return {"ok": True}
+
+    results = await asyncio.gather(worker_a.do("k", work), worker_b.do("k", work))
+
+    assert calls == 1
+    assert results == [{"ok": True}, {"ok": True}]
+    # 锁已释放，结果键保留
+    assert "sf:lock:k" not in redis.data
+    assert "sf:result:k" in redis.data
+
+
+@pytest.mark.asyncio
+async def test_singleflight_waiter_takes_over_when_holder_fails():
+    redis = _FakeRedis()
+    worker_a = SingleFlight(redis, poll_interval=0.005)
+    worker_b = SingleFlight(redis, poll_interval=0.005)
+    attempts = []
+
+    async def work():
+        attempts.append(len(attempts))
+        await asyncio.sleep(0.02)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream error")
+        return "second try"
+
+    first, second = await asyncio.gather(
+        worker_a.do("k", work), worker_b.do("k", work), return_exceptions=True
+    )
+
+    assert isinstance(first, RuntimeError)
+    assert second == "second try"
+    assert len(attempts) == 2
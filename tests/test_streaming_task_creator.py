@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from services import StreamingTaskCreator, TaskService
+
+
+class _Row(dict):
+    """写入后返回的任务，与Task一样可以通过属性读取ID。"""
+    @property
+    def id(self):
+        return self["id"]
+
+
+class _RecordingTaskService(TaskService):
+    """只记录写入与删除，不访问数据库。"""
+    def __init__(self):
+        super().__init__(db=None)
+        self.batches = []
+        self.discarded = []
+
+    async def insert_task_rows(self, rows, project_id, workspace_id, creator_id):
+        self.batches.append([r["title"] for r in rows])
+        return [_Row(r) for r in rows]
+
+    async def discard_task_tree(self, task_id):
+        self.discarded.append(task_id)
+
+
+def _answer(tasks):
+    return "<<<JSON_BEGIN>>>" + json.dumps({"main_goal": "g", "tasks": tasks, "summary": "s"}, ensure_ascii=False) + "<<<JSON_END>>>"
+
+
+@pytest.mark.asyncio
+async def test_creator_inserts_tasks_progressively():
+    service = _RecordingTaskService()
+    creator = StreamingTaskCreator(service, "p", "w", "u")
+    text = _answer([{
+        "title": "根", "estimated_time": 2, "estimated_time_unit": "hour", "priority": "medium",
+        "subtasks": [{"title": "a", "subtasks": []}, {"title": "b", "subtasks": []}],
+    }])
+
+    created = []
+    for i in range(0, len(text), 8):
+        created += await creator.feed(text[i:i + 8])
+    assert await creator.finish()
+
+    assert [t["title"] for t in created] == ["根", "a", "b"]
+    # 每读完一个任务就写入一次，而不是最后一次性写入
+    assert len(service.batches) == 3
+    assert created[0]["estimated_minutes"] == 120
+    assert created[1]["parent_task_id"] == created[0]["id"] == creator.root_task_id
+    assert service.discarded == []
+
+
+@pytest.mark.asyncio
+async def test_creator_discards_partial_tree_on_invalid_answer():
+    service = _RecordingTaskService()
+    creator = StreamingTaskCreator(service, "p", "w", "u")
+    text = _answer([
+        {"title": "根1", "subtasks": [{"title": "a", "subtasks": []}]},
+        {"title": "根2", "subtasks": []},
+    ])
+    created = []
+    for i in range(0, len(text), 5):
+        created += await creator.feed(text[i:i + 5])
+
+    assert not await creator.finish()
+    # 已推送给客户端的任务ID需要通知撤销，且只取出一次
+    assert creator.take_discarded() == [t["id"] for t in created]
+    assert creator.take_discarded() == []
+    assert "ONE main task" in creator.error
+    assert service.batches == [["根1"], ["a"]]
+    assert len(service.discarded) == 1 and creator.created == []
+
+
+@pytest.mark.asyncio
+async def test_creator_falls_back_without_json_block():
+    service = _RecordingTaskService()
+    creator = StreamingTaskCreator(service, "p", "w", "u")
+    await creator.feed("需要先确认几个问题：")
+    assert not await creator.finish()
+    assert service.batches == [] and service.discarded == []
@@ -0,0 +1,85 @@
+import sys
+import os
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import pytest
+try:
+    from fastapi.testclient import TestClient
+except ImportError:
+    pytest.skip("fastapi not installed; skipping task route tests", allow_module_level=True)
+
+from core.app import create_app
+from core.database import get_db_manager
+from modules.databaseman import DatabaseManager
+
+
+ROOT_ROW = {
+    "id": "t-root", "project_id": "p1", "workspace_id": "w1", "creator_id": "u1",
+    "assignee_id": None, "parent_task_id": None, "title": "root", "description": None,
+    "status": "backlog", "priority": "medium", "estimated_minutes": 30, "due_at": None,
+    "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00",
+}
+
+
+class _HostConnection:
+    """记录查询落在哪个库上的假连接。"""
+    def __init__(self, host, log):
+        self.host = host
+        self.log = log
+
+    async def fetch(self, sql, *args):
+        self.log.append(self.host)
+        if "WITH RECURSIVE" in sql:
+            return [{**ROOT_ROW, "depth": 0}]
+        return [ROOT_ROW]
+
+
+class _HostPool:
+    def __init__(self, host, log):
+        self.host = host
+        self.log = log
+
+    async def acquire(self, timeout: float = 5.0):
+        return _HostConnection(self.host, self.log)
+
+    async def release(self, connection):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def replicated_db(monkeypatch):
+    log = []
+
+    async def fake_create_pool(*args, **kwargs):
+        return _HostPool(kwargs["host"], log)
+
+    monkeypatch.setattr('asyncpg.create_pool', fake_create_pool)
+    db = DatabaseManager(
+        db_url="primary", db_username="test", db_password="test", db_database_name="test",
+        db_port=5432, leak_threshold=0, replica_hosts=("replica",)
+    )
+    asyncio.run(db.init_pool())
+    return db, log
+
+
+def test_list_tasks_reads_from_replica(replicated_db):
+    """任务列表只读取数据，主任务与任务树都走只读副本。"""
+    db, log = replicated_db
+    app = create_app()
+    app.dependency_overrides[get_db_manager] = lambda: db
+    client = TestClient(app)
+
+    response = client.post(
+        "/tasks/list/",
+        json={"time": "2025-01-01T00:00:00", "token": None, "workspace_id": "w1", "project_id": "p1"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+    assert log == ["replica", "replica"]
+    assert db.get_active_connections_count() == 0
@@ -48,6 +48,7 @@ except ImportError:
 
     openai_mod = types.ModuleType("openai")
     openai_mod.OpenAI = _OpenAIStub
+    openai_mod.AsyncOpenAI = _OpenAIStub
     openai_types_mod = types.ModuleType("openai.types")
     openai_chat_mod = types.ModuleType("openai.types.chat")
     openai_chat_mod.ChatCompletion = object
@@ -87,7 +88,7 @@ except ImportError:
     sys.modules.setdefault("starlette.exceptions", starlette_exceptions_mod)
 
 from services.task_service import TaskService
-from modules.databaseman import DatabaseManager
+from modules.databaseman import DatabaseManager, QueryRegistry
 
 
 @pytest.fixture
@@ -186,6 +187,97 @@ async def test_task_get_tree(get_db):
     assert result != None
 
 
+def _tree_row(task_id: str, parent_id: Optional[str], depth: int) -> Dict[str, Any]:
+    return {
+        "id": task_id, "project_id": "p", "workspace_id": "w", "creator_id": "u",
+        "assignee_id": None, "parent_task_id": parent_id, "title": task_id, "description": "",
+        "status": "backlog", "priority": "medium", "estimated_minutes": 10, "actual_minutes": 0,
+        "due_at": None, "started_at": None, "completed_at": None, "is_recurring": False,
+        "recurrence_rule": None, "recurrence_frequency": "none", "recurrence_meta": None,
+        "metadata": None, "created_at": None, "updated_at": None, "deleted_at": None,
+        "depth": depth,
+    }
+
+
+@pytest.mark.asyncio
+async def test_task_get_tree_single_query():
+    from unittest.mock import AsyncMock
+
+    conn = AsyncMock()
+    conn.fetch.return_value = [
+        _tree_row("root", None, 0),
+        _tree_row("a", "root", 1),
+        _tree_row("b", "root", 1),
+        _tree_row("a1", "a", 2),
+    ]
+    db = AsyncMock()
+    db.queries = QueryRegistry()
+    db.get_connection.return_value = conn
+
+    svc = TaskService(db=db)
+    tree: Optional[TaskTree] = await svc.get_task_tree("root")
+
+    # 整棵树只需要一次查询
+    conn.fetch.assert_awaited_once()
+    db.release_connection.assert_awaited_once_with(conn)
+    assert tree is not None and tree.task.id == "root"
+    assert [t.task.id for t in tree.subtasks] == ["a", "b"]
+    assert [t.task.id for t in tree.subtasks[0].subtasks] == ["a1"]
+    assert tree.subtasks[1].subtasks == []
+
+
+@pytest.mark.asyncio
+async def test_task_get_tree_node_limit():
+    from unittest.mock import AsyncMock
+
+    conn = AsyncMock()
+    conn.fetch.return_value = [_tree_row("root", None, 0), _tree_row("a", "root", 1), _tree_row("b", "root", 1)]
+    db = AsyncMock()
+    db.queries = QueryRegistry()
+    db.get_connection.return_value = conn
+
+    svc = TaskService(db=db)
+    with pytest.raises(ValueError):
+        await svc.get_task_tree("root", max_nodes=2)
+
+
+@pytest.mark.asyncio
+async def test_create_task_by_json_bulk_single_statement():
+    from unittest.mock import AsyncMock, MagicMock
+
+    async def fake_fetch(query, project_id, workspace_id, creator_id, ids, parents, titles, descs, prios, minutes):
+        # 倒序返回，模拟RETURNING顺序不确定的情况
+        rows = []
+        for i in range(len(ids)):
+            row = _tree_row(ids[i], parents[i], 0)
+            row.update(title=titles[i], priority=prios[i], estimated_minutes=minutes[i])
+            row.pop("depth")
+            rows.append(row)
+        return list(reversed(rows))
+
+    conn = MagicMock()
+    conn.fetch = AsyncMock(side_effect=fake_fetch)
+    db = AsyncMock()
+    db.queries = QueryRegistry()
+    db.get_connection.return_value = conn
+
+    svc = TaskService(db=db)
+    main = svc.parse_task_info({
+        "title": "主任务", "estimated_time": 2, "estimated_time_unit": "hour", "subtasks": [
+            {"title": "A", "estimated_time": 30, "subtasks": [{"title": "A1", "estimated_time": 5}]},
+            {"title": "B", "estimated_time": 1, "estimated_time_unit": "day"},
+        ]
+    })
+    tree: TaskTree = await svc._bulk_create_tasks(main, "p", "w", "u", conn)
+
+    conn.fetch.assert_awaited_once()
+    assert tree.task.title == "主任务" and tree.task.estimated_minutes == 120
+    assert [t.task.title for t in tree.subtasks] == ["A", "B"]
+    assert tree.subtasks[0].subtasks[0].task.title == "A1"
+    assert tree.subtasks[0].subtasks[0].task.parent_task_id == tree.subtasks[0].task.id
+    assert tree.subtasks[1].task.estimated_minutes == 60 * 24
+
+
 # async def test1():
 #     from core.config import load_config
 #     db = DatabaseManager(**load_config()["database"])